@@ -0,0 +1,222 @@
+import os
+import re
+import threading
+import time
+from typing import Optional
+import logging
+
+import numpy as np
+
+from api.cache import caches
+from api.reranker import get_embeddings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity between two queries for one to reuse the other's answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.9"))
+# Lifetime of an answer, and of an answer to a time-sensitive question ("price of bitcoin today")
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_TIME_SENSITIVE_TTL = float(os.getenv("ANSWER_CACHE_TIME_SENSITIVE_TTL", "600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "10000"))
+# When the cache is full, the least recently used entries are dropped until this share of
+# ANSWER_CACHE_SIZE is left (evicting in batches keeps the rebuilds of the vector arrays rare)
+ANSWER_CACHE_EVICT_TO = float(os.getenv("ANSWER_CACHE_EVICT_TO", "0.9"))
+# Partitions larger than this are searched with an HNSW index when hnswlib is installed
+ANSWER_CACHE_HNSW_MIN = int(os.getenv("ANSWER_CACHE_HNSW_MIN", "20000"))
+
+TIME_SENSITIVE_PATTERN = re.compile(
+    r"\b(today|tonight|now|current(ly)?|latest|live|breaking|news|this (week|month)|yesterday|tomorrow"
+    r"|price|prices|stock|stocks|rate|rates|score|scores|weather|forecast)\b",
+    re.IGNORECASE,
+)
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)?")
+
+# Set once importing hnswlib failed, so large partitions stay on brute force without retrying
+_hnsw_unavailable = False
+
+
+def is_time_sensitive(query: str) -> bool:
+    """Whether the answer to `query` is likely to change within hours."""
+    return TIME_SENSITIVE_PATTERN.search(query) is not None
+
+
+class _Partition:
+    """
+    Normalized query vectors of one (date, location, mode) partition with their answers.
+    Searched by brute force (one matrix-vector product), or with HNSW once large.
+    """
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((16, dim), dtype=np.float32)
+        self.entries = []
+        self._hnsw = None
+
+    def add(self, vector, entry) -> None:
+        if len(self.entries) == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+        self.vectors[len(self.entries)] = vector
+        self.entries.append(entry)
+        if self._hnsw is not None:
+            if self._hnsw.get_current_count() >= self._hnsw.get_max_elements():
+                self._hnsw.resize_index(self._hnsw.get_max_elements() * 2)
+            self._hnsw.add_items(vector[None, :], [len(self.entries) - 1])
+        elif len(self.entries) >= ANSWER_CACHE_HNSW_MIN:
+            self._build_hnsw()
+
+    def candidates(self, vector, count: int = 8):
+        """Yields (score, entry) of the nearest entries, best first."""
+        size = len(self.entries)
+        if size == 0:
+            return
+        if self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query(vector[None, :], k=min(count, size))
+            for label, distance in zip(labels[0], distances[0]):
+                # hnswlib's cosine space returns 1 - similarity
+                yield 1.0 - float(distance), self.entries[label]
+            return
+        scores = self.vectors[:size] @ vector
+        best = np.argsort(-scores)[:count] if size > count else np.argsort(-scores)
+        for index in best:
+            yield float(scores[index]), self.entries[index]
+
+    def prune(self, now: float, used_before: float = float("-inf")) -> None:
+        """
+        Drops expired entries and those last used before `used_before` (and rebuilds the
+        HNSW index if there is one).
+        """
+        keep = [index for index, entry in enumerate(self.entries)
+                if entry["expires_at"] > now and entry["used"] >= used_before]
+        if len(keep) == len(self.entries):
+            return
+        self.vectors = self.vectors[keep] if keep else np.empty((16, self.vectors.shape[1]), dtype=np.float32)
+        self.entries = [self.entries[index] for index in keep]
+        self._hnsw = None
+        if len(self.entries) >= ANSWER_CACHE_HNSW_MIN:
+            self._build_hnsw()
+
+    def _build_hnsw(self) -> None:
+        global _hnsw_unavailable
+        if _hnsw_unavailable:
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("hnswlib is not installed; searching the answer cache by brute force")
+            _hnsw_unavailable = True
+            return
+        size = len(self.entries)
+        index = hnswlib.Index(space="cosine", dim=self.vectors.shape[1])
+        index.init_index(max_elements=max(size * 2, 1024), ef_construction=200, M=16)
+        index.add_items(self.vectors[:size], np.arange(size))
+        index.set_ef(64)
+        self._hnsw = index
+
+
+class AnswerCache:
+    """
+    Cache of complete search responses (sources, answer chunks, follow-ups) keyed by the
+    embedding of the query. Lookups are restricted to the partition of the same date,
+    location and mode, and a cached answer is reused for any query whose embedding is
+    within ANSWER_CACHE_THRESHOLD cosine similarity and mentions the same numbers.
+    """
+
+    name = "answers"
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, maxsize: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._partitions = {}
+        self._size = 0
+        # Incremented on every store and hit; an entry's "used" stamp orders it for LRU eviction
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def partition_key(date_context: str, stored_location: str, pro_mode: bool) -> tuple:
+        # date_context is a YYYY-MM-DD date from the client; answers never cross days
+        return (date_context[:10], (stored_location or "").lower(), bool(pro_mode))
+
+    def embed(self, query: str):
+        """Returns the normalized embedding of `query`, or None when no model is available."""
+        embeddings = get_embeddings()
+        if embeddings is None:
+            return None
+        vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, vector, query: str, partition: tuple) -> Optional[dict]:
+        """
+        Returns the cached response of the most similar query in `partition`, or None.
+
+        :param vector: Normalized query embedding from `embed`.
+        :param query: The query, used to check that numbers match.
+        :param partition: Key from `partition_key`.
+        """
+        now = time.time()
+        numbers = NUMBER_PATTERN.findall(query)
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is not None:
+                for score, entry in entries.candidates(vector):
+                    if score < self.threshold:
+                        break
+                    # "top 5 ..." and "top 10 ..." embed almost identically but need different answers
+                    if entry["expires_at"] > now and entry["numbers"] == numbers:
+                        self.hits += 1
+                        self._clock += 1
+                        entry["used"] = self._clock
+                        logger.info(f"Answer cache hit: {query!r} ~ {entry['query']!r} ({score:.3f})")
+                        return entry["response"]
+            self.misses += 1
+        return None
+
+    def set(self, vector, query: str, partition: tuple, response: dict) -> None:
+        """
+        Stores the response of `query`. Time-sensitive questions expire after
+        ANSWER_CACHE_TIME_SENSITIVE_TTL instead of ANSWER_CACHE_TTL.
+        """
+        now = time.time()
+        ttl = ANSWER_CACHE_TIME_SENSITIVE_TTL if is_time_sensitive(query) else ANSWER_CACHE_TTL
+        entry = {"query": query, "numbers": NUMBER_PATTERN.findall(query),
+                 "expires_at": now + ttl, "response": response}
+        with self._lock:
+            if self._size >= self.maxsize:
+                self._evict(now)
+            self._clock += 1
+            entry["used"] = self._clock
+            entries = self._partitions.get(partition)
+            if entries is None:
+                entries = self._partitions[partition] = _Partition(len(vector))
+            entries.add(vector, entry)
+            self._size += 1
+
+    def _evict(self, now: float) -> None:
+        """
+        Drops expired entries; if the cache is still full, drops the least recently used
+        entries of all partitions until ANSWER_CACHE_EVICT_TO of it is left. Partitions
+        are removed once they are empty.
+        """
+        for entries in self._partitions.values():
+            entries.prune(now)
+        size = sum(len(entries.entries) for entries in self._partitions.values())
+        excess = size - int(self.maxsize * ANSWER_CACHE_EVICT_TO)
+        if size >= self.maxsize and excess > 0:
+            used = np.fromiter((entry["used"] for entries in self._partitions.values() for entry in entries.entries),
+                               dtype=np.int64, count=size)
+            # Stamps are unique, so exactly `excess` entries are older than the cutoff
+            cutoff = np.partition(used, excess)[excess] if excess < size else used.max() + 1
+            for entries in self._partitions.values():
+                entries.prune(now, used_before=cutoff)
+        for key in [key for key, entries in self._partitions.items() if not entries.entries]:
+            del self._partitions[key]
+        self._size = sum(len(entries.entries) for entries in self._partitions.values())
+
+    def stats(self) -> dict:
+        return {"name": self.name, "size": self._size, "hits": self.hits, "misses": self.misses}
+
+
+answer_cache = AnswerCache()
+caches.append(answer_cache)
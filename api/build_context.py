@@ -1,65 +1,86 @@
 import logging
-from api.semantic_chunking import get_chunking # Updated import for simplified chunking
+from api.context_packer import count_tokens, pack_context, token_budget_for
+from api.deduplication import deduplicate_tiers
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def build_context(sources_result, query, pro_mode, date_context):
+def build_context(sources_result, query, pro_mode, date_context, model=None, return_stats=False):
     """
-      Build context from search results. This function now uses simplified chunking
-      and removes external reranking API calls.
+      Build context from search results. Pieces are packed into the model's context token
+      budget by value: answer box, knowledge graph, snippets and top stories, then page
+      chunks, which are first reranked against the query with a local embedding model.
+      Near-duplicate pieces are removed before reranking.
 
       :param sources_result: Dictionary containing search results (organic, graph, answerBox, topStories).
       :param query: Search query string.
       :param pro_mode: Boolean indicating whether to use pro mode (can influence initial search results count).
       :param date_context: Date context string.
+      :param model: Answer model; selects the tokenizer and token budget.
+      :param return_stats: If True, return a (context, stats) tuple where stats reports the
+                           tokens and pieces used and dropped, and the near-duplicates removed.
       :return: Built context as a single string, combining snippets, HTML content chunks, and other relevant info.
       """
     try:
-        combined_list = []
-
         organic_results = sources_result.get('organic', [])
         graph = sources_result.get('graph')
         answer_box = sources_result.get('answerBox')
 
+        # Answers from 'answerBox' and the 'graph' (Knowledge Graph) description are short and high-value
+        answer_list = []
+        if answer_box is not None:
+            for key in ['answer', 'snippet']:
+                if key in answer_box:
+                    answer_list.append(answer_box[key])
+
+        graph_list = []
+        if graph is not None:
+            graph_desc = graph.get('description')
+            if graph_desc:
+                graph_list.append(graph_desc)
+
         # Extract snippets from organic search results
         snippets = [
             f"{item['snippet']} {item.get('date', '')}"
             for item in organic_results if 'snippet' in item  # Ensure there's always a snippet
         ]
-        combined_list.extend(snippets)
-
-        # Extract and chunk HTML content from scraped websites
-        # Only process if HTML content is available and sufficiently long
-        html_text = " ".join(item['html'] for item in organic_results if 'html' in item)
-        if html_text is not None and len(html_text) > 200:
-            combined_list.extend(get_chunking(html_text))
 
         # Extract titles from top stories
         if sources_result.get('topStories') is not None:
             top_stories_titles = [item['title'] for item in sources_result.get('topStories') if 'title' in item]
-            combined_list.extend(top_stories_titles)
+            snippets.extend(top_stories_titles)
 
-        # Add descriptions and answers from 'graph' (Knowledge Graph) and 'answerBox'
-        if graph is not None:
-            graph_desc = graph.get('description')
-            if graph_desc:
-                combined_list.append(graph_desc)
+        # Extract and chunk HTML content from scraped websites
+        # Only process if HTML content is available and sufficiently long
+        chunks = []
+        html_text = " ".join(item['html'] for item in organic_results if 'html' in item)
+        if html_text is not None and len(html_text) > 200:
+            # Only pro-mode requests have page content, so the splitter is imported on demand
+            from api.semantic_chunking import get_chunking
+            chunks = get_chunking(html_text)
 
-        if answer_box is not None:
-            for key in ['answer', 'snippet']:
-                if key in answer_box:
-                    combined_list.append(answer_box[key])
+        # Drop near-duplicates (syndicated copies, snippets repeated in page text) before
+        # spending reranking and tokens on them; the first occurrence is kept
+        (answer_list, graph_list, snippets, chunks), dedup_stats = deduplicate_tiers(
+            [answer_list, graph_list, snippets, chunks]
+        )
 
-        # Reranking has been removed to simplify local setup.
-        # The 'pro_mode' flag can still be used in `sources_searcher` to fetch more initial results.
-        final_list = combined_list
+        # Order chunks by relevance so the ones that fit next to the higher-value pieces are the best
+        token_budget = token_budget_for(model)
+        if chunks:
+            from api.reranker import rerank
+            higher_value_tokens = sum(count_tokens(answer_list + graph_list + snippets, model))
+            chunks = rerank(query, chunks, token_budget - higher_value_tokens, count_tokens(chunks, model))
 
-        # Join all collected context pieces into a single string
-        search_contexts = "\n\n".join(final_list)
-        return search_contexts
+        search_contexts, stats = pack_context([answer_list, graph_list, snippets, chunks], token_budget, model)
+        stats.update(dedup_stats)
+        logger.info(f"Context packed: {stats['tokens_used']}/{stats['budget']} tokens used"
+                    f"{' (estimated)' if stats['estimated'] else ''}, "
+                    f"{stats['tokens_dropped']} tokens dropped, "
+                    f"{stats['dedup_chars_saved']} characters of near-duplicates removed")
+        return (search_contexts, stats) if return_stats else search_contexts
     except Exception as e:
         logger.exception(f"An error occurred while building context: {e}")
-        return ""
+        return ("", {}) if return_stats else ""
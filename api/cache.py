@@ -0,0 +1,167 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+import logging
+
+import orjson as json
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# "memory" keeps a per-process cache; "sqlite" stores entries in CACHE_SQLITE_PATH so that
+# every worker on the host shares them (a stand-in for a networked cache).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "/tmp/open_perplex_cache.sqlite3")
+
+# Every cache created by make_cache, so their hit rates can be exported
+caches = []
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after `ttl` seconds.
+    Values are stored serialized, so callers always get a private copy they can mutate.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        payload = json.dumps(value)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+    """
+    Cache with the same interface as `TTLCache`, stored in a SQLite table so that it is
+    shared between worker processes and survives restarts. Least recently used entries
+    are evicted once the table holds more than `maxsize` rows.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, path: str = CACHE_SQLITE_PATH):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._table = f"cache_{name}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Serve reads from a memory-mapped view of the database file
+        self._conn.execute("PRAGMA mmap_size=67108864")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._table}_accessed ON {self._table} (accessed_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self._table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self._table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            self._conn.execute(
+                f"DELETE FROM {self._table} WHERE key IN "
+                f"(SELECT key FROM {self._table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+
+    # Queries (and the LRU delete on every write) are disk I/O, so async callers run them in a thread
+    async def aget(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+        return {"name": self.name, "size": size, "hits": self.hits, "misses": self.misses}
+
+
+def make_cache(name: str, maxsize: int, ttl: float, backend: Optional[str] = None):
+    """
+    Creates a cache for the given backend (CACHE_BACKEND by default). Falls back to the
+    in-memory cache if the SQLite store cannot be opened.
+
+    :param name: Cache name (also the SQLite table suffix).
+    :param maxsize: Maximum number of entries.
+    :param ttl: Default time-to-live of an entry, in seconds.
+    :param backend: "memory" or "sqlite"; overrides CACHE_BACKEND.
+    :return: A TTLCache or SQLiteCache instance.
+    """
+    cache = None
+    if (backend or CACHE_BACKEND).lower() == "sqlite":
+        try:
+            cache = SQLiteCache(name, maxsize, ttl)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open SQLite cache at {CACHE_SQLITE_PATH}, using memory cache: {e}")
+    if cache is None:
+        cache = TTLCache(name, maxsize, ttl)
+    caches.append(cache)
+    return cache
@@ -0,0 +1,182 @@
+import base64
+import os
+import threading
+import logging
+from typing import Optional
+
+import orjson as json
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Input-token budget of the search context, per answer model. CONTEXT_TOKEN_BUDGET overrides it.
+MODEL_CONTEXT_BUDGETS = {
+    "openai/gpt-oss-20b": 6000,
+    "openai/gpt-oss-120b": 6000,
+    "llama-3.1-8b-instant": 4000,
+    "llama3-8b-8192": 4000,
+}
+DEFAULT_CONTEXT_BUDGET = 4000
+# tiktoken encoding closest to each model's tokenizer
+MODEL_ENCODINGS = {
+    "openai/gpt-oss-20b": "o200k_base",
+    "openai/gpt-oss-120b": "o200k_base",
+}
+DEFAULT_ENCODING = "cl100k_base"
+# Vocabularies of the encodings above. tiktoken downloads them on first use, which on a
+# cold serverless instance is a hidden round trip (and fails offline), so they are bundled
+# with the app: `python -m api.context_packer` saves them to TOKENIZER_DIR at build time
+TOKENIZER_DIR = os.getenv("TOKENIZER_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizers"))
+# Let tiktoken download a vocabulary that is not bundled while serving a request
+TIKTOKEN_DOWNLOAD = os.getenv("TIKTOKEN_DOWNLOAD", "0") == "1"
+# Tokens taken by the "\n\n" separator between two pieces
+SEPARATOR_TOKENS = 1
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def token_budget_for(model: Optional[str]) -> int:
+    """
+    Returns the context token budget for `model`.
+    """
+    override = os.getenv("CONTEXT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+def vocabulary_paths(name: str, directory: str = TOKENIZER_DIR) -> tuple[str, str]:
+    """
+    Returns the paths of the bundled vocabulary of encoding `name` (in tiktoken's format)
+    and of its split pattern and special tokens.
+    """
+    return os.path.join(directory, f"{name}.tiktoken"), os.path.join(directory, f"{name}.json")
+
+
+def load_bundled_encoding(name: str, directory: str = TOKENIZER_DIR):
+    """
+    Builds the tiktoken encoding `name` from the files saved by `bundle_encoding`, without
+    going through tiktoken's download cache. Returns None if it is not bundled.
+    """
+    vocabulary, parameters = vocabulary_paths(name, directory)
+    if not (os.path.exists(vocabulary) and os.path.exists(parameters)):
+        return None
+    import tiktoken
+
+    with open(parameters, "rb") as file:
+        encoding = json.loads(file.read())
+    ranks = {}
+    with open(vocabulary, "rb") as file:
+        for line in file:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    return tiktoken.Encoding(name, pat_str=encoding["pat_str"], mergeable_ranks=ranks,
+                             special_tokens=encoding["special_tokens"])
+
+
+def bundle_encoding(name: str, directory: str = TOKENIZER_DIR) -> str:
+    """
+    Downloads the encoding `name` with tiktoken and saves it to `directory` for
+    `load_bundled_encoding`. Returns the path of the vocabulary file.
+    """
+    from tiktoken_ext.openai_public import ENCODING_CONSTRUCTORS
+
+    encoding = ENCODING_CONSTRUCTORS[name]()
+    vocabulary, parameters = vocabulary_paths(name, directory)
+    os.makedirs(directory, exist_ok=True)
+    with open(vocabulary, "wb") as file:
+        for token, rank in sorted(encoding["mergeable_ranks"].items(), key=lambda item: item[1]):
+            file.write(base64.b64encode(token) + b" %d\n" % rank)
+    with open(parameters, "wb") as file:
+        file.write(json.dumps({"pat_str": encoding["pat_str"], "special_tokens": encoding["special_tokens"]}))
+    return vocabulary
+
+
+def get_encoding(model: Optional[str]):
+    """
+    Returns the tiktoken encoding for `model`, loading it on first use, or None when
+    tiktoken or its vocabulary is unavailable. The vocabulary is only downloaded if
+    TIKTOKEN_DOWNLOAD is set; otherwise it must be bundled in TOKENIZER_DIR.
+    """
+    name = MODEL_ENCODINGS.get(model, DEFAULT_ENCODING)
+    if name not in _encodings:
+        with _encodings_lock:
+            if name not in _encodings:
+                _encodings[name] = None
+                try:
+                    _encodings[name] = load_bundled_encoding(name)
+                    if _encodings[name] is None and TIKTOKEN_DOWNLOAD:
+                        import tiktoken
+
+                        _encodings[name] = tiktoken.get_encoding(name)
+                    elif _encodings[name] is None:
+                        logger.warning(f"Tokenizer vocabulary {name} is not bundled in {TOKENIZER_DIR} "
+                                       f"(run `python -m api.context_packer` at build time)")
+                except Exception as e:
+                    logger.error(f"Could not load tokenizer {name}: {e}")
+                if _encodings[name] is None:
+                    logger.warning(f"Token counts for {model or 'the answer model'} are ESTIMATED at four characters "
+                                   f"per token; context budgets are approximate")
+    return _encodings[name]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def count_tokens(pieces: list[str], model: Optional[str] = None) -> list[int]:
+    """
+    Counts the tokens of each piece with the model's tokenizer, in one batch.
+
+    :param pieces: Texts to count.
+    :param model: Answer model whose tokenizer should be used.
+    :return: Token counts, in the same order as `pieces`.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return [estimate_tokens(piece) for piece in pieces]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(pieces)]
+
+
+def pack_context(tiers: list[list[str]], token_budget: int, model: Optional[str] = None) -> tuple[str, dict]:
+    """
+    Packs context pieces into the token budget. Tiers are taken in order of value and
+    pieces within a tier in the order given; a piece that does not fit is dropped and
+    smaller pieces after it may still be packed.
+
+    :param tiers: Lists of pieces, highest-value tier first.
+    :param token_budget: Maximum number of tokens of the packed context.
+    :param model: Answer model whose tokenizer should be used.
+    :return: The packed context and a stats dictionary with tokens and pieces used and dropped.
+    """
+    pieces = [piece for tier in tiers for piece in tier if piece]
+    counts = count_tokens(pieces, model)
+
+    packed = []
+    used = dropped = 0
+    for piece, tokens in zip(pieces, counts):
+        cost = tokens + (SEPARATOR_TOKENS if packed else 0)
+        if used + cost <= token_budget:
+            packed.append(piece)
+            used += cost
+        else:
+            dropped += tokens
+
+    stats = {
+        "budget": token_budget,
+        "estimated": get_encoding(model) is None,
+        "tokens_used": used,
+        "tokens_dropped": dropped,
+        "pieces_used": len(packed),
+        "pieces_dropped": len(pieces) - len(packed),
+    }
+    return "\n\n".join(packed), stats
+
+
+if __name__ == "__main__":
+    # Build step: save the vocabularies of all configured encodings to TOKENIZER_DIR
+    for encoding_name in sorted(set(MODEL_ENCODINGS.values()) | {DEFAULT_ENCODING}):
+        print(f"{encoding_name}: {bundle_encoding(encoding_name)}")
@@ -0,0 +1,134 @@
+import os
+import re
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Two pieces whose word shingles have at least this Jaccard similarity are near-duplicates.
+# With 3-word shingles, one word changed in an 80-word chunk leaves a similarity of about
+# 0.93, four changed words about 0.73, one changed word in a 30-word snippet about 0.81;
+# unrelated texts are close to 0.
+DEDUP_MIN_JACCARD = float(os.getenv("DEDUP_MIN_JACCARD", "0.7"))
+# Words per shingle
+SHINGLE_SIZE = 3
+# MinHash signature length, split into bands of MINHASH_BAND_ROWS values for candidate
+# lookup: pieces at the threshold share at least one band with probability > 0.999
+MINHASH_PERMUTATIONS = 128
+MINHASH_BAND_ROWS = 4
+
+WORD_PATTERN = re.compile(r"\w+")
+# Odd multipliers used to combine the word hashes of a shingle (golden-ratio based)
+_SHINGLE_MULTIPLIERS = np.array(
+    [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64
+)
+
+
+def _mix(values):
+    """splitmix64 finalizer: spreads the bits of each 64-bit value (vectorized)."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+# MinHash permutations of the (mixed) shingle hashes: x * a + b modulo 2**64, with odd a
+_PERMUTATION_A = _mix(np.arange(1, MINHASH_PERMUTATIONS + 1, dtype=np.uint64)) | np.uint64(1)
+_PERMUTATION_B = _mix(np.arange(MINHASH_PERMUTATIONS + 1, 2 * MINHASH_PERMUTATIONS + 1, dtype=np.uint64))
+
+
+def minhash_signatures(pieces: list[str]) -> list:
+    """
+    Computes a MinHash signature of every piece over its word shingles: for each of
+    MINHASH_PERMUTATIONS hash permutations, the minimum over the piece's shingles. The
+    share of positions where two signatures agree estimates the Jaccard similarity of the
+    shingle sets. The shingle hashes of all pieces are permuted in one array, so the cost
+    is linear in the total number of words.
+
+    :param pieces: Texts to fingerprint.
+    :return: One uint64 array per piece (None for pieces shorter than a shingle).
+    """
+    shingle_hashes = []
+    offsets = []
+    for piece in pieces:
+        words = WORD_PATTERN.findall(piece.lower())
+        # Word hashes only need to be consistent within this process
+        hashes = np.array([hash(word) for word in words], dtype=np.int64).view(np.uint64)
+        # Pieces shorter than a shingle get no signature and are only matched exactly
+        count = max(len(hashes) - SHINGLE_SIZE + 1, 0)
+        shingles = hashes[:count] * _SHINGLE_MULTIPLIERS[0]
+        for position in range(1, SHINGLE_SIZE):
+            shingles ^= hashes[position:position + count] * _SHINGLE_MULTIPLIERS[position]
+        offsets.append(count)
+        shingle_hashes.append(shingles)
+
+    signatures = [None] * len(pieces)
+    if not pieces:
+        return signatures
+    all_hashes = np.concatenate(shingle_hashes)
+    if all_hashes.size == 0:
+        return signatures
+
+    permuted = np.empty((all_hashes.size, MINHASH_PERMUTATIONS), dtype=np.uint64)
+    np.multiply(_mix(all_hashes)[:, None], _PERMUTATION_A, out=permuted)
+    permuted += _PERMUTATION_B
+    counts = np.array(offsets)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    non_empty = counts > 0
+    minima = np.minimum.reduceat(permuted, starts[non_empty], axis=0)
+    for index, signature in zip(np.flatnonzero(non_empty), minima):
+        signatures[index] = signature
+    return signatures
+
+
+def deduplicate_tiers(tiers: list[list[str]], min_jaccard: float = DEDUP_MIN_JACCARD) -> tuple[list[list[str]], dict]:
+    """
+    Drops near-duplicate pieces, keeping the first occurrence (tiers are in priority order).
+    Candidate pairs are found by splitting MinHash signatures into bands of
+    MINHASH_BAND_ROWS values: only pieces that share a band exactly are compared, and a
+    candidate is a duplicate when the signatures estimate a Jaccard similarity of at least
+    `min_jaccard`.
+
+    :param tiers: Lists of context pieces, highest-value tier first.
+    :param min_jaccard: Minimum shingle Jaccard similarity of near-duplicate pieces.
+    :return: The deduplicated tiers and stats with the number of pieces and characters dropped.
+    """
+    pieces = [piece for tier in tiers for piece in tier]
+    signatures = minhash_signatures(pieces)
+
+    bands = MINHASH_PERMUTATIONS // MINHASH_BAND_ROWS
+    buckets = [{} for _ in range(bands)]
+    kept_signatures = []
+    seen_exact = set()
+
+    result = []
+    dropped = chars_saved = 0
+    index = 0
+    for tier in tiers:
+        kept = []
+        for piece in tier:
+            signature = signatures[index]
+            index += 1
+            normalized = " ".join(piece.split()).lower()
+            duplicate = normalized in seen_exact
+            if signature is not None:
+                keys = [signature[band * MINHASH_BAND_ROWS:(band + 1) * MINHASH_BAND_ROWS].tobytes()
+                        for band in range(bands)]
+                if not duplicate:
+                    candidates = {other for band, key in enumerate(keys) for other in buckets[band].get(key, ())}
+                    duplicate = any(np.count_nonzero(signature == kept_signatures[other]) >=
+                                    min_jaccard * MINHASH_PERMUTATIONS for other in candidates)
+            if duplicate:
+                dropped += 1
+                chars_saved += len(piece)
+                continue
+            seen_exact.add(normalized)
+            if signature is not None:
+                for band, key in enumerate(keys):
+                    buckets[band].setdefault(key, []).append(len(kept_signatures))
+                kept_signatures.append(signature)
+            kept.append(piece)
+        result.append(kept)
+
+    return result, {"duplicates_dropped": dropped, "dedup_chars_saved": chars_saved}
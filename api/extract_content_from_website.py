@@ -1,13 +1,140 @@
-from langchain_community.document_loaders import WebBaseLoader
+import asyncio
+import codecs
+import os
+import time
+from html.parser import HTMLParser
 import logging
+from api.http_client import get_async_client, get_sync_client
+from api.cache import make_cache
+from api.metrics import SCRAPE_FAILURES
+from api.stream_coalescer import in_flight, single_flight
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+MAX_CONTENT_CHARS = 4000
+MIN_CONTENT_CHARS = 200
+# Stop downloading a page after this many bytes, whether or not enough text was found
+MAX_CONTENT_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(256 * 1024)))
+# The async scraper parses in a worker thread, handing it this many characters at a time
+PARSE_BATCH_CHARS = int(os.getenv("SCRAPE_PARSE_BATCH_CHARS", str(32 * 1024)))
+
+# Elements whose content is boilerplate or not text at all
+SKIPPED_TAGS = {
+    "script", "style", "noscript", "template", "svg", "iframe",
+    "nav", "footer", "aside",
+}
+# A <header> is the site banner at page level, but holds the headline inside these
+CONTENT_TAGS = {"main", "article", "section"}
+# Elements that separate words visually; a space is emitted around them
+BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "tr", "td", "th", "table", "section", "article",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "dd", "dt", "title",
+}
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+# Extracted pages are cached by URL together with their ETag / Last-Modified validators.
+# Entries younger than PAGE_CACHE_FRESH_TTL are served as-is; older ones are revalidated with
+# a conditional GET, and entries are dropped after PAGE_CACHE_MAX_AGE or by LRU eviction.
+# Each entry holds at most MAX_CONTENT_CHARS of text, so PAGE_CACHE_SIZE also caps the store size.
+PAGE_CACHE_FRESH_TTL = float(os.getenv("PAGE_CACHE_FRESH_TTL", "600"))
+PAGE_CACHE_MAX_AGE = float(os.getenv("PAGE_CACHE_MAX_AGE", "86400"))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "5000"))
+page_cache = make_cache("pages", PAGE_CACHE_SIZE, PAGE_CACHE_MAX_AGE, backend=os.getenv("PAGE_CACHE_BACKEND", "sqlite"))
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Incremental HTML-to-text converter. Text inside boilerplate elements (and page-level
+    headers) is dropped, whitespace is collapsed, and `done` is set once `limit`
+    characters were collected so the caller can stop feeding (and downloading) the document.
+    """
+
+    def __init__(self, limit=MAX_CONTENT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.parts = []
+        self.length = 0
+        self.skip_depth = 0
+        self.content_depth = 0
+        # Whether each open <header> is skipped, innermost last
+        self.headers = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "header":
+            skipped = not self.content_depth
+            self.headers.append(skipped)
+            self.skip_depth += skipped
+            self._separate()
+            return
+        if tag in CONTENT_TAGS:
+            self.content_depth += 1
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._separate()
+
+    def handle_endtag(self, tag):
+        if tag == "header":
+            if self.headers and self.headers.pop() and self.skip_depth:
+                self.skip_depth -= 1
+            self._separate()
+            return
+        if tag in CONTENT_TAGS and self.content_depth:
+            self.content_depth -= 1
+        if tag in SKIPPED_TAGS:
+            if self.skip_depth:
+                self.skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self._separate()
+
+    def handle_data(self, data):
+        if self.skip_depth or self.done:
+            return
+        text = " ".join(data.split())
+        if not text:
+            return
+        if self.parts and self.parts[-1] != " " and data[:1].isspace():
+            self._separate()
+        self.parts.append(text)
+        self.length += len(text)
+        if data[-1:].isspace():
+            self._separate()
+        if self.length >= self.limit:
+            self.done = True
+
+    def _separate(self):
+        if self.parts and self.parts[-1] != " ":
+            self.parts.append(" ")
+            self.length += 1
+
+    def text(self):
+        return "".join(self.parts).strip()[:self.limit]
+
+
+def html_to_text(html, limit=MAX_CONTENT_CHARS):
+    """
+    Converts an HTML document into flattened text without boilerplate.
+
+    Args:
+    html (str): The raw HTML document.
+    limit (int): Stop once this many characters of text were collected.
+
+    Returns:
+    str: The page text, whitespace collapsed.
+    """
+    parser = _TextExtractor(limit)
+    parser.feed(html)
+    return parser.text()
+
+
 def extract_website_content(url):
     """
-    Extracts and cleans the main content from a given website URL using WebBaseLoader.
-    This is an external dependency but essential for web scraping.
+    Extracts and cleans the main content from a given website URL. The body is streamed
+    and parsed incrementally; the download stops as soon as 4000 characters of text were
+    found or MAX_CONTENT_BYTES were read. Results go through the page cache, and stale
+    entries are revalidated with a conditional GET.
 
     Args:
     url (str): The URL of the website from which to extract content.
@@ -17,23 +144,198 @@ def extract_website_content(url):
          (more than 200 characters), otherwise an empty string.
     """
     try:
-        clean_text_parts = []
-        loader = WebBaseLoader(url)
-        data = loader.load() # Load documents from the URL
+        cached = page_cache.get(url)
+        if cached is not None and time.time() - cached["fetched_at"] < PAGE_CACHE_FRESH_TTL:
+            return cached["text"]
+
+        parser = _TextExtractor()
+        with get_sync_client().stream("GET", url, headers=conditional_headers(cached)) as response:
+            if response.status_code == 304 and cached is not None:
+                return store_page(url, response, cached["text"], cached)
+            response.raise_for_status()
+            if not is_text_response(response):
+                return store_page(url, response, "")
+            decoder = incremental_decoder(response)
+            received = 0
+            for chunk in response.iter_bytes():
+                parser.feed(decoder.decode(chunk))
+                received += len(chunk)
+                if parser.done or received >= MAX_CONTENT_BYTES:
+                    break
+
+        return store_page(url, response, truncate_content(parser.text()))
 
-        # Aggregate content from all loaded documents
-        for doc in data:
-            if doc.page_content:  # Check if page_content is not None or empty
-                # Replace newlines to flatten the text and append to parts list
-                clean_text_parts.append(doc.page_content.replace("\n", " "))
+    except Exception as error:
+        logger.error(f'Error extracting main content from {url}: {error}')
+        SCRAPE_FAILURES.inc(reason="error")
+        return ""
 
-        # Join all parts into a single string after processing
-        clean_text = " ".join(clean_text_parts)
 
-        # Return up to the first 4000 characters if the content is sufficiently long
-        # This prevents feeding excessively long content to the LLM
-        return clean_text[:4000] if len(clean_text) > 200 else ""
+async def aextract_website_content(url):
+    """
+    Async counterpart of `extract_website_content`, using the shared async HTTP client
+    and the same page cache. Concurrent requests for the same URL (e.g. from searches
+    with overlapping results) share a single download.
+
+    Args:
+    url (str): The URL of the website from which to extract content.
+
+    Returns:
+    str: The first 4000 characters of the cleaned main content if it is sufficiently long
+         (more than 200 characters), otherwise an empty string.
+    """
+    text, _ = await single_flight(f"page\x1f{url}", lambda: _aextract_website_content(url))
+    return text
+
+
+async def afetch_page(url, timeout):
+    """
+    Like `aextract_website_content`, with a deadline, and telling whether this call
+    downloaded the page: the scrape scheduler learns domain latency and success only
+    from real downloads, not from page cache hits or downloads started by another caller.
+
+    Args:
+    url (str): The URL of the website from which to extract content.
+    timeout (float): Seconds to wait for the page.
+
+    Returns:
+    tuple: The page text (None if it took longer than `timeout`) and whether this call
+           downloaded the page itself.
+    """
+    key = f"page\x1f{url}"
+    joined = None
+
+    async def fetch():
+        nonlocal joined
+        # Checked in the same step that starts or joins the download
+        joined = in_flight(key)
+        return await single_flight(key, lambda: _aextract_website_content(url))
+
+    try:
+        text, fetched = await asyncio.wait_for(fetch(), timeout)
+    except asyncio.TimeoutError:
+        return None, joined is False
+    return text, fetched and not joined
+
+
+async def _aextract_website_content(url):
+    """
+    Downloads and extracts `url` (see `aextract_website_content`). Returns the text and
+    whether it was downloaded (False for a fresh page cache hit).
+    """
+    try:
+        cached = await page_cache.aget(url)
+        if cached is not None and time.time() - cached["fetched_at"] < PAGE_CACHE_FRESH_TTL:
+            return cached["text"], False
+
+        parser = _TextExtractor()
+        async with get_async_client().stream("GET", url, headers=conditional_headers(cached)) as response:
+            if response.status_code == 304 and cached is not None:
+                return await astore_page(url, response, cached["text"], cached), True
+            response.raise_for_status()
+            if not is_text_response(response):
+                return await astore_page(url, response, ""), True
+            decoder = incremental_decoder(response)
+            received = 0
+            pending = []
+            pending_chars = 0
+            # Parsing is CPU-bound, so it runs off the event loop; chunks are handed to the
+            # worker in batches, and the download still stops once enough text was found
+            async for chunk in response.aiter_bytes():
+                text = decoder.decode(chunk)
+                pending.append(text)
+                pending_chars += len(text)
+                received += len(chunk)
+                last = received >= MAX_CONTENT_BYTES
+                if pending_chars >= PARSE_BATCH_CHARS or last:
+                    await asyncio.to_thread(parser.feed, "".join(pending))
+                    pending.clear()
+                    pending_chars = 0
+                if parser.done or last:
+                    break
+            if pending:
+                await asyncio.to_thread(parser.feed, "".join(pending))
+
+        return await astore_page(url, response, truncate_content(parser.text())), True
 
     except Exception as error:
         logger.error(f'Error extracting main content from {url}: {error}')
-        return ""
\ No newline at end of file
+        SCRAPE_FAILURES.inc(reason="error")
+        return "", True
+
+
+def conditional_headers(cached):
+    """
+    Returns the revalidation headers for a cached page (none if nothing is cached).
+    """
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def store_page(url, response, text, cached=None):
+    """
+    Stores the extracted text of `url` with the validators of `response` and returns the text.
+    On a 304 revalidation, `cached` holds the previous entry whose validators are kept when
+    the server does not resend them.
+    """
+    page_cache.set(url, page_entry(response, text, cached))
+    return text
+
+
+async def astore_page(url, response, text, cached=None):
+    """
+    Async counterpart of `store_page`; the write runs off the event loop when the page
+    cache is on disk.
+    """
+    await page_cache.aset(url, page_entry(response, text, cached))
+    return text
+
+
+def page_entry(response, text, cached=None):
+    """
+    Returns the cache entry for the extracted `text`, with the validators of `response`
+    (or those of `cached` that the server did not resend).
+    """
+    previous = cached or {}
+    return {
+        "text": text,
+        "etag": response.headers.get("etag", previous.get("etag")),
+        "last_modified": response.headers.get("last-modified", previous.get("last_modified")),
+        "fetched_at": time.time(),
+    }
+
+
+def is_text_response(response):
+    """
+    Returns False for responses that cannot contain page text (PDFs, images, video…),
+    so they are dropped before their body is downloaded.
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type and content_type not in TEXT_CONTENT_TYPES:
+        logger.info(f"Skipping {response.url}: unsupported content type {content_type}")
+        return False
+    return True
+
+
+def incremental_decoder(response):
+    """
+    Returns a decoder for the response charset (UTF-8 when unknown) that can be fed
+    chunk by chunk without splitting multi-byte characters.
+    """
+    try:
+        return codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def truncate_content(clean_text):
+    """
+    Returns up to the first 4000 characters if the content is sufficiently long.
+    This prevents feeding excessively long content to the LLM.
+    """
+    return clean_text[:MAX_CONTENT_CHARS] if len(clean_text) > MIN_CONTENT_CHARS else ""
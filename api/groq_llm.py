@@ -1,252 +1,8 @@
-# import json
-# import os
-# import ollama # Import the ollama client
-# from langchain_core.prompts import PromptTemplate
-# from perplex.prompts import search_prompt_system, relevant_prompt_system
-
-# # Use ENV variables or set a default model for Ollama
-# # Ensure you have this model pulled locally (e.g., 'ollama pull llama3')
-# MODEL = os.getenv("OLLAMA_MODEL", "llama3.2") 
-
-# def get_answer(query, contexts, date_context):
-#     """
-#     Generates an answer using the Ollama local LLM, streaming the response.
-
-#     :param query: The user's question.
-#     :param contexts: Relevant contexts gathered from search results.
-#     :param date_context: Current date for contextualization.
-#     :return: A generator yielding chunks of the LLM's answer.
-#     """
-#     system_prompt_search = PromptTemplate(input_variables=["date_today"], template=search_prompt_system)
-
-#     messages = [
-#         {"role": "system", "content": system_prompt_search.format(date_today=date_context)},
-#         {"role": "user", "content": "User Question : " + query + "\n\n CONTEXTS :\n\n" + contexts}
-#     ]
-
-#     try:
-#         # Call Ollama chat API with streaming
-#         stream = ollama.chat(
-#             model=MODEL,
-#             messages=messages,
-#             stream=True,
-#         )
-
-#         for chunk in stream:
-#             # Extract content from the streamed chunk
-#             if chunk['message']['content'] is not None:
-#                 yield chunk['message']['content']
-
-#     except Exception as e:
-#         print(f"Error during get_answer_ollama call: {e}")
-#         # Yield an error message formatted as SSE data
-#         yield json.dumps(
-#             {'type': 'error', 'data': "We are currently experiencing some issues with Ollama. Please ensure it's running and the model is available."}) + "\n\n"
-
-
-# def get_relevant_questions(contexts, query):
-#     """
-#     Generates relevant follow-up questions using the Ollama local LLM.
-
-#     :param contexts: Relevant contexts.
-#     :param query: The original user query.
-#     :return: A JSON string containing an array of follow-up questions.
-#     """
-#     try:
-#         messages = [
-#             {"role": "system",
-#              "content": relevant_prompt_system
-#              },
-#             {"role": "user",
-#              "content": "User Query: " + query + "\n\n" + "Contexts: " + "\n" + contexts + "\n"}
-#         ]
-
-#         # Call Ollama chat API for a non-streaming JSON response
-#         response = ollama.chat(
-#             model=MODEL,
-#             messages=messages,
-#             format="json" # Request JSON format from Ollama
-#         )
-#         # Ollama returns the JSON string within the 'content' field of the message
-#         return response['message']['content']
-#     except Exception as e:
-#         print(f"Error during RELEVANT OLLAMA ***************: {e}")
-#         # Return an empty JSON array for follow-up questions on error
-#         return json.dumps({"followUp": []})
-
-# import json
-# import os
-# import logging
-# from langchain_core.prompts import PromptTemplate
-# from groq import Groq
-# from api.prompts import search_prompt_system, relevant_prompt_system
-# from dotenv import load_dotenv
-
-# load_dotenv()
-
-# # Configure logging
-# logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-# logger = logging.getLogger(__name__)
-
-# # Groq API Configuration
-# # Using llama3-8b-8192 which is one of the cheapest models on Groq
-# GROQ_MODEL = "llama3-8b-8192"  # Cheapest model available
-# GROQ_API_KEY = os.getenv("GROQ_API_KEY")  # Get from environment variable
-
-# # Initialize Groq client
-# try:
-#     if not GROQ_API_KEY:
-#         raise ValueError("GROQ_API_KEY environment variable is not set. Please set it in your .env file.")
-    
-#     client = Groq(api_key=GROQ_API_KEY)
-#     logger.info(f"Groq client initialized with model: {GROQ_MODEL}")
-# except Exception as e:
-#     logger.error(f"Failed to initialize Groq client: {e}")
-#     client = None
-
-# def get_answer(query, contexts, date_context):
-#     """
-#     Generates an answer using the Groq API, streaming the response.
-
-#     :param query: The user's question.
-#     :param contexts: Relevant contexts gathered from search results.
-#     :param date_context: Current date for contextualization.
-#     :return: A generator yielding chunks of the LLM's answer.
-#     """
-#     if client is None:
-#         # Fallback response when Groq client is not available
-#         logger.warning("Groq client not initialized, providing fallback response")
-#         fallback_response = f"Based on the available information about '{query}', here's what I found from the search results:\n\n{contexts[:500]}..."
-#         yield fallback_response
-#         return
-
-#     system_prompt_search = PromptTemplate(input_variables=["date_today"], template=search_prompt_system)
-
-#     messages = [
-#         {
-#             "role": "system", 
-#             "content": system_prompt_search.format(date_today=date_context)
-#         },
-#         {
-#             "role": "user", 
-#             "content": "User Question: " + query + "\n\nCONTEXTS:\n\n" + contexts
-#         }
-#     ]
-
-#     try:
-#         logger.info("Sending streaming request to Groq API for answer generation...")
-        
-#         # Call Groq chat API with streaming
-#         stream = client.chat.completions.create(
-#             model=GROQ_MODEL,
-#             messages=messages,
-#             stream=True,
-#             max_tokens=1024,
-#             temperature=0.7,
-#         )
-
-#         for chunk in stream:
-#             # Extract content from the streamed chunk
-#             if chunk.choices[0].delta.content is not None:
-#                 yield chunk.choices[0].delta.content
-
-#     except Exception as e:
-#         logger.exception(f"Error during Groq API call for answer: {e}")
-#         # Provide a fallback response with search context
-#         fallback_response = f"I encountered an issue processing your question about '{query}'. Based on the search results: {contexts[:300]}..."
-#         yield fallback_response
-
-
-# def get_relevant_questions(contexts, query):
-#     """
-#     Generates relevant follow-up questions using the Groq API.
-
-#     :param contexts: Relevant contexts.
-#     :param query: The original user query.
-#     :return: A JSON string containing an array of follow-up questions.
-#     """
-#     if client is None:
-#         # Provide some default relevant questions
-#         default_questions = [
-#             f"What are the latest developments regarding {query}?",
-#             f"How does {query} compare to similar topics?",
-#             f"What are the implications of {query}?"
-#         ]
-#         return json.dumps({"followUp": default_questions})
-
-#     messages = [
-#         {
-#             "role": "system",
-#             "content": relevant_prompt_system
-#         },
-#         {
-#             "role": "user",
-#             "content": "User Query: " + query + "\n\nContexts: " + contexts[:1000] + "\n"
-#         }
-#     ]
-
-#     try:
-#         logger.info("Sending request to Groq API for relevant questions...")
-        
-#         # Call Groq chat API for a non-streaming JSON response
-#         response = client.chat.completions.create(
-#             model=GROQ_MODEL,
-#             messages=messages,
-#             max_tokens=512,
-#             temperature=0.3,  # Lower temperature for more consistent JSON output
-#         )
-        
-#         generated_text = response.choices[0].message.content.strip()
-        
-#         if generated_text:
-#             try:
-#                 # Try to extract JSON from the response
-#                 if "{" in generated_text and "}" in generated_text:
-#                     json_start = generated_text.find("{")
-#                     json_end = generated_text.rfind("}") + 1
-#                     json_str = generated_text[json_start:json_end]
-                    
-#                     # Validate JSON
-#                     parsed_json = json.loads(json_str)
-#                     if "followUp" in parsed_json and isinstance(parsed_json["followUp"], list):
-#                         return json.dumps(parsed_json)
-                
-#                 # If no valid JSON found, create questions from the response
-#                 fallback_questions = [
-#                     f"Tell me more about {query}",
-#                     f"What are the recent updates on {query}?",
-#                     f"How significant is {query}?"
-#                 ]
-#                 return json.dumps({"followUp": fallback_questions})
-                
-#             except json.JSONDecodeError:
-#                 logger.warning(f"Groq API did not return valid JSON for relevant questions")
-#                 fallback_questions = [
-#                     f"What else should I know about {query}?",
-#                     f"Are there recent developments in {query}?",
-#                     f"What are the key aspects of {query}?"
-#                 ]
-#                 return json.dumps({"followUp": fallback_questions})
-#         else:
-#             logger.warning("No text generated for relevant questions.")
-#             return json.dumps({"followUp": []})
-
-#     except Exception as e:
-#         logger.exception(f"Error during Groq API call for relevant questions: {e}")
-#         # Return fallback questions
-#         fallback_questions = [
-#             f"What are the main points about {query}?",
-#             f"Can you provide more details on {query}?",
-#             f"What should I know about {query}?"
-#         ]
-#         return json.dumps({"followUp": fallback_questions})
-
 # api/groq_llm.py
 import os
 import json
 import logging
-from langchain_core.prompts import PromptTemplate
-from groq import Groq
+import threading
 from api.prompts import search_prompt_system, relevant_prompt_system # Assuming api.prompts is correct
 
 # ─── Logging setup ─────────────────────────────────────────────────────────────
@@ -260,7 +16,13 @@ logger = logging.getLogger(__name__)
 # On Vercel, environment variables are automatically injected.
 # For local development, ensure GROQ_API_KEY is set in your shell or .env (if using dotenv locally).
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "").strip()
-if not GROQ_API_KEY:
+# The key is only required when Groq is one of the answer or follow-up backends (see
+# api/llm_router.py; FOLLOW_UP_BACKENDS defaults to LLM_BACKENDS)
+_ANSWER_BACKENDS = os.getenv("LLM_BACKENDS", "groq")
+GROQ_REQUIRED = "groq" in [name.strip().lower()
+                           for names in (_ANSWER_BACKENDS, os.getenv("FOLLOW_UP_BACKENDS", _ANSWER_BACKENDS))
+                           for name in names.split(",")]
+if GROQ_REQUIRED and not GROQ_API_KEY:
     # This RuntimeError will prevent the Vercel function from starting if the key is missing.
     # On Vercel, this means you haven't set it in your project settings.
     raise RuntimeError(
@@ -269,33 +31,154 @@ if not GROQ_API_KEY:
     )
 
 # ─── Groq CLIENT INITIALIZATION ────────────────────────────────────────────────
-GROQ_MODEL = "openai/gpt-oss-20b"
-try:
-    client = Groq(api_key=GROQ_API_KEY)
-    logger.info(f"✅ Initialized Groq client with model: {GROQ_MODEL}")
-except Exception as e:
-    logger.exception(f"Failed to initialize Groq client: {e}")
-    client = None
+# The groq SDK is imported and the clients are built on first use, so that cold starts
+# (and requests that never reach the LLM) do not pay for them.
+GROQ_MODEL = os.getenv("GROQ_MODEL", "openai/gpt-oss-20b")
+# Follow-up questions use a cheaper, faster model than answers, in JSON mode and with a
+# small output budget: three short questions need well under 100 tokens
+GROQ_FOLLOW_UP_MODEL = os.getenv("GROQ_FOLLOW_UP_MODEL", "llama-3.1-8b-instant")
+FOLLOW_UP_MAX_TOKENS = int(os.getenv("FOLLOW_UP_MAX_TOKENS", "160"))
+# "json_object" (any model with JSON mode) or "json_schema" (strict schema; only models with structured outputs)
+FOLLOW_UP_RESPONSE_FORMAT = os.getenv("FOLLOW_UP_RESPONSE_FORMAT", "json_object")
+FOLLOW_UP_COUNT = 3
+FOLLOW_UP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "followUp": {"type": "array", "items": {"type": "string"}, "minItems": FOLLOW_UP_COUNT, "maxItems": FOLLOW_UP_COUNT},
+    },
+    "required": ["followUp"],
+    "additionalProperties": False,
+}
+# Streamed instead of an answer when the Groq call fails
+ANSWER_ERROR_MESSAGE = "I’m sorry, something went wrong generating the answer for '{query}'."
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get_groq_client(kind: str):
+    """
+    Return the shared Groq client of the given kind ("sync" or "async"), creating it on
+    first use. None is returned (and remembered) if it cannot be created.
+    """
+    if kind not in _clients:
+        with _clients_lock:
+            if kind not in _clients:
+                try:
+                    from groq import AsyncGroq, Groq
+                    from api.http_client import get_async_client, get_sync_client
+
+                    # Groq calls share the process-wide connection pool (keep-alive, HTTP/2)
+                    if kind == "async":
+                        _clients[kind] = AsyncGroq(api_key=GROQ_API_KEY, http_client=get_async_client())
+                    else:
+                        _clients[kind] = Groq(api_key=GROQ_API_KEY, http_client=get_sync_client())
+                    logger.info(f"✅ Initialized {kind} Groq client with model: {GROQ_MODEL}")
+                except Exception as e:
+                    logger.exception(f"Failed to initialize Groq client: {e}")
+                    _clients[kind] = None
+    return _clients[kind]
+
+
+def get_groq_client():
+    """Sync Groq client, kept for scripts."""
+    return _get_groq_client("sync")
+
+
+def get_async_groq_client():
+    """Async Groq client, used by the Groq backend of api/llm_router.py."""
+    return _get_groq_client("async")
+
+
+def build_answer_messages(query: str, contexts: str, date_context: str) -> list:
+    """
+    Build the chat messages used to generate an answer.
+    """
+    # The template only has the {date_today} variable, so plain str.format is enough
+    # (and avoids importing LangChain on the request path).
+    system_prompt = search_prompt_system.format(date_today=date_context)
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",    "content": f"User Question: {query}\n\nCONTEXTS:\n\n{contexts}"},
+    ]
+
+
+def build_relevant_messages(contexts: str, query: str) -> list:
+    """
+    Build the chat messages used to generate follow-up questions.
+    """
+    return [
+        {"role": "system", "content": relevant_prompt_system},
+        {"role": "user",    "content": f"User Query: {query}\n\nContexts: {contexts[:1000]}"},
+    ]
+
+
+def follow_up_response_format() -> dict:
+    """
+    The `response_format` of follow-up requests, as set by FOLLOW_UP_RESPONSE_FORMAT.
+    """
+    if FOLLOW_UP_RESPONSE_FORMAT == "json_schema":
+        return {"type": "json_schema",
+                "json_schema": {"name": "follow_ups", "schema": FOLLOW_UP_SCHEMA, "strict": True}}
+    return {"type": "json_object"}
+
+
+def default_follow_ups(query: str) -> str:
+    """
+    Return the JSON string of follow-ups used when the Groq client is unavailable.
+    """
+    return json.dumps({
+        "followUp": [
+            f"What else should I know about {query}?",
+            f"Recent updates on {query}?",
+            f"How significant is {query}?"
+        ]
+    })
+
+
+def parse_follow_ups(text: str, query: str) -> str:
+    """
+    Validate a JSON-mode model response against FOLLOW_UP_SCHEMA and return it as the
+    `{"followUp": […]}` JSON string, falling back to generic questions when it does not match.
+    """
+    try:
+        parsed = json.loads(text)
+        questions = parsed.get("followUp") if isinstance(parsed, dict) else None
+        if isinstance(questions, list):
+            questions = [question.strip() for question in questions if isinstance(question, str) and question.strip()]
+            if questions:
+                return json.dumps({"followUp": questions[:FOLLOW_UP_COUNT]})
+        logger.warning(f"Follow-up response does not match the schema: {text[:200]!r}")
+    except ValueError as e:
+        logger.warning(f"Follow-up response is not valid JSON ({e}): {text[:200]!r}")
+
+    return fallback_follow_ups(query)
+
+
+def fallback_follow_ups(query: str) -> str:
+    """
+    Return the JSON string of follow-ups used when the model response is unusable.
+    """
+    return json.dumps({
+        "followUp": [
+            f"What are the main points about {query}?",
+            f"Can you provide more details on {query}?",
+            f"What should I know about {query}?"
+        ]
+    })
 
 
 def get_answer(query: str, contexts: str, date_context: str):
     """
     Stream chunks of answer from Groq. Fallback to context if client is None.
     """
+    client = get_groq_client()
     if client is None:
         logger.warning("Groq client unavailable—sending fallback response")
         yield f"Based on '{query}': {contexts[:500]}..."
         return
 
-    system_prompt = PromptTemplate(
-        input_variables=["date_today"],
-        template=search_prompt_system
-    ).format(date_today=date_context)
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user",    "content": f"User Question: {query}\n\nCONTEXTS:\n\n{contexts}"},
-    ]
+    messages = build_answer_messages(query, contexts, date_context)
 
     try:
         logger.info("Streaming request to Groq API for answer generation…")
@@ -312,53 +195,31 @@ def get_answer(query: str, contexts: str, date_context: str):
                 yield delta
     except Exception as e:
         logger.exception(f"Error during Groq streaming call: {e}")
-        yield f"I’m sorry, something went wrong generating the answer for '{query}'."
+        yield ANSWER_ERROR_MESSAGE.format(query=query)
+
 
 def get_relevant_questions(contexts: str, query: str) -> str:
     """
     Return a JSON string with `{"followUp": […]}` of suggested follow-ups.
     """
+    client = get_groq_client()
     if client is None:
         logger.warning("Groq client unavailable—using default follow-ups")
-        return json.dumps({
-            "followUp": [
-                f"What else should I know about {query}?",
-                f"Recent updates on {query}?",
-                f"How significant is {query}?"
-            ]
-        })
-
-    messages = [
-        {"role": "system", "content": relevant_prompt_system},
-        {"role": "user",    "content": f"User Query: {query}\n\nContexts: {contexts[:1000]}"},
-    ]
+        return default_follow_ups(query)
+
+    messages = build_relevant_messages(contexts, query)
 
     try:
         logger.info("Requesting relevant questions from Groq API…")
         resp = client.chat.completions.create(
-            model=GROQ_MODEL,
+            model=GROQ_FOLLOW_UP_MODEL,
             messages=messages,
-            max_tokens=512,
+            max_tokens=FOLLOW_UP_MAX_TOKENS,
             temperature=0.3,
+            response_format=follow_up_response_format(),
         )
-        text = resp.choices[0].message.content.strip()
-
-        # extract JSON blob if present
-        if "{" in text and "}" in text:
-            start = text.find("{")
-            end    = text.rfind("}") + 1
-            candidate = text[start:end]
-            parsed = json.loads(candidate)
-            if isinstance(parsed.get("followUp"), list):
-                return json.dumps(parsed)
+        return parse_follow_ups(resp.choices[0].message.content.strip(), query)
     except Exception as e:
         logger.exception(f"Error fetching relevant questions: {e}")
 
-    # fallback questions
-    return json.dumps({
-        "followUp": [
-            f"What are the main points about {query}?",
-            f"Can you provide more details on {query}?",
-            f"What should I know about {query}?"
-        ]
-    })
+    return fallback_follow_ups(query)
@@ -0,0 +1,289 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import threading
+from contextlib import asynccontextmanager
+from importlib.util import find_spec
+from typing import Optional
+from urllib.parse import urlsplit
+from urllib.request import getproxies
+import logging
+
+import httpcore
+import httpx
+
+from api.cache import make_cache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# A browser-like user agent; some sites refuse requests from default client user agents.
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+# Connection pool shared by every outbound request of the worker (Serper, scraping, Groq)
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+)
+# Negotiate HTTP/2 with servers that support it (needs the h2 package, i.e. httpx[http2])
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1" and find_spec("h2") is not None
+# Seconds a resolved address is reused for new connections to the same host
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "300"))
+# Hosts whose addresses are kept (least recently used ones are forgotten)
+DNS_CACHE_SIZE = int(os.getenv("DNS_CACHE_SIZE", "2048"))
+# Concurrency limits for specific hosts, e.g. "google.serper.dev=50,api.groq.com=20"
+HOST_LIMITS = {
+    host.strip().lower(): int(limit)
+    for host, _, limit in (item.partition("=") for item in os.getenv("HTTP_HOST_LIMITS", "").split(","))
+    if host.strip() and limit.strip()
+}
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+_sync_client_lock = threading.Lock()
+# (host, limit) -> [semaphore, number of requests using it]
+_host_slots = {}
+
+
+class _DNSCache:
+    """
+    Resolved addresses per (host, port), reused for DNS_CACHE_TTL seconds. All addresses
+    are kept in getaddrinfo's order of preference; one that accepted a connection after
+    earlier ones failed is moved to the front.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        self._addresses = make_cache("dns", maxsize, ttl, backend="memory")
+
+    @staticmethod
+    def _key(host: str, port: int) -> str:
+        return f"{host}:{port}"
+
+    def get(self, host: str, port: int) -> Optional[list]:
+        return self._addresses.get(self._key(host, port))
+
+    def set(self, host: str, port: int, infos) -> list:
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._addresses.set(self._key(host, port), addresses)
+        return addresses
+
+    def prefer(self, host: str, port: int, addresses: list, address: str) -> None:
+        self._addresses.set(self._key(host, port), [address] + [other for other in addresses if other != address])
+
+    def forget(self, host: str, port: int) -> None:
+        self._addresses.delete(self._key(host, port))
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+_dns_cache = _DNSCache(DNS_CACHE_TTL, DNS_CACHE_SIZE)
+
+
+class _CachingAsyncBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend that connects to cached addresses instead of resolving the host for
+    every new connection. TLS still uses the original host name for SNI and certificate
+    checks, since httpcore passes it separately when starting TLS.
+    """
+
+    def __init__(self):
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if _is_ip(host):
+            return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        addresses = _dns_cache.get(host, port)
+        if addresses is None:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            except OSError as e:
+                # Surface resolution errors the way httpx reports other connection failures
+                raise httpcore.ConnectError(str(e)) from e
+            addresses = _dns_cache.set(host, port, infos)
+        # Try every address in turn, as a connection by host name would
+        for index, address in enumerate(addresses):
+            try:
+                stream = await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except Exception:
+                if index == len(addresses) - 1:
+                    # The host may have moved; resolve again next time
+                    _dns_cache.forget(host, port)
+                    raise
+                continue
+            if index:
+                _dns_cache.prefer(host, port, addresses, address)
+            return stream
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class _CachingSyncBackend(httpcore.NetworkBackend):
+    """Sync counterpart of `_CachingAsyncBackend`."""
+
+    def __init__(self):
+        self._backend = httpcore.SyncBackend()
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if _is_ip(host):
+            return self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        addresses = _dns_cache.get(host, port)
+        if addresses is None:
+            try:
+                infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            except OSError as e:
+                raise httpcore.ConnectError(str(e)) from e
+            addresses = _dns_cache.set(host, port, infos)
+        for index, address in enumerate(addresses):
+            try:
+                stream = self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except Exception:
+                if index == len(addresses) - 1:
+                    _dns_cache.forget(host, port)
+                    raise
+                continue
+            if index:
+                _dns_cache.prefer(host, port, addresses, address)
+            return stream
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds):
+        self._backend.sleep(seconds)
+
+
+def _build_transport(transport_class, pool_class, backend):
+    """
+    Builds an httpx transport whose connection pool resolves hosts through the DNS cache.
+    httpx has no public way to set the network backend of its transports, so the pool of
+    the transport (`_pool`, the httpcore pool it sends requests through) is replaced by an
+    httpcore pool built with the same settings. This relies on httpx 0.28 internals, which
+    is why requirements.txt pins httpx to 0.28.x; with any other layout the stock pool
+    (without DNS caching) is kept.
+    """
+    transport = transport_class(http2=HTTP2_ENABLED, limits=DEFAULT_LIMITS)
+    if not isinstance(getattr(transport, "_pool", None), pool_class):
+        logger.warning(f"Unsupported httpx {httpx.__version__}: DNS caching is disabled")
+        return transport
+    transport._pool = pool_class(
+        ssl_context=httpx.create_ssl_context(),
+        max_connections=DEFAULT_LIMITS.max_connections,
+        max_keepalive_connections=DEFAULT_LIMITS.max_keepalive_connections,
+        keepalive_expiry=DEFAULT_LIMITS.keepalive_expiry,
+        http1=True,
+        http2=HTTP2_ENABLED,
+        network_backend=backend,
+    )
+    return transport
+
+
+def _uses_proxy() -> bool:
+    """
+    Whether HTTP_PROXY, HTTPS_PROXY or ALL_PROXY is set. httpx ignores them for a client
+    given an explicit transport, so the clients then keep httpx's own transports (and
+    proxy handling); DNS caching is moot when the proxy resolves the hosts anyway.
+    """
+    return any(scheme in getproxies() for scheme in ("http", "https", "all"))
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide async HTTP client, creating it on first use.
+    Sharing one client lets every request reuse pooled keep-alive (and, where the server
+    supports it, multiplexed HTTP/2) connections, and new connections skip DNS lookups
+    for recently resolved hosts.
+
+    :return: A shared httpx.AsyncClient instance.
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        proxied = _uses_proxy()
+        _async_client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+            http2=HTTP2_ENABLED,
+            limits=DEFAULT_LIMITS,
+            transport=None if proxied else _build_transport(httpx.AsyncHTTPTransport, httpcore.AsyncConnectionPool,
+                                                            _CachingAsyncBackend()),
+        )
+        logger.info(f"Created shared async HTTP client (http2={HTTP2_ENABLED}, proxy={proxied})")
+    return _async_client
+
+
+def get_sync_client() -> httpx.Client:
+    """
+    Returns the process-wide sync HTTP client, used by the sync code paths and scripts,
+    with the same pooling, HTTP/2 and DNS caching as the async client.
+
+    :return: A shared httpx.Client instance.
+    """
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        with _sync_client_lock:
+            if _sync_client is None or _sync_client.is_closed:
+                _sync_client = httpx.Client(
+                    timeout=DEFAULT_TIMEOUT,
+                    headers={"User-Agent": USER_AGENT},
+                    follow_redirects=True,
+                    http2=HTTP2_ENABLED,
+                    limits=DEFAULT_LIMITS,
+                    transport=None if _uses_proxy() else _build_transport(httpx.HTTPTransport, httpcore.ConnectionPool,
+                                                                          _CachingSyncBackend()),
+                )
+    return _sync_client
+
+
+@asynccontextmanager
+async def host_limit(url: str, default: Optional[int] = None):
+    """
+    Limits the number of simultaneous requests to the host of `url`, across all requests
+    of the worker. HTTP_HOST_LIMITS takes precedence over `default`; without either, the
+    request is not limited.
+
+    :param url: The URL about to be requested.
+    :param default: Limit for hosts not listed in HTTP_HOST_LIMITS.
+    """
+    host = urlsplit(url).netloc.lower()
+    limit = HOST_LIMITS.get(host, default)
+    if not limit:
+        yield
+        return
+
+    key = (host, limit)
+    slot = _host_slots.setdefault(key, [asyncio.Semaphore(limit), 0])
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            yield
+    finally:
+        # Forget idle hosts so the registry stays bounded by the number of hosts in flight
+        slot[1] -= 1
+        if slot[1] == 0:
+            _host_slots.pop(key, None)
+
+
+async def close_async_client() -> None:
+    """Closes the shared HTTP clients (called on application shutdown)."""
+    global _async_client, _sync_client
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+    if _sync_client is not None and not _sync_client.is_closed:
+        _sync_client.close()
+    _sync_client = None
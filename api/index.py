@@ -1,19 +1,57 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import List, Optional
 import orjson as json
 from dotenv import load_dotenv
+import logging
 
 load_dotenv() # Load environment variables from .env file
 
-from fastapi.responses import StreamingResponse
-from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from api.groq_llm import get_answer, get_relevant_questions # Changed from groq_api to ollama_api
-from api.sources_searcher import get_sources
+from pydantic import BaseModel
+from api.groq_llm import ANSWER_ERROR_MESSAGE
+from api.llm_router import aget_answer, aget_relevant_questions, ANSWER_MODEL # Async, routed across the configured LLM backends
+from api.sources_searcher import aget_sources
 from api.build_context import build_context
-from api.sources_manipulation import populate_sources
+from api.context_packer import count_tokens
+from api.metrics import ABANDONED_SEARCHES, RequestTimer, TOKENS, TOKENS_SAVED, render_metrics
+from api.http_client import close_async_client
+from api.profiler import PROFILER_ENABLED, profiler
+from api.stream_coalescer import coalesce
+from api.sse import END_OF_STREAM, batch_deltas, event, text_event
 
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Maximum number of organic results scraped in pro mode (chosen by api/scrape_scheduler.py, scraped concurrently)
+PRO_MODE_PAGES = int(os.getenv("PRO_MODE_PAGES", "8"))
+# Generate follow-up questions while the answer streams instead of after it
+PARALLEL_FOLLOW_UPS = os.getenv("PARALLEL_FOLLOW_UPS", "1") == "1"
+# Progressive pro mode: if scraping is not done after EARLY_START_DEADLINE seconds, the answer
+# starts from the search results alone. With PROGRESSIVE_REFINE, a refined answer built with
+# the scraped pages is streamed afterwards as 'llm_refined' events; otherwise late pages are dropped.
+PROGRESSIVE_DEFAULT = os.getenv("PROGRESSIVE_PRO_MODE", "0") == "1"
+EARLY_START_DEADLINE = float(os.getenv("EARLY_START_DEADLINE", "1.0"))
+PROGRESSIVE_REFINE = os.getenv("PROGRESSIVE_REFINE", "0") == "1"
+# Reuse the full response of an earlier, similar question (see api/answer_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "0") == "1"
+# Batch search: maximum queries per call, and how many of them run at once
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Pro-mode scrapes a progressive answer stopped waiting for; they finish in the background
+# (within SCRAPE_TOTAL_TIMEOUT) so that the page cache has the pages for the next search
+_background_scrapes = set()
+
+# Token counts of recently completed answers, used to estimate what an abandoned search saved
+_recent_tokens = {"in": deque(maxlen=200), "out": deque(maxlen=200)}
+
 # Configure CORS middleware to allow requests from any origin.
 # In a production environment, you should restrict `allow_origins` to your frontend's domain.
 app.add_middleware(
@@ -28,6 +66,20 @@ app.add_middleware(
 load_dotenv()
 
 
+@app.on_event("startup")
+async def startup():
+    """Start the sampling profiler when PROFILER_ENABLED is set."""
+    if PROFILER_ENABLED:
+        profiler.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled outbound connections when the worker stops."""
+    profiler.stop()
+    await close_async_client()
+
+
 @app.get("/api/")
 def root():
     """Root endpoint for a basic health check."""
@@ -40,8 +92,31 @@ def up_test():
     return {"status": "ok"}
 
 
+@app.get("/api/metrics")
+def metrics():
+    """Prometheus metrics of this worker: stage latency histograms, cache hits, scrape failures and tokens."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/profile")
+def profile(reset: bool = False):
+    """
+    Stack samples of this worker in folded format (one "stage;frame;... count" line per
+    stack), for flame graphs. Only available with PROFILER_ENABLED=1.
+
+    :param reset: Clear the samples after returning them.
+    """
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is disabled; set PROFILER_ENABLED=1")
+    folded = profiler.folded()
+    if reset:
+        profiler.reset()
+    return PlainTextResponse(folded)
+
+
 @app.get("/api/search")
-def ask(query: str, date_context: str, stored_location: str, pro_mode: bool = False):
+def ask(query: str, date_context: str, stored_location: str, pro_mode: bool = False,
+        progressive: bool = PROGRESSIVE_DEFAULT, last_event_id: Optional[str] = Header(None)):
     """
     Main search endpoint that orchestrates fetching sources, building context,
     getting an answer from the LLM, and generating relevant follow-up questions.
@@ -51,51 +126,342 @@ def ask(query: str, date_context: str, stored_location: str, pro_mode: bool = Fa
     :param date_context: The current date for contextualization.
     :param stored_location: The user's stored location for localized search results.
     :param pro_mode: A boolean flag to enable 'pro mode' (e.g., more detailed search/scraping).
+    :param progressive: In pro mode, start answering from the search results if scraping
+                        takes longer than EARLY_START_DEADLINE.
+    :param last_event_id: Last-Event-ID header of a client reconnecting after a dropped
+                          connection; the stream resumes after that event instead of starting over.
     :return: A StreamingResponse object that sends data as Server-Sent Events.
     """
     if not query:
         raise HTTPException(status_code=400, detail="Query cannot be empty")
 
     async def generate():
+        scrape_task = None
+        relevant_task = None
+        timer = RequestTimer()
+        token_counts = {"tokens_in": 0, "tokens_out": 0}
+        # Where the pipeline is, for estimating the tokens saved if it is abandoned
+        progress = {"stage": "search", "context_tokens": 0, "answer": None}
         try:
+            # 0. Paraphrases of a recently answered question replay its response
+            cache_vector = None
+            if ANSWER_CACHE_ENABLED:
+                # Imported here so that the embedding model is only loaded when the cache is on
+                from api.answer_cache import answer_cache
+
+                # Embedding and the vector search are CPU-bound, so they run in worker threads
+                with timer.stage("answer_cache"):
+                    partition = answer_cache.partition_key(date_context, stored_location, pro_mode)
+                    cache_vector = await asyncio.to_thread(answer_cache.embed, query)
+                    cached = None
+                    if cache_vector is not None:
+                        cached = await asyncio.to_thread(answer_cache.get, cache_vector, query, partition)
+                if cached is not None:
+                    yield event({'type': 'sources', 'data': cached['sources']})
+                    # Replay the stored chunks, batched like a live answer
+                    async for chunk in batch_deltas(replay_chunks(cached['answer'])):
+                        yield text_event('llm', chunk)
+                    yield event({'type': 'relevant', 'data': cached['relevant']})
+                    timings = timer.finish("ok", pro_mode=pro_mode, answer_cache_hit=True, **token_counts)
+                    yield event({'type': 'timings', 'data': timings})
+                    yield event({'type': 'finished', 'data': ''})
+                    yield END_OF_STREAM
+                    return
+
             # 1. Fetch initial search sources using Serper API
-            sources_result = get_sources(query, pro_mode, stored_location)
+            with timer.stage("search"):
+                sources_result = await aget_sources(query, pro_mode, stored_location)
+            # Pro mode replaces 'organic' with scraped copies; keep what the client was sent
+            client_sources = dict(sources_result)
             # Send sources data to the client
-            yield f"data:{json.dumps({'type': 'sources', 'data': sources_result}).decode()}\n\n"
+            yield event({'type': 'sources', 'data': sources_result})
 
             # 2. Populate sources with full HTML content if pro_mode is enabled
             # This involves scraping the top 'num_elements' websites
             if sources_result.get('organic') is not None and pro_mode is True:
-                # Set the number of websites to scrape: here = 2
-                sources_result['organic'] = populate_sources(sources_result['organic'], 2)
+                # Imported here so that non-pro requests never load the scraping stack
+                from api.scrape_scheduler import plan_scrape
+                from api.sources_manipulation import apopulate_sources
+
+                # Pages are fetched concurrently; the scheduler picks which (and how many) are worth it.
+                # Copies are scraped so that pages finishing late never change a context being built.
+                selected = plan_scrape(query, sources_result, PRO_MODE_PAGES)
+                scrape_started = time.perf_counter()
+                progress["stage"] = "scrape"
+                scrape_task = asyncio.create_task(
+                    apopulate_sources([dict(item) for item in sources_result['organic']], PRO_MODE_PAGES, selected)
+                )
+                with timer.stage("scrape_wait"):
+                    done, _ = await asyncio.wait({scrape_task}, timeout=EARLY_START_DEADLINE if progressive else None)
+                if scrape_task in done:
+                    sources_result['organic'] = scrape_task.result()
+                    scrape_task = None
+                elif not PROGRESSIVE_REFINE:
+                    # Answer from the search results only; the pages arrive too late for this answer,
+                    # but are left to finish so that they are cached
+                    _background_scrapes.add(scrape_task)
+                    scrape_task.add_done_callback(_background_scrapes.discard)
+                    scrape_task = None
 
             # 3. Build context for the LLM from the gathered sources
-            search_contexts = build_context(sources_result, query, pro_mode, date_context)
+            # Chunking is CPU-bound, so it runs in a worker thread
+            progress["stage"] = "context"
+            with timer.stage("context"):
+                search_contexts, context_stats = await asyncio.to_thread(
+                    build_context, sources_result, query, pro_mode, date_context, ANSWER_MODEL, True
+                )
+            progress["context_tokens"] = context_stats.get("tokens_used", 0)
+
+            # 4. Start the follow-up questions now: they only depend on the query and the
+            # contexts, so they are generated while the answer streams
+            if PARALLEL_FOLLOW_UPS:
+                relevant_task = asyncio.create_task(aget_relevant_questions(search_contexts, query))
+
+            # 5. Get the answer from the LLM, streaming chunks
+            answer = []
+            progress.update(stage="answer", answer=answer)
+            # Deltas arriving close together are sent as one event (see api/sse.py)
+            async for chunk in batch_deltas(timed_answer(timer, "answer", query, search_contexts, date_context, answer)):
+                yield text_event('llm', chunk)
+            count_answer_tokens(token_counts, context_stats, answer)
 
-            # 4. Get the answer from the local Ollama LLM, streaming chunks
-            for chunk in get_answer(query, search_contexts, date_context):
-                # Each chunk from get_answer is already the text content
-                yield f"data:{json.dumps({'type': 'llm', 'text': chunk}).decode()}\n\n"
+            # 6. Progressive mode: once the late pages are in, stream a refined answer that uses them
+            if scrape_task is not None:
+                progress["stage"] = "scrape"
+                sources_result['organic'] = await scrape_task
+                scrape_task = None
+                timer.record("scrape", time.perf_counter() - scrape_started)
+                progress["stage"] = "context"
+                with timer.stage("refined_context"):
+                    refined_contexts, refined_stats = await asyncio.to_thread(
+                        build_context, sources_result, query, pro_mode, date_context, ANSWER_MODEL, True
+                    )
+                refined = []
+                progress.update(stage="answer", context_tokens=refined_stats.get("tokens_used", 0), answer=refined)
+                async for chunk in batch_deltas(
+                    timed_answer(timer, "refined_answer", query, refined_contexts, date_context, refined)
+                ):
+                    yield text_event('llm_refined', chunk)
+                count_answer_tokens(token_counts, refined_stats, refined)
+                answer = refined
 
-            # 5. Get relevant follow-up questions from the LLM
+            # 7. Send the follow-up questions once both they and the answer are ready
+            relevant_questions_str = None
+            relevant_json = []
+            progress["stage"] = "follow_ups"
             try:
-                relevant_questions_str = get_relevant_questions(search_contexts, query)
+                # Only the time spent waiting after the answer adds to the request's latency
+                with timer.stage("follow_ups"):
+                    if relevant_task is not None:
+                        relevant_questions_str = await relevant_task
+                    else:
+                        relevant_questions_str = await aget_relevant_questions(search_contexts, query)
                 relevant_json = json.loads(relevant_questions_str)
-                yield f"data:{json.dumps({'type': 'relevant', 'data': relevant_json}).decode()}\n\n"
             except json.JSONDecodeError as e:
                 print(f"JSON decode error in relevant questions main.py: {e}. Raw response: {relevant_questions_str}")
-                yield f"data:{json.dumps({'type': 'relevant', 'data': []}).decode()}\n\n"
             except Exception as e:
                 print(f"error in relevant questions main.py {e}")
-                yield f"data:{json.dumps({'type': 'relevant', 'data': []}).decode()}\n\n"
+            yield event({'type': 'relevant', 'data': relevant_json})
 
-            # 6. Signal completion of the stream
-            yield f"data:{json.dumps({'type': 'finished', 'data': ''}).decode()}\n\n"
-            yield "event: end-of-stream\ndata: null\n\n"
+            answer_text = "".join(answer)
+            if cache_vector is not None and answer_text and answer_text != ANSWER_ERROR_MESSAGE.format(query=query):
+                await asyncio.to_thread(answer_cache.set, cache_vector, query, partition,
+                                        {"sources": client_sources, "answer": answer, "relevant": relevant_json})
 
+            # 8. Report where the time went, then signal completion of the stream
+            timings = timer.finish("ok", pro_mode=pro_mode, **token_counts)
+            yield event({'type': 'timings', 'data': timings})
+            yield event({'type': 'finished', 'data': ''})
+            yield END_OF_STREAM
+
+        except asyncio.CancelledError:
+            # Every client disconnected (see api/stream_coalescer.py): stop paying for the rest
+            tokens_saved = record_abandoned(progress)
+            timer.finish("cancelled", pro_mode=pro_mode, stage=progress["stage"], **tokens_saved, **token_counts)
+            raise
         except Exception as e:
             print(f"An error occurred in the generate function: {e}")
+            timer.finish("error", pro_mode=pro_mode, error=str(e), **token_counts)
             # Send a general error message to the client if an unhandled exception occurs
-            yield f"data:{json.dumps({'type': 'error', 'data': 'We are currently experiencing some issues. Please try again later.'}).decode()}\n\n"
+            yield event({'type': 'error', 'data': 'We are currently experiencing some issues. Please try again later.'})
+        finally:
+            # Pending scrapes and the follow-up call are not needed any more
+            if scrape_task is not None:
+                scrape_task.cancel()
+            if relevant_task is not None:
+                relevant_task.cancel()
+
+    # Identical searches in flight at the same time share a single pipeline run
+    key = search_key(query, date_context, stored_location, pro_mode, progressive)
+    return StreamingResponse(coalesce(key, generate, last_event_id), media_type="text/event-stream")
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    date_context: str
+    stored_location: str = ""
+    pro_mode: bool = False
+    concurrency: Optional[int] = None
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+
+@app.post("/api/search/batch")
+async def ask_batch(request: BatchSearchRequest):
+    """
+    Runs many searches in one call, for evaluations and offline jobs. Queries go through
+    the same pipeline as `/api/search`, at most `concurrency` (BATCH_CONCURRENCY) at a time;
+    identical Serper lookups and page scrapes in flight are shared between them.
+    Results are streamed as newline-delimited JSON in completion order, one line per query:
+    `{"index", "query", "answer", "sources", "relevant", "timings", "error"}`.
+
+    :param request: The queries and the options shared by all of them.
+    :return: A StreamingResponse of NDJSON lines.
+    """
+    queries = request.queries
+    if not queries:
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(index: int, query: str) -> dict:
+        async with slots:
+            return await batch_search(index, query, request.date_context, request.stored_location, request.pro_mode)
+
+    async def generate():
+        tasks = [asyncio.create_task(run(index, query)) for index, query in enumerate(queries)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + b"\n"
+        finally:
+            # The client went away: stop the queries still queued or running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+async def batch_search(index: int, query: str, date_context: str, stored_location: str, pro_mode: bool) -> dict:
+    """
+    Runs one query of a batch to completion and returns its result line. Errors are
+    reported in the line's `error` field instead of failing the batch.
+    """
+    timer = RequestTimer()
+    token_counts = {"tokens_in": 0, "tokens_out": 0}
+    result = {"index": index, "query": query, "answer": "", "sources": [], "relevant": [], "timings": {}, "error": None}
+    if not query or not query.strip():
+        result["error"] = "Query cannot be empty"
+        return result
+    try:
+        with timer.stage("search"):
+            sources_result = await aget_sources(query, pro_mode, stored_location)
+        result["sources"] = [{"title": source.get("title"), "link": source.get("link")}
+                             for source in sources_result.get('organic') or [] if source]
+
+        if sources_result.get('organic') is not None and pro_mode is True:
+            from api.scrape_scheduler import plan_scrape
+            from api.sources_manipulation import apopulate_sources
+
+            selected = plan_scrape(query, sources_result, PRO_MODE_PAGES)
+            with timer.stage("scrape"):
+                sources_result['organic'] = await apopulate_sources(sources_result['organic'], PRO_MODE_PAGES, selected)
+
+        with timer.stage("context"):
+            search_contexts, context_stats = await asyncio.to_thread(
+                build_context, sources_result, query, pro_mode, date_context, ANSWER_MODEL, True
+            )
+
+        relevant_task = asyncio.create_task(aget_relevant_questions(search_contexts, query))
+        try:
+            answer = []
+            async for _ in timed_answer(timer, "answer", query, search_contexts, date_context, answer):
+                pass
+            count_answer_tokens(token_counts, context_stats, answer)
+            with timer.stage("follow_ups"):
+                relevant_questions_str = await relevant_task
+        finally:
+            relevant_task.cancel()
+        result["answer"] = "".join(answer)
+        try:
+            result["relevant"] = json.loads(relevant_questions_str)
+        except json.JSONDecodeError as e:
+            logger.warning(f"JSON decode error in relevant questions of batch search {index}: {e}. "
+                           f"Raw response: {relevant_questions_str}")
+        result["timings"] = timer.finish("ok", pro_mode=pro_mode, batch=True, **token_counts)
+    except Exception as e:
+        logger.exception(f"Batch search {index} failed: {e}")
+        result["error"] = "We are currently experiencing some issues. Please try again later."
+        result["timings"] = timer.finish("error", pro_mode=pro_mode, batch=True, error=str(e), **token_counts)
+    return result
+
+
+async def timed_answer(timer: RequestTimer, stage: str, query: str, contexts: str, date_context: str, answer: list):
+    """
+    Streams an answer from the LLM, recording the time to the first token as
+    `<stage>_first_token` and the full generation time as `<stage>`. Chunks are also
+    collected in `answer` so their tokens can be counted afterwards.
+    """
+    start = time.perf_counter()
+    try:
+        async for chunk in aget_answer(query, contexts, date_context):
+            if not answer:
+                timer.record(f"{stage}_first_token", time.perf_counter() - start)
+            answer.append(chunk)
+            yield chunk
+    finally:
+        timer.record(stage, time.perf_counter() - start)
+
+
+async def replay_chunks(chunks: list):
+    """Yields stored answer chunks, letting other tasks run between them."""
+    for chunk in chunks:
+        yield chunk
+        await asyncio.sleep(0)
+
+
+def count_answer_tokens(token_counts: dict, context_stats: dict, answer: list) -> None:
+    """Adds the context tokens sent and the answer tokens received to the request's counts and metrics."""
+    tokens_in = context_stats.get("tokens_used", 0)
+    tokens_out = sum(count_tokens(["".join(answer)], ANSWER_MODEL)) if answer else 0
+    token_counts["tokens_in"] += tokens_in
+    token_counts["tokens_out"] += tokens_out
+    TOKENS.inc(tokens_in, direction="in")
+    TOKENS.inc(tokens_out, direction="out")
+    _recent_tokens["in"].append(tokens_in)
+    _recent_tokens["out"].append(tokens_out)
+
+
+def record_abandoned(progress: dict) -> dict:
+    """
+    Counts an abandoned search and estimates the answer tokens it did not spend, from the
+    mean of recently completed answers: before the answer request, its context and the
+    whole answer; during the answer, the rest of it. Nothing is counted until an answer
+    has completed.
+
+    :param progress: The pipeline's stage, context token count and answer chunks so far.
+    :return: The estimate as `tokens_saved_in` and `tokens_saved_out`.
+    """
+    stage = progress["stage"]
+    ABANDONED_SEARCHES.inc(stage=stage)
+    expected_in = sum(_recent_tokens["in"]) / len(_recent_tokens["in"]) if _recent_tokens["in"] else 0
+    expected_out = sum(_recent_tokens["out"]) / len(_recent_tokens["out"]) if _recent_tokens["out"] else 0
+    saved_in = saved_out = 0
+    if stage in ("search", "scrape", "context"):
+        saved_in = progress["context_tokens"] or expected_in
+        saved_out = expected_out
+    elif stage == "answer":
+        answer = progress["answer"]
+        generated = sum(count_tokens(["".join(answer)], ANSWER_MODEL)) if answer else 0
+        saved_out = max(expected_out - generated, 0)
+    saved = {"tokens_saved_in": int(saved_in), "tokens_saved_out": int(saved_out)}
+    TOKENS_SAVED.inc(saved["tokens_saved_in"], direction="in")
+    TOKENS_SAVED.inc(saved["tokens_saved_out"], direction="out")
+    return saved
+
+
+def search_key(query: str, date_context: str, stored_location: str, pro_mode: bool, progressive: bool = False) -> str:
+    """
+    Builds the coalescing key of a search; queries differing only in case or whitespace share it.
+    """
+    normalized_query = " ".join(query.casefold().split())
+    return "\x1f".join([normalized_query, date_context, (stored_location or "").lower(), str(pro_mode), str(progressive)])
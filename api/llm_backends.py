@@ -0,0 +1,180 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+import logging
+
+import httpx
+import orjson as json
+
+from api.http_client import get_async_client
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Local models can take a while to load on the first call
+LLM_TIMEOUT = httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "60")), connect=5.0)
+
+
+class LLMBackend(ABC):
+    """
+    A chat model that answers OpenAI-style message lists. Implementations provide
+    `stream` (text deltas of an answer) and `complete` (one full response).
+    """
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @abstractmethod
+    def stream(self, messages: list, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        """Yields the text deltas of an answer."""
+
+    @abstractmethod
+    async def complete(self, messages: list, max_tokens: int, temperature: float,
+                       response_format: Optional[dict] = None) -> str:
+        """
+        Returns one full response. `response_format` is passed to the API as is, e.g.
+        `{"type": "json_object"}` for JSON mode.
+        """
+
+
+class GroqBackend(LLMBackend):
+    """Groq's hosted models, through the shared async Groq client."""
+
+    name = "groq"
+
+    async def stream(self, messages, max_tokens, temperature):
+        from api.groq_llm import get_async_groq_client
+
+        client = get_async_groq_client()
+        if client is None:
+            raise RuntimeError("Groq client unavailable")
+        stream = await client.chat.completions.create(
+            model=self.model, messages=messages, stream=True, max_tokens=max_tokens, temperature=temperature,
+        )
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            # Closes the HTTP response when the stream is abandoned (e.g. a lost hedge)
+            await stream.close()
+
+    async def complete(self, messages, max_tokens, temperature, response_format=None):
+        from api.groq_llm import get_async_groq_client
+
+        client = get_async_groq_client()
+        if client is None:
+            raise RuntimeError("Groq client unavailable")
+        extra = {"response_format": response_format} if response_format else {}
+        response = await client.chat.completions.create(
+            model=self.model, messages=messages, max_tokens=max_tokens, temperature=temperature, **extra,
+        )
+        return response.choices[0].message.content or ""
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Any server implementing the OpenAI chat completions API: Ollama (`/v1`), vLLM,
+    llama.cpp, OpenAI itself. Requests go through the shared HTTP client.
+    """
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: Optional[str] = None):
+        super().__init__(model)
+        self.name = name
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    async def stream(self, messages, max_tokens, temperature):
+        body = {"model": self.model, "messages": messages, "stream": True,
+                "max_tokens": max_tokens, "temperature": temperature}
+        async with get_async_client().stream("POST", self.url, json=body, headers=self.headers,
+                                             timeout=LLM_TIMEOUT) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
+    async def complete(self, messages, max_tokens, temperature, response_format=None):
+        body = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        if response_format:
+            body["response_format"] = response_format
+        response = await get_async_client().post(self.url, json=body, headers=self.headers, timeout=LLM_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+
+class StubBackend(LLMBackend):
+    """
+    Canned responses after a fixed delay, for benchmarks and for running the app without
+    any model.
+    """
+
+    name = "stub"
+
+    def __init__(self, model: str = "stub", ttft: float = 0.2, token_delay: float = 0.01, tokens: int = 14):
+        super().__init__(model)
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.tokens = tokens
+
+    async def stream(self, messages, max_tokens, temperature):
+        await asyncio.sleep(self.ttft)
+        sentence = "This is a placeholder answer from the stub model, based on the provided contexts.".split()
+        # The sentence is repeated until the answer is `tokens` words long
+        words = (sentence * (self.tokens // len(sentence) + 1))[:min(self.tokens, max_tokens)]
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield word + " "
+
+    async def complete(self, messages, max_tokens, temperature, response_format=None):
+        await asyncio.sleep(self.ttft)
+        return json.dumps({"followUp": ["What are the key facts?", "What changed recently?", "Why does it matter?"]}).decode()
+
+
+def build_backend(name: str, follow_ups: bool = False) -> LLMBackend:
+    """
+    Builds a backend from its name and environment variables:
+
+    - groq: GROQ_MODEL, GROQ_FOLLOW_UP_MODEL
+    - ollama: OLLAMA_BASE_URL (default http://localhost:11434/v1), OLLAMA_MODEL, OLLAMA_FOLLOW_UP_MODEL
+    - openai: OPENAI_BASE_URL, OPENAI_API_KEY, OPENAI_MODEL, OPENAI_FOLLOW_UP_MODEL (any OpenAI-compatible server)
+    - stub: STUB_LLM_TTFT, STUB_LLM_TOKEN_DELAY, STUB_LLM_TOKENS
+
+    :param name: Backend name, as listed in LLM_BACKENDS.
+    :param follow_ups: Use the backend's follow-up model (the answer model if none is set).
+    :return: The backend instance.
+    """
+    name = name.strip().lower()
+    if name == "groq":
+        from api.groq_llm import GROQ_FOLLOW_UP_MODEL, GROQ_MODEL
+
+        return GroqBackend(GROQ_FOLLOW_UP_MODEL if follow_ups else GROQ_MODEL)
+    if name == "ollama":
+        model = os.getenv("OLLAMA_MODEL", "llama3.2")
+        return OpenAICompatibleBackend(
+            "ollama", os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1"),
+            os.getenv("OLLAMA_FOLLOW_UP_MODEL", model) if follow_ups else model,
+        )
+    if name == "openai":
+        model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        return OpenAICompatibleBackend(
+            "openai", os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            os.getenv("OPENAI_FOLLOW_UP_MODEL", model) if follow_ups else model, os.getenv("OPENAI_API_KEY"),
+        )
+    if name == "stub":
+        return StubBackend(ttft=float(os.getenv("STUB_LLM_TTFT", "0.2")),
+                           token_delay=float(os.getenv("STUB_LLM_TOKEN_DELAY", "0.01")),
+                           tokens=int(os.getenv("STUB_LLM_TOKENS", "14")))
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -0,0 +1,247 @@
+import asyncio
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Optional
+import logging
+
+from api.groq_llm import (
+    ANSWER_ERROR_MESSAGE, FOLLOW_UP_MAX_TOKENS, build_answer_messages, build_relevant_messages, fallback_follow_ups,
+    follow_up_response_format, parse_follow_ups,
+)
+from api.llm_backends import LLMBackend, build_backend
+from api.metrics import Counter, Histogram
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Answer backends in order of preference, e.g. "groq,ollama"
+LLM_BACKENDS = [name.strip().lower() for name in os.getenv("LLM_BACKENDS", "groq").split(",") if name.strip()]
+# Backends for follow-up questions (each with its follow-up model); defaults to LLM_BACKENDS
+FOLLOW_UP_BACKENDS = [name.strip().lower() for name in os.getenv("FOLLOW_UP_BACKENDS", ",".join(LLM_BACKENDS)).split(",")
+                      if name.strip()]
+# Send the same request to the next backend when the first token is late, and keep the faster one
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "1") == "1"
+# Hedge delay until a backend has LLM_TTFT_MIN_SAMPLES samples; then its rolling p95 TTFT is used
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "1.5"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.25"))
+LLM_TTFT_WINDOW = int(os.getenv("LLM_TTFT_WINDOW", "200"))
+LLM_TTFT_MIN_SAMPLES = int(os.getenv("LLM_TTFT_MIN_SAMPLES", "20"))
+# A backend that failed is tried after the others for this many seconds
+LLM_FAILURE_COOLDOWN = float(os.getenv("LLM_FAILURE_COOLDOWN", "30"))
+
+LLM_TTFT = Histogram("open_perplex_llm_ttft_seconds", "Time to first token (or full response) per LLM backend.")
+LLM_REQUESTS = Counter("open_perplex_llm_requests_total",
+                       "LLM calls per backend and result (won, lost, failed, cancelled).")
+LLM_HEDGES = Counter("open_perplex_llm_hedges_total", "Hedged LLM requests sent after a late first token.")
+
+
+class LLMRouter:
+    """
+    Sends each call to the backend with the lowest rolling median time to first token
+    (backends without enough samples are tried first, so every backend gets measured).
+    If the first token has not arrived after the backend's p95 TTFT, the call is hedged:
+    the next backend gets the same request, the first to answer wins and the other one is
+    cancelled. A backend that fails is replaced by the next one immediately, and ranked
+    last for LLM_FAILURE_COOLDOWN seconds.
+    """
+
+    def __init__(self, backends: list[LLMBackend], hedge: bool = LLM_HEDGE_ENABLED):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = backends
+        self.hedge = hedge
+        self._ttft = {backend.name: deque(maxlen=LLM_TTFT_WINDOW) for backend in backends}
+        self._failed_at = {}
+
+    def record_ttft(self, backend: LLMBackend, seconds: float) -> None:
+        self._ttft[backend.name].append(seconds)
+        LLM_TTFT.observe(seconds, backend=backend.name)
+
+    def record_failure(self, backend: LLMBackend) -> None:
+        self._failed_at[backend.name] = time.monotonic()
+
+    def ranked(self) -> list[LLMBackend]:
+        """Backends in the order they should be tried."""
+        now = time.monotonic()
+
+        def key(item):
+            index, backend = item
+            failing = now - self._failed_at.get(backend.name, float("-inf")) < LLM_FAILURE_COOLDOWN
+            samples = self._ttft[backend.name]
+            # Too few samples: rank by configuration order ahead of measured backends
+            if len(samples) < LLM_TTFT_MIN_SAMPLES:
+                return (failing, 0, index)
+            return (failing, 1, statistics.median(samples))
+
+        return [backend for _, backend in sorted(enumerate(self.backends), key=key)]
+
+    def hedge_delay(self, backend: LLMBackend) -> float:
+        """Seconds to wait for `backend`'s first token before hedging."""
+        samples = self._ttft[backend.name]
+        if len(samples) < LLM_TTFT_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+        return max(p95, LLM_HEDGE_MIN_DELAY)
+
+    async def _race(self, start, discard=None):
+        """
+        Runs `start(backend)` on the best backend, hedging and failing over as described
+        above, and returns (backend, result) of the first call to succeed. `discard` is
+        called with the result of a call that succeeded too late to be used.
+        """
+        candidates = self.ranked()
+        tasks = {}
+        next_index = 0
+        hedged = False
+
+        def launch():
+            nonlocal next_index
+            backend = candidates[next_index]
+            next_index += 1
+            tasks[asyncio.create_task(start(backend))] = (backend, time.perf_counter())
+
+        launch()
+        delay = self.hedge_delay(candidates[0])
+        winner_ttft = None
+        try:
+            while tasks:
+                can_hedge = self.hedge and not hedged and next_index < len(candidates)
+                done, _ = await asyncio.wait(tasks, timeout=delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"No first token from {candidates[0].name} after {delay:.2f}s; "
+                                f"hedging with {candidates[next_index].name}")
+                    LLM_HEDGES.inc(backend=candidates[next_index].name)
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    backend, started = tasks.pop(task)
+                    if task.exception() is None:
+                        winner_ttft = time.perf_counter() - started
+                        self.record_ttft(backend, winner_ttft)
+                        LLM_REQUESTS.inc(backend=backend.name, result="won")
+                        return backend, task.result()
+                    logger.error(f"LLM backend {backend.name} failed: {task.exception()}")
+                    self.record_failure(backend)
+                    LLM_REQUESTS.inc(backend=backend.name, result="failed")
+                # Fail over right away when nothing else is in flight
+                if not tasks and next_index < len(candidates):
+                    launch()
+            raise RuntimeError("All LLM backends failed")
+        finally:
+            for task, (backend, started) in tasks.items():
+                elapsed = time.perf_counter() - started
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    logger.error(f"LLM backend {backend.name} failed: {task.exception()}")
+                    self.record_failure(backend)
+                    LLM_REQUESTS.inc(backend=backend.name, result="failed")
+                    continue
+                if task.done() and not task.cancelled() and discard is not None:
+                    discard(task.result())
+                task.cancel()
+                if winner_ttft is None:
+                    # The caller gave up: nothing was learned about this backend
+                    LLM_REQUESTS.inc(backend=backend.name, result="cancelled")
+                    continue
+                # Censored sample: the loser did not answer within `elapsed`, and was no faster
+                # than the winner (a hedge started late may have run for less than that)
+                self.record_ttft(backend, max(elapsed, winner_ttft))
+                LLM_REQUESTS.inc(backend=backend.name, result="lost")
+
+    async def stream(self, messages: list, max_tokens: int, temperature: float):
+        """Streams text deltas from the backend that produced the first token."""
+        async def first_token(backend):
+            stream = backend.stream(messages, max_tokens, temperature)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                # Cancelled (lost the race) or failed: release the backend's connection
+                await stream.aclose()
+                raise
+
+        _, (stream, first) = await self._race(first_token, discard=lambda result: asyncio.create_task(result[0].aclose()))
+        try:
+            if first is None:
+                return
+            yield first
+            async for delta in stream:
+                yield delta
+        finally:
+            await stream.aclose()
+
+    async def complete(self, messages: list, max_tokens: int, temperature: float,
+                       response_format: Optional[dict] = None) -> str:
+        """Returns the full response of the first backend to answer."""
+        _, text = await self._race(lambda backend: backend.complete(messages, max_tokens, temperature, response_format))
+        return text
+
+
+_router: Optional[LLMRouter] = None
+_follow_up_router: Optional[LLMRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """Returns the process-wide router over the backends listed in LLM_BACKENDS."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter([build_backend(name) for name in LLM_BACKENDS])
+                logger.info(f"LLM backends: {', '.join(f'{b.name} ({b.model})' for b in _router.backends)}")
+    return _router
+
+
+def get_follow_up_router() -> LLMRouter:
+    """
+    Returns the process-wide router for follow-up questions, over FOLLOW_UP_BACKENDS with
+    their follow-up models. It keeps its own TTFT statistics, since its models differ.
+    """
+    global _follow_up_router
+    if _follow_up_router is None:
+        with _router_lock:
+            if _follow_up_router is None:
+                _follow_up_router = LLMRouter([build_backend(name, follow_ups=True) for name in FOLLOW_UP_BACKENDS])
+                logger.info(f"Follow-up backends: "
+                            f"{', '.join(f'{b.name} ({b.model})' for b in _follow_up_router.backends)}")
+    return _follow_up_router
+
+
+# Model of the preferred backend; selects the tokenizer and context budget
+ANSWER_MODEL = build_backend(LLM_BACKENDS[0]).model if LLM_BACKENDS else None
+
+
+async def aget_answer(query: str, contexts: str, date_context: str):
+    """
+    Streams the answer to `query` from the fastest available backend.
+    """
+    messages = build_answer_messages(query, contexts, date_context)
+    try:
+        logger.info("Streaming answer generation request…")
+        async for delta in get_router().stream(messages, max_tokens=1024, temperature=0.7):
+            yield delta
+    except Exception as e:
+        logger.exception(f"Error during LLM streaming call: {e}")
+        yield ANSWER_ERROR_MESSAGE.format(query=query)
+
+
+async def aget_relevant_questions(contexts: str, query: str) -> str:
+    """
+    Returns a JSON string with `{"followUp": […]}` of suggested follow-ups, generated in
+    JSON mode by the follow-up model.
+    """
+    messages = build_relevant_messages(contexts, query)
+    try:
+        logger.info("Requesting relevant questions…")
+        text = await get_follow_up_router().complete(messages, max_tokens=FOLLOW_UP_MAX_TOKENS, temperature=0.3,
+                                                     response_format=follow_up_response_format())
+        return parse_follow_ups(text, query)
+    except Exception as e:
+        logger.exception(f"Error fetching relevant questions: {e}")
+    return fallback_follow_ups(query)
@@ -0,0 +1,166 @@
+import threading
+import time
+from contextlib import contextmanager
+import logging
+
+import orjson as json
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Histogram buckets (seconds) shared by all pipeline stages, from cache hits to slow scrapes
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Every metric, in the order it is exposed on /api/metrics
+_registry = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels, exposed in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with optional labels, exposed in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts, sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("open_perplex_stage_seconds", "Duration of each /api/search pipeline stage.")
+SEARCHES = Counter("open_perplex_searches_total", "Completed /api/search pipelines by outcome.")
+SCRAPE_FAILURES = Counter("open_perplex_scrape_failures_total", "Pages that could not be scraped, by reason.")
+TOKENS = Counter("open_perplex_tokens_total", "Answer tokens sent to (in) and received from (out) the LLM.")
+ABANDONED_SEARCHES = Counter("open_perplex_abandoned_searches_total", "Searches cancelled after every client disconnected, by stage.")
+TOKENS_SAVED = Counter("open_perplex_tokens_saved_total", "Estimated answer tokens not spent because searches were abandoned.")
+
+
+class RequestTimer:
+    """
+    Collects the stage durations of one search pipeline. Every stage is also observed in
+    STAGE_SECONDS as soon as it ends, so requests that fail midway still show up.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times the enclosed block as stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        """Adds `seconds` to stage `name` (a stage entered twice accumulates)."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    def summary(self) -> dict:
+        """Stage durations so far, in milliseconds, plus the elapsed total."""
+        timings = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return timings
+
+    def finish(self, outcome: str, **fields) -> dict:
+        """
+        Records the total duration and outcome of the pipeline and writes one structured
+        log line with every stage.
+
+        :param outcome: "ok", "error" or "cancelled".
+        :param fields: Extra values to include in the log line (e.g. token counts).
+        :return: The stage summary in milliseconds.
+        """
+        self.record("total", time.perf_counter() - self.started)
+        SEARCHES.inc(outcome=outcome)
+        timings = self.summary()
+        logger.info(json.dumps({"event": "search_timings", "outcome": outcome, "timings_ms": timings, **fields}).decode())
+        return timings
+
+
+def render_metrics() -> str:
+    """
+    Renders every metric of this process in the Prometheus text exposition format,
+    including the hit counts of the caches and the stream coalescer.
+    """
+    from api.cache import caches
+    from api.stream_coalescer import stats as coalescer_stats
+
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+
+    lines.append("# HELP open_perplex_cache_requests_total Cache lookups by cache and result.")
+    lines.append("# TYPE open_perplex_cache_requests_total counter")
+    for cache in caches:
+        stats = cache.stats()
+        lines.append(f'open_perplex_cache_requests_total{{cache="{stats["name"]}",result="hit"}} {stats["hits"]}')
+        lines.append(f'open_perplex_cache_requests_total{{cache="{stats["name"]}",result="miss"}} {stats["misses"]}')
+
+    lines.append("# HELP open_perplex_coalesced_searches_total Searches that ran the pipeline (leader) or joined one (follower).")
+    lines.append("# TYPE open_perplex_coalesced_searches_total counter")
+    for role, plural in (("leader", "leaders"), ("follower", "followers")):
+        lines.append(f'open_perplex_coalesced_searches_total{{role="{role}"}} {coalescer_stats[plural]}')
+    lines.append("# HELP open_perplex_resumed_streams_total Reconnecting clients that resumed a stream from Last-Event-ID.")
+    lines.append("# TYPE open_perplex_resumed_streams_total counter")
+    lines.append(f"open_perplex_resumed_streams_total {coalescer_stats['resumes']}")
+    return "\n".join(lines) + "\n"
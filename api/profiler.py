@@ -0,0 +1,152 @@
+import importlib
+import os
+import sys
+import threading
+import types
+from collections import Counter as Tally
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Sample the stacks of every thread of the worker and serve them at /api/profile
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+
+# Pipeline functions, as (module, qualified name), and the /api/search stage (as named by
+# RequestTimer) they run in; the innermost one on a sampled stack decides the stage. Work
+# running in tasks of its own is listed by the task's function. Functions are matched by
+# code object, so same-named functions of other libraries (httpx, asyncio) never match.
+STAGE_FUNCTIONS = {
+    ("api.answer_cache", "AnswerCache.embed"): "answer_cache",
+    ("api.sources_searcher", "aget_sources"): "search",
+    ("api.sources_searcher", "_afetch_sources"): "search",
+    ("api.scrape_scheduler", "plan_scrape"): "scrape",
+    ("api.sources_manipulation", "apopulate_sources"): "scrape",
+    ("api.sources_manipulation", "_scrape_source"): "scrape",
+    ("api.extract_content_from_website", "_aextract_website_content"): "scrape",
+    ("api.build_context", "build_context"): "context",
+    ("api.index", "timed_answer"): "answer",
+    # LLMRouter runs each backend call in a task: streamed answers and follow-up completions
+    ("api.llm_router", "LLMRouter.stream.<locals>.first_token"): "answer",
+    ("api.llm_router", "LLMRouter.complete"): "follow_ups",
+    ("api.llm_backends", "GroqBackend.complete"): "follow_ups",
+    ("api.llm_backends", "OpenAICompatibleBackend.complete"): "follow_ups",
+    ("api.llm_backends", "StubBackend.complete"): "follow_ups",
+    ("api.llm_router", "aget_relevant_questions"): "follow_ups",
+}
+# The event loop's scheduling step: loop work outside any stage is counted under "other"
+EVENT_LOOP_FUNCTION = ("asyncio.base_events", "BaseEventLoop._run_once")
+# Threads whose innermost frame is in one of these modules are waiting, not working
+IDLE_MODULES = ("selectors.py", "threading.py", "queue.py")
+
+
+def code_of(module_name: str, qualname: str) -> types.CodeType:
+    """
+    Returns the code object of the function `qualname` of `module_name`; functions nested
+    in another one are named `outer.<locals>.inner`.
+    """
+    outer, *nested = qualname.split(".<locals>.")
+    function = importlib.import_module(module_name)
+    for attribute in outer.split("."):
+        function = getattr(function, attribute)
+    code = function.__code__
+    for name in nested:
+        code = next(const for const in code.co_consts if isinstance(const, types.CodeType) and const.co_name == name)
+    return code
+
+
+def stage_codes() -> dict:
+    """Code object -> stage of the functions of STAGE_FUNCTIONS that can be found."""
+    codes = {}
+    for (module_name, qualname), stage in {**STAGE_FUNCTIONS, EVENT_LOOP_FUNCTION: "other"}.items():
+        try:
+            codes[code_of(module_name, qualname)] = stage
+        except Exception as e:
+            logger.warning(f"Profiler stage function {module_name}.{qualname} not found: {e}")
+    return codes
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of all threads every `interval` seconds from a background
+    thread and counts them in folded form ("stage;frame;frame count"), ready for
+    flamegraph.pl or speedscope. Each stack is rooted at the pipeline stage it belongs to,
+    found from the pipeline functions on it; event loop work outside any stage (HTTP
+    handling, SSE writes) is counted under "other", and idle threads are skipped.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL):
+        self.interval = interval
+        self.samples = Tally()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stages = {}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        # Resolved when profiling starts, once the pipeline modules can be imported
+        self._stages = stage_codes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:.1f} ms interval)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples.clear()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = self._fold(frame)
+                if stack is not None:
+                    with self._lock:
+                        self.samples[stack] += 1
+
+    def _fold(self, frame):
+        """Returns the folded stack of `frame` from its stage down, or None for idle or unrelated threads."""
+        if os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+            return None
+        frames = []
+        while frame is not None:
+            frames.append(frame.f_code)
+            frame = frame.f_back
+        frames.reverse()
+        root = None
+        for index, code in enumerate(frames):
+            stage = self._stages.get(code)
+            # The event loop only roots stacks that are in no stage
+            if stage is not None and (stage != "other" or root is None):
+                root = (stage, index)
+        if root is None:
+            return None
+        stage, start = root
+        return ";".join([stage] + [f"{code.co_name} ({os.path.basename(code.co_filename)})" for code in frames[start:]])
+
+    def folded(self) -> str:
+        """The samples in folded format, one stack per line."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def stage_totals(self) -> dict:
+        """Number of samples per stage."""
+        totals = Tally()
+        with self._lock:
+            for stack, count in self.samples.items():
+                totals[stack.split(";", 1)[0]] += count
+        return dict(totals.most_common())
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,71 @@
+import os
+import threading
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Small sentence-embedding model that runs comfortably on CPU
+RERANK_MODEL = os.getenv("RERANK_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "1") == "1"
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "64"))
+
+_embeddings = None
+_load_failed = False
+_load_lock = threading.Lock()
+
+
+def get_embeddings():
+    """
+    Returns the shared embedding model, loading it on first use. The model is loaded once
+    per process and reused by every request; None is returned if it cannot be loaded.
+    """
+    global _embeddings, _load_failed
+    if _embeddings is not None or _load_failed:
+        return _embeddings
+
+    with _load_lock:
+        if _embeddings is None and not _load_failed:
+            try:
+                from langchain_huggingface import HuggingFaceEmbeddings
+
+                _embeddings = HuggingFaceEmbeddings(
+                    model_name=RERANK_MODEL,
+                    model_kwargs={"device": "cpu"},
+                    encode_kwargs={"normalize_embeddings": True, "batch_size": RERANK_BATCH_SIZE},
+                )
+                logger.info(f"Loaded reranking model {RERANK_MODEL}")
+            except Exception as e:
+                logger.error(f"Could not load reranking model {RERANK_MODEL}, keeping arrival order: {e}")
+                _load_failed = True
+    return _embeddings
+
+
+def rerank(query: str, pieces: list[str], token_budget: int, costs: list[int]) -> list[str]:
+    """
+    Orders context pieces by relevance to the query so that the context packer keeps the
+    best ones when they do not all fit in the token budget. The query and all pieces are
+    embedded in one batch, and cosine similarities are computed as a single
+    matrix-vector product.
+
+    :param query: The user's search query.
+    :param pieces: Candidate context pieces (e.g. page chunks).
+    :param token_budget: Number of tokens available for these pieces.
+    :param costs: Token count of each piece.
+    :return: The pieces, most relevant first (arrival order if they all fit or no model is available).
+    """
+    # Nothing will be dropped: skip the model entirely
+    if not pieces or sum(costs) <= token_budget:
+        return pieces
+
+    embeddings = get_embeddings() if RERANK_ENABLED else None
+    if embeddings is None:
+        return pieces
+
+    vectors = np.asarray(embeddings.embed_documents([query] + pieces), dtype=np.float32)
+    query_vector, piece_vectors = vectors[0], vectors[1:]
+    norms = np.linalg.norm(piece_vectors, axis=1) * np.linalg.norm(query_vector)
+    scores = piece_vectors @ query_vector / np.maximum(norms, 1e-12)
+    return [pieces[index] for index in np.argsort(-scores, kind="stable")]
@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import logging
+
+from api.metrics import Counter
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Stop adding pages once this many successful extractions are expected
+SCRAPE_TARGET_PAGES = float(os.getenv("SCRAPE_TARGET_PAGES", "4"))
+# Seconds a page may be expected to take; slower domains are skipped, and faster ones are
+# preferred. Well below SCRAPE_PAGE_TIMEOUT (4s), which caps the latency recorded for a
+# timeout, so that a domain is skipped after two timeouts or a few slow pages in a row
+SCRAPE_TIME_BUDGET = float(os.getenv("SCRAPE_TIME_BUDGET", "2"))
+# Candidates scoring below this are never scraped
+SCRAPE_MIN_SCORE = float(os.getenv("SCRAPE_MIN_SCORE", "0.05"))
+# Domains whose history is kept (least recently scraped ones are forgotten)
+SCRAPE_DOMAIN_STATS_SIZE = int(os.getenv("SCRAPE_DOMAIN_STATS_SIZE", "5000"))
+# Weight of the newest observation in the per-domain moving averages
+DOMAIN_STATS_ALPHA = 0.3
+# Assumed for domains never scraped before
+PRIOR_SUCCESS = 0.7
+PRIOR_LATENCY = 1.0
+
+# Links that never yield extractable article text
+NON_HTML_EXTENSIONS = (".pdf", ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx", ".zip",
+                       ".mp3", ".mp4", ".mov", ".avi", ".jpg", ".jpeg", ".png", ".gif")
+VIDEO_AND_SOCIAL_DOMAINS = ("youtube.com", "youtu.be", "vimeo.com", "tiktok.com", "instagram.com",
+                            "facebook.com", "twitter.com", "x.com", "pinterest.com", "linkedin.com")
+PAYWALLED_DOMAINS = ("wsj.com", "ft.com", "bloomberg.com", "economist.com", "nytimes.com", "barrons.com")
+WORD_PATTERN = re.compile(r"\w+")
+STOP_WORDS = {"the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was", "what",
+              "how", "why", "who", "when", "where", "which", "does", "do", "with", "about", "vs"}
+
+SCRAPE_DECISIONS = Counter("open_perplex_scrape_candidates_total", "Pro-mode scrape candidates by scheduler decision.")
+
+# domain -> [success rate, latency in seconds, observations]
+_domain_stats = OrderedDict()
+_domain_stats_lock = threading.Lock()
+
+
+def domain_of(url: str) -> str:
+    host = urlsplit(url).netloc.lower().split(":")[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+def _matches(domain: str, domains) -> bool:
+    return any(domain == known or domain.endswith("." + known) for known in domains)
+
+
+def record_scrape(url: str, success: bool, latency: float) -> None:
+    """
+    Updates the moving averages of extraction success and latency of the url's domain.
+
+    :param url: The scraped URL.
+    :param success: Whether usable text was extracted.
+    :param latency: Seconds the scrape took (the deadline, for timeouts).
+    """
+    domain = domain_of(url)
+    with _domain_stats_lock:
+        stats = _domain_stats.get(domain)
+        if stats is None:
+            stats = _domain_stats[domain] = [PRIOR_SUCCESS, PRIOR_LATENCY, 0]
+        stats[0] += DOMAIN_STATS_ALPHA * ((1.0 if success else 0.0) - stats[0])
+        stats[1] += DOMAIN_STATS_ALPHA * (latency - stats[1])
+        stats[2] += 1
+        _domain_stats.move_to_end(domain)
+        while len(_domain_stats) > SCRAPE_DOMAIN_STATS_SIZE:
+            _domain_stats.popitem(last=False)
+
+
+def _recover(url: str) -> None:
+    """
+    Moves a skipped domain's averages a small step back towards the priors, so that a
+    domain that was slow or failing once gets retried eventually.
+    """
+    with _domain_stats_lock:
+        stats = _domain_stats.get(domain_of(url))
+        if stats is not None:
+            stats[0] += DOMAIN_STATS_ALPHA / 3 * (PRIOR_SUCCESS - stats[0])
+            stats[1] += DOMAIN_STATS_ALPHA / 3 * (PRIOR_LATENCY - stats[1])
+
+
+def domain_history(url: str) -> tuple[float, float]:
+    """Returns the (success rate, latency) expected for the url's domain."""
+    with _domain_stats_lock:
+        stats = _domain_stats.get(domain_of(url))
+        return (stats[0], stats[1]) if stats is not None else (PRIOR_SUCCESS, PRIOR_LATENCY)
+
+
+def content_factor(url: str) -> float:
+    """How likely the link is to be an extractable HTML article, from its URL alone."""
+    domain = domain_of(url)
+    path = urlsplit(url).path.lower()
+    if path.endswith(NON_HTML_EXTENSIONS):
+        return 0.0
+    if _matches(domain, VIDEO_AND_SOCIAL_DOMAINS):
+        return 0.1
+    if _matches(domain, PAYWALLED_DOMAINS):
+        return 0.3
+    return 1.0
+
+
+def snippet_relevance(query_terms: set, source: dict) -> float:
+    """Fraction of the query terms found in the result's title and snippet."""
+    if not query_terms:
+        return 1.0
+    text = f"{source.get('title', '')} {source.get('snippet', '')}".lower()
+    return len(query_terms & set(WORD_PATTERN.findall(text))) / len(query_terms)
+
+
+def plan_scrape(query: str, sources_result: dict, max_pages: int) -> list[int]:
+    """
+    Chooses which organic results to scrape. Each candidate is scored by snippet relevance,
+    its domain's extraction success rate and latency, and its likely content type; domains
+    expected to exceed SCRAPE_TIME_BUDGET are skipped. Candidates are taken best first until
+    SCRAPE_TARGET_PAGES successful extractions are expected (or `max_pages` are chosen).
+    When the answer box already holds a direct answer, the target is halved.
+
+    :param query: The user's search query.
+    :param sources_result: Parsed search results.
+    :param max_pages: Maximum number of pages to scrape.
+    :return: Indices of the organic results to scrape, best first.
+    """
+    organic = sources_result.get('organic') or []
+    query_terms = {term for term in WORD_PATTERN.findall(query.lower()) if term not in STOP_WORDS}
+    answer_box = sources_result.get('answerBox') or {}
+    target = SCRAPE_TARGET_PAGES / 2 if answer_box.get('answer') else SCRAPE_TARGET_PAGES
+
+    candidates = []
+    for index, source in enumerate(organic):
+        link = source.get('link') if source else None
+        if not link:
+            continue
+        success, latency = domain_history(link)
+        if latency > SCRAPE_TIME_BUDGET:
+            _recover(link)
+            continue
+        # Search rank still carries information: later results get a mild discount
+        rank_factor = 1.0 / (1.0 + 0.1 * index)
+        # A domain at the time budget counts half as much as an instant one
+        speed_factor = 1.0 - 0.5 * latency / SCRAPE_TIME_BUDGET
+        usable = success * content_factor(link)
+        score = (0.5 + snippet_relevance(query_terms, source)) * usable * rank_factor * speed_factor
+        if score >= SCRAPE_MIN_SCORE:
+            candidates.append((score, index, usable))
+        else:
+            _recover(link)
+
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    selected = []
+    expected_successes = 0.0
+    for score, index, usable in candidates:
+        # (tolerance for moving averages that approach 1.0 without reaching it)
+        if len(selected) >= max_pages or expected_successes >= target - 1e-3:
+            break
+        selected.append(index)
+        expected_successes += usable
+
+    SCRAPE_DECISIONS.inc(len(selected), decision="selected")
+    SCRAPE_DECISIONS.inc(len(organic) - len(selected), decision="skipped")
+    logger.info(f"Scraping {len(selected)} of {len(organic)} results "
+                f"(expected successes {expected_successes:.1f}, target {target:.1f})")
+    return selected
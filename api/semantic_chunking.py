@@ -1,22 +1,141 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import operator
+import os
+import re
 import logging
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize a text splitter for general-purpose chunking.
 # Adjust chunk_size and chunk_overlap as needed for optimal context feeding to the LLM.
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,  # Each chunk will aim for around 500 characters
-    chunk_overlap=50, # Overlap between chunks to maintain context
-    length_function=len, # Use standard Python len() for length calculation
-    is_separator_regex=False, # Separators are not treated as regex
-)
+CHUNK_SIZE = 500  # Each chunk will aim for around 500 characters
+CHUNK_OVERLAP = 50  # Overlap between chunks to maintain context
+# Prefer sentence boundaries over word boundaries when cutting chunks
+CHUNK_SENTENCE_AWARE = os.getenv("CHUNK_SENTENCE_AWARE", "0") == "1"
+
+# Separators tried in order, as regular expressions; "" means "between any two characters".
+# The default list is the one RecursiveCharacterTextSplitter uses.
+DEFAULT_SEPARATORS = [r"\n\n", r"\n", r" ", ""]
+# Same, with sentence ends (whitespace after ., ! or ?) tried before single spaces
+SENTENCE_SEPARATORS = [r"\n\n", r"\n", r"(?<=[.!?])\s+", r" ", ""]
+
+
+@lru_cache(maxsize=None)
+def _compile(separator: str):
+    return re.compile(separator)
+
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+               sentence_aware: bool = CHUNK_SENTENCE_AWARE) -> list[str]:
+    """
+    Splits text into chunks of at most `chunk_size` characters with up to `chunk_overlap`
+    characters of overlap, using the algorithm of LangChain's RecursiveCharacterTextSplitter
+    (separators kept at the start of the following piece, chunks stripped).
+
+    The whole computation works on (start, end) index spans over the single input buffer;
+    because kept separators make merged pieces contiguous, each chunk is produced by one
+    slice at the end instead of repeated substring joins. With the default separators the
+    output is identical to RecursiveCharacterTextSplitter(chunk_size, chunk_overlap).
+    With `sentence_aware`, chunks end at sentence boundaries whenever a sentence fits,
+    so chunks may be shorter than with the default separators.
+
+    Args:
+    text (str): The text to split.
+    chunk_size (int): Maximum chunk length in characters.
+    chunk_overlap (int): Maximum overlap between consecutive chunks in characters.
+    sentence_aware (bool): Try sentence boundaries before word boundaries.
+
+    Returns:
+    list: The text chunks.
+    """
+    separators = SENTENCE_SEPARATORS if sentence_aware else DEFAULT_SEPARATORS
+    spans = []
+    _split_span(text, 0, len(text), separators, chunk_size, chunk_overlap, spans)
+
+    chunks = []
+    for start, end in spans:
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def _split_span(text, start, end, separators, chunk_size, chunk_overlap, out):
+    """Recursively splits text[start:end] and appends the resulting chunk spans to `out`."""
+    # Use the first separator present in the span; the remaining ones split oversized pieces
+    pattern = None
+    remaining = []
+    for i, separator in enumerate(separators):
+        if separator == "":
+            break
+        candidate = _compile(separator)
+        if candidate.search(text, start, end):
+            pattern = candidate
+            remaining = separators[i + 1:]
+            break
+
+    # Piece boundaries: each separator starts the piece that follows it, so piece i is
+    # text[bounds[i]:bounds[i + 1]]
+    if pattern is None:
+        bounds = list(range(start, end + 1))
+    else:
+        bounds = [start]
+        bounds.extend(match.start() for match in pattern.finditer(text, start, end))
+        bounds.append(end)
+        # Drop empty pieces (separator at the start of the span)
+        if len(bounds) > 2 and bounds[1] == start:
+            del bounds[1]
+
+    lengths = list(map(operator.sub, bounds[1:], bounds))
+    if not lengths or max(lengths) < chunk_size:
+        _merge_bounds(bounds, chunk_size, chunk_overlap, out)
+        return
+
+    # Runs of small pieces are merged; oversized pieces are split with the next separator
+    run_start = 0
+    for i, length in enumerate(lengths):
+        if length < chunk_size:
+            continue
+        if i > run_start:
+            _merge_bounds(bounds[run_start:i + 1], chunk_size, chunk_overlap, out)
+        if not remaining:
+            out.append((bounds[i], bounds[i + 1]))
+        else:
+            _split_span(text, bounds[i], bounds[i + 1], remaining, chunk_size, chunk_overlap, out)
+        run_start = i + 1
+    if len(lengths) > run_start:
+        _merge_bounds(bounds[run_start:], chunk_size, chunk_overlap, out)
+
+
+def _merge_bounds(bounds, chunk_size, chunk_overlap, out):
+    """
+    Greedily merges consecutive pieces (given by their boundaries) into chunk spans of at
+    most `chunk_size`, carrying up to `chunk_overlap` characters of trailing pieces into the
+    next chunk. Instead of walking piece by piece, each chunk end and the next chunk start
+    are found by binary search over the boundaries.
+    """
+    last = len(bounds) - 1
+    first = 0
+    while True:
+        # Last piece that still fits after bounds[first]
+        cut = bisect_right(bounds, bounds[first] + chunk_size) - 1
+        if cut >= last:
+            out.append((bounds[first], bounds[last]))
+            return
+        out.append((bounds[first], bounds[cut]))
+        # Next chunk starts at the earliest piece leaving at most chunk_overlap characters
+        # before the cut, and leaving room for the piece after the cut
+        overlap_start = bisect_left(bounds, bounds[cut] - chunk_overlap)
+        fit_start = min(bisect_left(bounds, bounds[cut + 1] - chunk_size), cut)
+        first = max(first, overlap_start, fit_start)
+
 
 def get_chunking(text: str) -> list[str]:
     """
-    Splits the provided text into meaningful chunks using RecursiveCharacterTextSplitter.
+    Splits the provided text into meaningful chunks (500 characters, 50 characters of overlap)
+    with the native span-based splitter.
     This replaces the previous Cohere-based semantic chunking.
 
     Args:
@@ -32,9 +151,8 @@ def get_chunking(text: str) -> list[str]:
             return [text] if text else []
 
         # Split the text into chunks
-        chunks = text_splitter.split_text(text)
-        return chunks
+        return split_text(text)
 
     except Exception as e:
         logger.error(f"Error during chunking process: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -1,9 +1,24 @@
-from api.extract_content_from_website import extract_website_content
+import asyncio
+import os
+import time
+from api.extract_content_from_website import extract_website_content, afetch_page
+from api.http_client import host_limit
+from api.scrape_scheduler import record_scrape
+from api.metrics import SCRAPE_FAILURES
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Deadlines (in seconds) for concurrent scraping: each page gets SCRAPE_PAGE_TIMEOUT,
+# and whatever has not finished after SCRAPE_TOTAL_TIMEOUT is abandoned.
+SCRAPE_PAGE_TIMEOUT = float(os.getenv("SCRAPE_PAGE_TIMEOUT", "4"))
+SCRAPE_TOTAL_TIMEOUT = float(os.getenv("SCRAPE_TOTAL_TIMEOUT", "6"))
+# Maximum number of simultaneous fetches to a single host, shared across requests
+# (HTTP_HOST_LIMITS overrides it for specific hosts)
+SCRAPE_PER_HOST_LIMIT = int(os.getenv("SCRAPE_PER_HOST_LIMIT", "2"))
+
+
 def populate_sources(sources, num_elements):
     """
     Populates the given number of sources with their full HTML content by scraping their links.
@@ -36,3 +51,90 @@ def populate_sources(sources, num_elements):
         return sources # Return original sources on a higher-level error
 
     return sources
+
+
+async def apopulate_sources(sources, num_elements, selected=None):
+    """
+    Async counterpart of `populate_sources`. The top sources are scraped concurrently over
+    the shared connection pool, with a per-page deadline, an overall deadline and a
+    per-host concurrency limit. Pages are attached as they finish; pages still pending
+    at the overall deadline are abandoned and left without 'html'.
+
+    :param sources: A list of dictionaries, where each dictionary represents a source
+                    and should contain a 'link' key.
+    :param num_elements: The number of top sources to scrape.
+    :param selected: Indices of the sources to scrape instead of the top `num_elements`
+                     (see api/scrape_scheduler.py).
+    :return: The updated list of sources with 'html' content added to the scraped ones.
+    """
+    try:
+        tasks = []
+        deadline = asyncio.get_running_loop().time() + SCRAPE_TOTAL_TIMEOUT
+        indices = selected if selected is not None else range(min(num_elements, len(sources)))
+        for i in indices:
+            source = sources[i]
+            if not source or 'link' not in source:
+                logger.warning(f"Skipping invalid source at index {i}: {source}")
+                continue
+            tasks.append(asyncio.create_task(_scrape_source(source, deadline)))
+
+        if not tasks:
+            return sources
+
+        try:
+            # Consume results in completion order so slow pages never hold up fast ones;
+            # every scrape ends by the overall deadline on its own
+            for finished in asyncio.as_completed(tasks):
+                source, html_content = await finished
+                if html_content is not None:
+                    source['html'] = html_content
+        finally:
+            for task in tasks:
+                task.cancel()
+    except Exception as e:
+        logger.error(f"Error in apopulate_sources: {e}")
+        return sources
+
+    return sources
+
+
+async def _scrape_source(source, deadline):
+    """
+    Scrapes a single source under its host's concurrency limit, the per-page deadline and
+    the overall deadline. Only real downloads feed the domain's history: the time spent
+    fetching (not waiting for a host slot) is its latency, and only the scrape's own
+    deadlines count as failures. Page cache hits, downloads joined from another search
+    and scrapes cancelled by their caller are not recorded.
+
+    :param source: The source dictionary containing a 'link' key.
+    :param deadline: Event loop time at which all scraping stops (SCRAPE_TOTAL_TIMEOUT).
+    :return: A tuple of the source and its extracted content (None if the page timed out).
+    """
+    link = source['link']
+    loop = asyncio.get_running_loop()
+    async with host_limit(link, SCRAPE_PER_HOST_LIMIT):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            # The deadline passed while waiting for a slot: the page was never requested
+            logger.warning(f"Scraping deadline of {SCRAPE_TOTAL_TIMEOUT}s reached before {link} was fetched")
+            SCRAPE_FAILURES.inc(reason="deadline")
+            return source, None
+        timeout = min(SCRAPE_PAGE_TIMEOUT, remaining)
+        started = time.perf_counter()
+        content, fetched = await afetch_page(link, timeout)
+        elapsed = time.perf_counter() - started
+        if content is None:
+            if timeout < SCRAPE_PAGE_TIMEOUT:
+                logger.warning(f"Scraping deadline of {SCRAPE_TOTAL_TIMEOUT}s reached while fetching {link}")
+                SCRAPE_FAILURES.inc(reason="deadline")
+            else:
+                logger.warning(f"Scraping {link} exceeded {SCRAPE_PAGE_TIMEOUT}s")
+                SCRAPE_FAILURES.inc(reason="timeout")
+            if fetched:
+                # At least this slow
+                record_scrape(link, False, elapsed)
+            return source, None
+    if fetched:
+        # Feed the scheduler's per-domain history: empty text (paywall, PDF, video page) is a failure
+        record_scrape(link, bool(content), elapsed)
+    return source, content
@@ -1,14 +1,18 @@
 import os
-import requests
+import httpx
+import orjson as json
 from typing import Dict, Any, Optional, List
 import logging
+from api.http_client import get_async_client, get_sync_client, host_limit
+from api.cache import make_cache
+from api.stream_coalescer import single_flight
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Constants for Serper API
-API_URL = "https://google.serper.dev/search"
+API_URL = os.getenv("SERPER_API_URL", "https://google.serper.dev/search")
 API_KEY = os.getenv("SERPER_API_KEY") # Ensure SERPER_API_KEY is set in your .env file
 DEFAULT_LOCATION = 'us'
 HEADERS = {
@@ -16,6 +20,11 @@ HEADERS = {
     'Content-Type': 'application/json'
 }
 
+# Search results are cached so that repeated (e.g. trending) queries skip the Serper round trip
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+search_cache = make_cache("search", SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
 
 def get_sources(query: str, pro_mode: bool = False, stored_location: Optional[str] = None) -> Dict[str, Any]:
     """
@@ -33,31 +42,57 @@ def get_sources(query: str, pro_mode: bool = False, stored_location: Optional[st
         return {}
 
     try:
-        search_location = (stored_location or DEFAULT_LOCATION).lower()
-        # Adjust number of results based on pro_mode
-        num_results = 10 if pro_mode else 20
-
-        payload = {
-            "q": query,
-            "num": num_results,
-            "gl": search_location # Geographic location for search results
-        }
+        payload = build_payload(query, pro_mode, stored_location)
+        key = cache_key(payload)
+        cached = search_cache.get(key)
+        if cached is not None:
+            return cached
 
-        response = requests.post(API_URL, headers=HEADERS, json=payload, timeout=10)
+        # Shared keep-alive connection instead of a new TCP+TLS handshake per search
+        response = get_sync_client().post(API_URL, headers=HEADERS, json=payload, timeout=10)
         response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
 
-        data = response.json()
+        results = parse_results(response.json())
+        search_cache.set(key, results)
+        return results
+
+    except httpx.HTTPError as e:
+        logger.error(f"HTTP error while getting sources from Serper API: {e}")
+    except Exception as e:
+        logger.exception(f"Unexpected error while getting sources: {e}")
+
+    return {}
+
+
+async def aget_sources(query: str, pro_mode: bool = False, stored_location: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Async counterpart of `get_sources`. Uses the shared async HTTP client so that a slow
+    Serper response does not block the event loop serving other streams.
+
+    :param query: The search query string.
+    :param pro_mode: Boolean flag to determine the number of search results (more for pro_mode).
+    :param stored_location: Optional location string (e.g., 'us', 'gb') for localized search.
+    :return: A dictionary containing parsed search results (organic, topStories, images, graph, answerBox).
+             Returns an empty dictionary on error or if API key is missing.
+    """
+    if not API_KEY:
+        logger.error("SERPER_API_KEY environment variable is not set. Cannot fetch search results.")
+        return {}
+
+    try:
+        payload = build_payload(query, pro_mode, stored_location)
+        key = cache_key(payload)
+        cached = await search_cache.aget(key)
+        if cached is not None:
+            return cached
 
-        # Extract and return relevant fields from the Serper API response
-        return {
-            'organic': extract_fields(data.get('organic', []), ['title', 'link', 'snippet', 'date']),
-            'topStories': extract_fields(data.get('topStories', []), ['title', 'imageUrl']),
-            'images': extract_fields(data.get('images', [])[:6], ['title', 'imageUrl']), # Limit images to top 6
-            'graph': data.get('knowledgeGraph'), # Knowledge graph data
-            'answerBox': data.get('answerBox') # Answer box data
-        }
+        # Identical searches in flight at the same time share one Serper call
+        results = await single_flight(f"search\x1f{key}", lambda: _afetch_sources(payload))
+        await search_cache.aset(key, results)
+        # Every caller gets its own copy, as with cache hits
+        return json.loads(json.dumps(results))
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"HTTP error while getting sources from Serper API: {e}")
     except Exception as e:
         logger.exception(f"Unexpected error while getting sources: {e}")
@@ -65,6 +100,62 @@ def get_sources(query: str, pro_mode: bool = False, stored_location: Optional[st
     return {}
 
 
+async def _afetch_sources(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Calls Serper with `payload` and returns the parsed results."""
+    async with host_limit(API_URL):
+        response = await get_async_client().post(API_URL, headers=HEADERS, json=payload, timeout=10)
+    response.raise_for_status()
+    return parse_results(response.json())
+
+
+def build_payload(query: str, pro_mode: bool = False, stored_location: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Builds the Serper request payload.
+
+    :param query: The search query string.
+    :param pro_mode: Boolean flag to determine the number of search results.
+    :param stored_location: Optional location string for localized search.
+    :return: The JSON payload to send to the Serper API.
+    """
+    search_location = (stored_location or DEFAULT_LOCATION).lower()
+    # Adjust number of results based on pro_mode
+    num_results = 10 if pro_mode else 20
+
+    return {
+        "q": query,
+        "num": num_results,
+        "gl": search_location # Geographic location for search results
+    }
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """
+    Builds the search cache key from a Serper payload. The query is case-folded and its
+    whitespace collapsed, so trivially different spellings of a query share an entry.
+
+    :param payload: The payload built by `build_payload`.
+    :return: A string key of the normalized (query, gl, num) tuple.
+    """
+    query = " ".join(payload["q"].casefold().split())
+    return f"{query}\x1f{payload['gl']}\x1f{payload['num']}"
+
+
+def parse_results(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extracts the relevant fields from a raw Serper API response.
+
+    :param data: The decoded JSON response from Serper.
+    :return: A dictionary with organic, topStories, images, graph and answerBox entries.
+    """
+    return {
+        'organic': extract_fields(data.get('organic', []), ['title', 'link', 'snippet', 'date']),
+        'topStories': extract_fields(data.get('topStories', []), ['title', 'imageUrl']),
+        'images': extract_fields(data.get('images', [])[:6], ['title', 'imageUrl']), # Limit images to top 6
+        'graph': data.get('knowledgeGraph'), # Knowledge graph data
+        'answerBox': data.get('answerBox') # Answer box data
+    }
+
+
 def extract_fields(items: List[Dict[str, Any]], fields: List[str]) -> List[Dict[str, Any]]:
     """
     Helper function to extract specified fields from a list of dictionaries.
@@ -0,0 +1,93 @@
+import asyncio
+import os
+from typing import AsyncIterator
+
+import orjson as json
+
+# Answer deltas arriving within this many seconds of each other are sent as one event
+# (the first delta is always sent at once); 0 sends every delta as its own event
+SSE_FLUSH_WINDOW = float(os.getenv("SSE_FLUSH_WINDOW", "0.03"))
+# Send the buffered deltas early once they reach this many characters
+SSE_FLUSH_CHARS = int(os.getenv("SSE_FLUSH_CHARS", "512"))
+
+END_OF_STREAM = b"event: end-of-stream\ndata: null\n\n"
+
+
+def event(payload) -> bytes:
+    """Frames `payload` as an SSE data event, serialized straight to bytes."""
+    return b"data:" + json.dumps(payload) + b"\n\n"
+
+
+def text_event(kind: str, text: str) -> bytes:
+    """Frames an answer delta (`{"type": kind, "text": text}`) without building the dict first."""
+    return b'data:{"type":"' + kind.encode() + b'","text":' + json.dumps(text) + b"}\n\n"
+
+
+async def batch_deltas(deltas: AsyncIterator[str], window: float = SSE_FLUSH_WINDOW,
+                       max_chars: int = SSE_FLUSH_CHARS) -> AsyncIterator[str]:
+    """
+    Re-chunks a stream of text deltas into fewer, larger pieces. The first delta is
+    passed through immediately so the time to first token is unchanged; after that,
+    deltas are buffered for up to `window` seconds or `max_chars` characters. The deltas
+    are read by a separate task, so a slow model never holds back text already received.
+
+    :param deltas: The text deltas, e.g. from `aget_answer`.
+    :param window: Seconds to collect deltas before sending them; 0 disables batching.
+    :param max_chars: Buffered characters that trigger an early flush.
+    :return: An async generator over the joined deltas.
+    """
+    if window <= 0:
+        async for delta in deltas:
+            yield delta
+        return
+
+    buffer = []
+    size = 0
+    finished = False
+    error = None
+    ready = asyncio.Event()  # Text is buffered (or the stream ended)
+    full = asyncio.Event()  # max_chars reached (or the stream ended)
+
+    async def pump():
+        nonlocal size, finished, error
+        try:
+            async for delta in deltas:
+                buffer.append(delta)
+                size += len(delta)
+                ready.set()
+                if size >= max_chars:
+                    full.set()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            ready.set()
+            full.set()
+
+    reader = asyncio.create_task(pump())
+    try:
+        first = True
+        while True:
+            if not buffer and not finished:
+                await ready.wait()
+            if not first and not full.is_set():
+                try:
+                    await asyncio.wait_for(full.wait(), timeout=window)
+                except asyncio.TimeoutError:
+                    pass
+            if buffer:
+                text = "".join(buffer)
+                buffer.clear()
+                size = 0
+                if not finished:
+                    ready.clear()
+                    full.clear()
+                first = False
+                yield text
+            elif finished:
+                break
+        if error is not None:
+            raise error
+    finally:
+        # Closing early (client gone, pipeline cancelled) stops reading the model's stream
+        reader.cancel()
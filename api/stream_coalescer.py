@@ -0,0 +1,212 @@
+import asyncio
+import os
+import secrets
+import time
+from collections import OrderedDict
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Seconds a stream stays resumable (with Last-Event-ID) after it finished
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "60"))
+# Streams kept for resuming per worker; the oldest are forgotten first
+SSE_RESUME_STREAMS = int(os.getenv("SSE_RESUME_STREAMS", "1000"))
+# Seconds a pipeline keeps running after its last client disconnected, so that the client
+# can reconnect and resume; then the pipeline (scrapes, LLM calls) is cancelled. Enough for
+# the page's reconnect (1s after a drop), and short next to a typical answer, so that
+# abandoned searches stop before most of their tokens are generated
+SSE_DISCONNECT_GRACE = float(os.getenv("SSE_DISCONNECT_GRACE", "2"))
+
+
+class SharedStream:
+    """
+    A stream of SSE events produced once and consumed by any number of subscribers.
+    Every event is kept, so a subscriber that joins late first receives a replay of what
+    was already sent and then follows the live tail. Events are sent with an SSE `id:` of
+    `<token>:<index>`, which a client that lost the connection sends back as Last-Event-ID.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.token = secrets.token_hex(6)
+        self.token_bytes = self.token.encode()
+        self.events: List[bytes] = []
+        self.done = False
+        self.cancelled = False
+        self.finished_at = None
+        self.subscribers = 0
+        self.producer = None
+        self._changed = asyncio.Event()
+        self._abandon_handle = None
+
+    def append(self, event: bytes) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def close(self) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self) -> None:
+        # Wake every waiting subscriber, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self, start: int = 0) -> AsyncIterator[bytes]:
+        """
+        Yields the events of the stream from index `start`, waiting for new ones until it is closed.
+        """
+        self.subscribers += 1
+        if self._abandon_handle is not None:
+            # A client is back within the grace period
+            self._abandon_handle.cancel()
+            self._abandon_handle = None
+        try:
+            position = start
+            while True:
+                while position < len(self.events):
+                    yield b"id: %s:%d\n%s" % (self.token_bytes, position, self.events[position])
+                    position += 1
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self.producer is not None:
+                self._abandon_handle = asyncio.get_running_loop().call_later(SSE_DISCONNECT_GRACE, self._abandon)
+
+    def _abandon(self) -> None:
+        """Cancels the producer if no client came back during the grace period."""
+        self._abandon_handle = None
+        if self.subscribers == 0 and not self.done:
+            logger.info(f"Every client of stream {self.key!r} disconnected; cancelling its pipeline")
+            self.cancelled = True
+            self.producer.cancel()
+            # New requests for the same search start over instead of joining a cancelled run
+            if _in_flight.get(self.key) is self:
+                del _in_flight[self.key]
+
+
+# Streams currently being produced, by request key
+_in_flight: Dict[str, SharedStream] = {}
+# Calls currently running through `single_flight`: key -> [task, number of waiting callers]
+_calls: Dict[str, list] = {}
+# Streams that can be resumed, by token, oldest first
+_resumable: "OrderedDict[str, SharedStream]" = OrderedDict()
+stats = {"leaders": 0, "followers": 0, "resumes": 0}
+
+
+async def _produce(stream: SharedStream, generate: Callable[[], AsyncIterator[bytes]]) -> None:
+    """Runs the pipeline once, publishing each event to the shared stream."""
+    try:
+        async for event in generate():
+            stream.append(event)
+    except Exception as e:
+        logger.exception(f"Error while producing coalesced stream {stream.key!r}: {e}")
+    finally:
+        stream.close()
+        if _in_flight.get(stream.key) is stream:
+            del _in_flight[stream.key]
+
+
+def _prune_resumable() -> None:
+    """Forgets streams that finished more than SSE_RESUME_GRACE seconds ago, and the oldest beyond SSE_RESUME_STREAMS."""
+    now = time.monotonic()
+    for token in list(_resumable):
+        stream = _resumable[token]
+        if len(_resumable) > SSE_RESUME_STREAMS or (stream.done and now - stream.finished_at > SSE_RESUME_GRACE):
+            del _resumable[token]
+
+
+def _resume_point(key: str, last_event_id: Optional[str]):
+    """
+    Returns (stream, index of the next event) for a Last-Event-ID sent by a reconnecting
+    client, or None when that stream is unknown (another worker, or forgotten).
+    """
+    if not last_event_id:
+        return None
+    token, _, index = last_event_id.strip().partition(":")
+    stream = _resumable.get(token)
+    # Only resume the same search, and only if it ran to the end; otherwise start a fresh stream
+    if stream is None or stream.key != key or stream.cancelled or not index.isdigit():
+        return None
+    return stream, int(index) + 1
+
+
+async def coalesce(key: str, generate: Callable[[], AsyncIterator[bytes]],
+                   last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    Yields the event stream for `key`. The first request for a key starts `generate` in a
+    background task; identical requests arriving while it runs subscribe to the same stream
+    instead of repeating the upstream work. The producer is independent of any single
+    client, so it keeps going if the request that started it disconnects, and a client
+    reconnecting with Last-Event-ID (while the stream runs or up to SSE_RESUME_GRACE
+    seconds after it finished) receives only the events it missed. Once no client has
+    been subscribed for SSE_DISCONNECT_GRACE seconds, the producer is cancelled.
+
+    :param key: Identity of the request; requests with equal keys share one pipeline run.
+    :param generate: Zero-argument callable returning the async generator of SSE events.
+    :param last_event_id: The Last-Event-ID header of a reconnecting client.
+    :return: An async generator over the SSE events for this subscriber.
+    """
+    _prune_resumable()
+    resume = _resume_point(key, last_event_id)
+    if resume is not None:
+        stream, start = resume
+        stats["resumes"] += 1
+        logger.info(f"Resuming stream {key!r} at event {start} of {len(stream.events)}")
+        async for event in stream.subscribe(start):
+            yield event
+        return
+    if last_event_id:
+        logger.info(f"Cannot resume stream {key!r} from {last_event_id!r}; starting over")
+
+    stream = _in_flight.get(key)
+    if stream is None:
+        stream = SharedStream(key)
+        _in_flight[key] = stream
+        _resumable[stream.token] = stream
+        stats["leaders"] += 1
+        stream.producer = asyncio.create_task(_produce(stream, generate))
+    else:
+        stats["followers"] += 1
+        logger.info(f"Coalescing request into in-flight stream {key!r} ({len(stream.events)} events replayed)")
+
+    async for event in stream.subscribe():
+        yield event
+
+
+def in_flight(key: str) -> bool:
+    """Whether a `single_flight` call for `key` is running (a new caller would join it)."""
+    return key in _calls
+
+
+async def single_flight(key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Awaits `call()`, sharing it with every caller that asks for the same key while it runs
+    (e.g. two searches scraping the same page at once). The call runs in its own task, so
+    a caller that gives up (deadline, disconnect) does not cancel it for the others; it is
+    cancelled only once every caller has given up.
+
+    :param key: Identity of the call.
+    :param call: Zero-argument callable returning the awaitable to run.
+    :return: The result of the shared call.
+    """
+    entry = _calls.get(key)
+    if entry is None:
+        task = asyncio.create_task(call())
+        entry = _calls[key] = [task, 0]
+        task.add_done_callback(lambda finished: _calls.pop(key, None) if _calls.get(key) is entry else None)
+    task = entry[0]
+    entry[1] += 1
+    try:
+        return await asyncio.shield(task)
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and not task.done():
+            task.cancel()
+            if _calls.get(key) is entry:
+                del _calls[key]
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the native chunker against LangChain's RecursiveCharacterTextSplitter.
+
+Generates page-like text (sentences, whitespace collapsed as the extractor produces it,
+plus a variant with paragraph breaks) of 10 to 100 KB, checks that both splitters return
+the same chunks, and reports the time per call of each.
+
+    python benchmarks/chunking.py
+    python benchmarks/chunking.py --sizes 10 50 100 --repeat 50
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.semantic_chunking import CHUNK_OVERLAP, CHUNK_SIZE, split_text
+
+WORDS = ("the of and to in is that for on with as was by at from market price model "
+         "search answer source data report year government company people results").split()
+
+
+def make_text(size_kb: int, paragraphs: bool, seed: int = 0) -> str:
+    """Build roughly `size_kb` KB of sentence-like text."""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size_kb * 1024:
+        sentence = " ".join(rng.choices(WORDS, k=rng.randint(6, 25))).capitalize() + rng.choice(".!?")
+        if paragraphs and rng.random() < 0.15:
+            sentence += "\n\n"
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100], help="Input sizes in KB")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        reference = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                                   length_function=len, is_separator_regex=False)
+    except ImportError:
+        reference = None
+        print("langchain-text-splitters is not installed; timing the native chunker only")
+
+    print(f"{'input':>16} {'native ms':>10} {'sentence ms':>12} {'langchain ms':>13} {'speedup':>8}  same output")
+    for size in args.sizes:
+        for paragraphs in (False, True):
+            text = make_text(size, paragraphs)
+            label = f"{size} KB{' +paras' if paragraphs else ''}"
+            native = min(timeit.repeat(lambda: split_text(text), number=1, repeat=args.repeat)) * 1000
+            sentence = min(timeit.repeat(lambda: split_text(text, sentence_aware=True),
+                                         number=1, repeat=args.repeat)) * 1000
+            if reference is None:
+                print(f"{label:>16} {native:>10.2f} {sentence:>12.2f}")
+                continue
+            langchain = min(timeit.repeat(lambda: reference.split_text(text), number=1, repeat=args.repeat)) * 1000
+            same = split_text(text) == reference.split_text(text)
+            print(f"{label:>16} {native:>10.2f} {sentence:>12.2f} {langchain:>13.2f} {langchain / native:>7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Import-time (cold start) benchmark.
+
+Imports a module in a fresh interpreter with `python -X importtime`, several times,
+and reports the median total import time plus the slowest imports of the last run.
+Run it for the serverless entry point and for the modules a request pulls in lazily:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module api.sources_manipulation --top 10
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# "import time: <self us> | <cumulative us> | <indented module name>"
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def measure(module: str) -> list[tuple[int, int, int, str]]:
+    """Import `module` in a new interpreter; return (self µs, cumulative µs, depth, name) per import."""
+    env = {**os.environ, "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "import-benchmark")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            rows.append((int(match[1]), int(match[2]), len(match[3]) // 2, match[4]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="api.index")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest top-level imports to list")
+    args = parser.parse_args()
+
+    totals = []
+    rows = []
+    for _ in range(args.runs):
+        rows = measure(args.module)
+        totals.append(next(cumulative for _, cumulative, _, name in reversed(rows) if name == args.module))
+
+    print(f"{args.module}: median {statistics.median(totals) / 1000:.1f} ms over {args.runs} runs "
+          f"(min {min(totals) / 1000:.1f} ms, max {max(totals) / 1000:.1f} ms)")
+    # Direct dependencies of the measured module, by cumulative time
+    direct = sorted((row for row in rows if row[2] == 1), key=lambda row: row[1], reverse=True)
+    for _, cumulative, _, name in direct[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Load benchmark for /api/search.
+
+Starts a local stub that emulates Serper, the scraped websites and Groq's streaming
+chat completions with a fixed latency, points the app at it, and drives the app with
+N concurrent SSE clients. Run it once with `--mode async` (the current pipeline) and
+once with `--mode blocking`, which swaps in the sync clients exactly the way the
+pipeline used to call them from inside the async generator.
+
+    python benchmarks/load_search.py --concurrency 50 --requests 200 --mode async
+    python benchmarks/load_search.py --concurrency 50 --requests 200 --mode blocking
+
+`--sequential-follow-ups` generates the follow-up questions after the answer instead of
+alongside it; compare the reported time to the `finished` event with and without it.
+`--hiccup-rate 0.1 --hiccup-delay 3` delays the first token of 10% of LLM calls; add
+`--hedge` to route answers over two backends (Groq and an OpenAI-compatible one, both
+served by the stub) so that late first tokens are hedged, and compare the p95s.
+`--progressive` (with `--pro-mode`) starts answering after EARLY_START_DEADLINE even if
+pages are still being scraped; use a `--page-latency` above the deadline to see the effect.
+
+Every query links to pages of its own and the app uses the in-memory page cache, so
+scrapes are never served from a cache left by an earlier run; `--shared-pages` links
+every query to the same ten pages instead, to measure the page cache itself.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+import orjson as json
+import uvicorn
+from urllib.parse import quote
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUB_PORT = 8765
+APP_PORT = 8766
+
+
+def build_stub_app(latency: float, token_delay: float, tokens: int, page_latency: float = None,
+                   hiccup_rate: float = 0.0, hiccup_delay: float = 0.0, shared_pages: bool = False) -> FastAPI:
+    """
+    Build an app that answers like Serper, a web page and Groq, each after `latency` seconds.
+    A `hiccup_rate` fraction of LLM calls waits another `hiccup_delay` seconds. Result links
+    are unique per query unless `shared_pages` is set.
+    """
+    page_latency = latency if page_latency is None else page_latency
+    stub = FastAPI()
+
+    @stub.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        suffix = "" if shared_pages else f"?q={quote(body['q'])}"
+        organic = [
+            {
+                "title": f"Result {i} for {body['q']}",
+                "link": f"http://127.0.0.1:{STUB_PORT}/page/{i}{suffix}",
+                "snippet": f"Snippet {i} about {body['q']}. " * 4,
+            }
+            for i in range(body.get("num", 10))
+        ]
+        return {"organic": organic, "topStories": [], "images": []}
+
+    @stub.get("/page/{n}")
+    async def page(n: int, q: str = ""):
+        await asyncio.sleep(page_latency)
+        paragraphs = "".join(f"<p>Paragraph {i} of page {n} {q}. " + "lorem ipsum " * 20 + "</p>" for i in range(40))
+        return HTMLResponse(f"<html><body><nav>menu</nav><article>{paragraphs}</article></body></html>")
+
+    @stub.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency + (hiccup_delay if random.random() < hiccup_rate else 0.0))
+        base = {"id": "stub", "created": int(time.time()), "model": body["model"]}
+        if not body.get("stream"):
+            content = json.dumps({"followUp": ["one?", "two?", "three?"]}).decode()
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            }
+
+        async def stream():
+            for i in range(tokens):
+                await asyncio.sleep(token_delay)
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": None}]}
+                yield b"data: " + json.dumps(chunk) + b"\n\n"
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return stub
+
+
+def serve_in_thread(app, port: int) -> uvicorn.Server:
+    """Run `app` with uvicorn in a daemon thread and wait until it accepts requests."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def load_app(mode: str):
+    """Import the app against the stub; in blocking mode, route the pipeline through the sync clients."""
+    os.environ["SERPER_API_URL"] = f"http://127.0.0.1:{STUB_PORT}/search"
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+    # A persistent page cache would serve the pages scraped by earlier runs
+    os.environ["PAGE_CACHE_BACKEND"] = "memory"
+    os.environ.setdefault("SERPER_API_KEY", "bench")
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+
+    import api.index as index
+    from api import groq_llm, sources_manipulation, sources_searcher
+
+    if mode == "blocking":
+        async def blocking_sources(*args):
+            return sources_searcher.get_sources(*args)
+
+        async def blocking_populate(sources, num_elements, selected=None):
+            return sources_manipulation.populate_sources(sources, num_elements)
+
+        async def blocking_answer(*args):
+            for chunk in groq_llm.get_answer(*args):
+                yield chunk
+
+        async def blocking_relevant(*args):
+            return groq_llm.get_relevant_questions(*args)
+
+        index.aget_sources = blocking_sources
+        # Imported lazily by the pipeline, so it is patched on its own module
+        sources_manipulation.apopulate_sources = blocking_populate
+        index.aget_answer = blocking_answer
+        index.aget_relevant_questions = blocking_relevant
+
+    return index.app
+
+
+async def one_request(client: httpx.AsyncClient, i: int, pro_mode: bool, progressive: bool = False) -> tuple:
+    """Stream one search to completion; return (time to first byte, time to `finished`, total time)."""
+    params = {"query": f"benchmark query {i}", "date_context": "2026-01-01",
+              "stored_location": "us", "pro_mode": str(pro_mode).lower(), "progressive": str(progressive).lower()}
+    start = time.perf_counter()
+    ttfb = finished = None
+    async with client.stream("GET", f"http://127.0.0.1:{APP_PORT}/api/search", params=params) as response:
+        async for line in response.aiter_lines():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            if finished is None and line.startswith('data:{"type":"finished"'):
+                finished = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return ttfb, finished or total, total
+
+
+async def run_load(concurrency: int, total: int, pro_mode: bool, progressive: bool = False) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        async def bounded(i):
+            async with semaphore:
+                return await one_request(client, i, pro_mode, progressive)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    print(f"requests={total} concurrency={concurrency} wall={elapsed:.2f}s "
+          f"throughput={total / elapsed:.1f} req/s")
+    for label, column in (("ttfb", 0), ("finished", 1), ("total", 2)):
+        values = sorted(r[column] for r in results)
+        print(f"{label:<8} p50={statistics.median(values) * 1000:.0f}ms "
+              f"p95={values[max(int(len(values) * 0.95) - 1, 0)] * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["async", "blocking"], default="async")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.3, help="Upstream latency per call in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Delay between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per streamed answer")
+    parser.add_argument("--page-latency", type=float, default=None, help="Latency of scraped pages (defaults to --latency)")
+    parser.add_argument("--pro-mode", action="store_true")
+    parser.add_argument("--progressive", action="store_true", help="Start pro-mode answers before scraping completes")
+    parser.add_argument("--hiccup-rate", type=float, default=0.0, help="Fraction of LLM calls with a late first token")
+    parser.add_argument("--hiccup-delay", type=float, default=2.0, help="Extra delay of those calls in seconds")
+    parser.add_argument("--hedge", action="store_true", help="Use two LLM backends with hedged requests")
+    parser.add_argument("--sequential-follow-ups", action="store_true",
+                        help="Generate follow-up questions after the answer (previous behaviour)")
+    parser.add_argument("--shared-pages", action="store_true",
+                        help="Link every query to the same pages (measures the page cache)")
+    args = parser.parse_args()
+
+    if args.sequential_follow_ups:
+        os.environ["PARALLEL_FOLLOW_UPS"] = "0"
+    if args.hedge:
+        # Second backend: the stub's OpenAI-compatible endpoint
+        os.environ["LLM_BACKENDS"] = "groq,openai"
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/openai/v1"
+        os.environ["OPENAI_MODEL"] = "stub-model"
+
+    serve_in_thread(build_stub_app(args.latency, args.token_delay, args.tokens, args.page_latency,
+                                  args.hiccup_rate, args.hiccup_delay, args.shared_pages), STUB_PORT)
+    serve_in_thread(load_app(args.mode), APP_PORT)
+    print(f"mode={args.mode} pro_mode={args.pro_mode} progressive={args.progressive} upstream_latency={args.latency}s")
+    asyncio.run(run_load(args.concurrency, args.requests, args.pro_mode, args.progressive))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Offline replay and workload profile of a request log.
+
+Reads a JSONL request log, replays it against /api/search at one or more speed-up
+factors (the gaps between requests are divided by the factor, so arrivals stay
+open-loop), and reports:
+
+- latency (time to first byte and first answer token, total) and errors per factor
+- stage flame graphs: the app runs with PROFILER_ENABLED=1 and the folded stacks of
+  /api/profile are written to `<out>/profile-<factor>x.folded` (`--out`, a new temporary
+  directory by default; render them with flamegraph.pl or https://www.speedscope.app),
+  with the samples per stage printed
+- cache-hit potential: queries repeated within SEARCH_CACHE_TTL, URLs returned more
+  than once (page cache), and the hits the app's caches actually got (the local app is
+  restarted for every factor, so each run starts cold)
+- duplicate-URL rate: the share of distinct result URLs returned for more than one query
+
+Each log line is one request. The query is read from `query`, `q` or `title` (so the
+repo's requests.jsonl works as a sample log), the arrival time from `ts`, `timestamp`
+or `time` (epoch seconds or ISO 8601; lines without one are `--interval` seconds
+apart), and `pro_mode`, `stored_location` and `date_context` are used when present.
+
+By default the app is started in a subprocess against the stub of
+benchmarks/replay_search.py (recorded responses where available, synthetic otherwise),
+so no API keys are needed; `--url` replays against a running deployment instead.
+
+    python benchmarks/replay_log.py requests.jsonl --speedup 1,10,50 --out profile-out
+    python benchmarks/replay_log.py traffic.jsonl --url http://localhost:8000 --speedup 1
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import orjson as json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_search import APP_PORT, STUB_PORT, serve_in_thread  # noqa: E402
+from replay_search import RECORDINGS_PATH, Latency, build_stub_app, load_recordings, percentile  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_PATH = os.path.join(REPO_ROOT, "requests.jsonl")
+METRIC_LINE = re.compile(r'^open_perplex_cache_requests_total\{cache="([^"]+)",result="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+
+def parse_time(value):
+    """Epoch seconds from a number or an ISO 8601 string."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def load_log(path: str, interval: float, limit: int = None) -> list[dict]:
+    """Reads the log into requests with an `offset` in seconds from the first one."""
+    entries = []
+    with open(path, "rb") as log:
+        for line in log:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query = record.get("query") or record.get("q") or record.get("title")
+            if not query:
+                continue
+            entries.append({
+                "query": query,
+                "pro_mode": bool(record.get("pro_mode", False)),
+                "stored_location": record.get("stored_location", "us"),
+                "date_context": record.get("date_context") or datetime.now().strftime("%Y-%m-%d"),
+                "ts": parse_time(record.get("ts", record.get("timestamp", record.get("time")))),
+            })
+            if limit and len(entries) >= limit:
+                break
+
+    timestamps = [entry["ts"] for entry in entries if entry["ts"] is not None]
+    first = min(timestamps) if timestamps else 0.0
+    for index, entry in enumerate(entries):
+        entry["offset"] = entry["ts"] - first if entry["ts"] is not None else index * interval
+    entries.sort(key=lambda entry: entry["offset"])
+    return entries
+
+
+def normalize(query: str) -> str:
+    # Same normalization as the search coalescing key in api/index.py
+    return " ".join(query.casefold().split())
+
+
+def query_repeats(entries: list[dict], ttl: float) -> dict:
+    """Exact repeats of a query, and repeats close enough to hit the search cache."""
+    last_seen = {}
+    repeats = within_ttl = 0
+    counts = Counter()
+    for entry in entries:
+        key = (normalize(entry["query"]), entry["pro_mode"], entry["stored_location"])
+        counts[key[0]] += 1
+        if key in last_seen:
+            repeats += 1
+            if entry["offset"] - last_seen[key] <= ttl:
+                within_ttl += 1
+        last_seen[key] = entry["offset"]
+    total = len(entries) or 1
+    return {
+        "requests": len(entries),
+        "distinct_queries": len(counts),
+        "repeat_rate": round(repeats / total, 4),
+        "search_cache_hit_potential": round(within_ttl / total, 4),
+        "top_queries": [[query, count] for query, count in counts.most_common(10) if count > 1],
+    }
+
+
+def original_link(link: str) -> str:
+    """Undoes the stub's rewriting of result links to its own /page endpoint."""
+    parts = urlsplit(link)
+    if parts.path == "/page" and parts.netloc == f"127.0.0.1:{STUB_PORT}":
+        return parse_qs(parts.query).get("url", [link])[0]
+    return link
+
+
+def url_stats(results: list[dict]) -> dict:
+    """How often result URLs repeat, overall (page cache potential) and across different queries."""
+    occurrences = 0
+    queries_per_url = defaultdict(set)
+    domains = Counter()
+    for result in results:
+        for link in result["links"]:
+            occurrences += 1
+            queries_per_url[link].add(normalize(result["query"]))
+            domains[urlsplit(link).netloc] += 1
+    distinct = len(queries_per_url)
+    shared = sum(1 for queries in queries_per_url.values() if len(queries) > 1)
+    return {
+        "url_occurrences": occurrences,
+        "distinct_urls": distinct,
+        "page_cache_hit_potential": round((occurrences - distinct) / occurrences, 4) if occurrences else 0.0,
+        "cross_query_duplicate_rate": round(shared / distinct, 4) if distinct else 0.0,
+        "top_domains": domains.most_common(10),
+    }
+
+
+async def one_request(client: httpx.AsyncClient, base_url: str, entry: dict) -> dict:
+    params = {"query": entry["query"], "date_context": entry["date_context"],
+              "stored_location": entry["stored_location"], "pro_mode": str(entry["pro_mode"]).lower()}
+    start = time.perf_counter()
+    ttfb = ttft = None
+    error = False
+    links = []
+    try:
+        async with client.stream("GET", f"{base_url}/api/search", params=params) as response:
+            async for line in response.aiter_lines():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                if line.startswith('data:{"type":"sources"'):
+                    data = json.loads(line[5:])["data"]
+                    links = [original_link(item["link"]) for item in data.get("organic") or [] if item and item.get("link")]
+                elif ttft is None and line.startswith('data:{"type":"llm"'):
+                    ttft = time.perf_counter() - start
+                elif line.startswith('data:{"type":"error"'):
+                    error = True
+    except httpx.HTTPError:
+        error = True
+    total = time.perf_counter() - start
+    return {"query": entry["query"], "ttfb": ttfb or total, "ttft": ttft or total, "total": total,
+            "error": error or ttft is None, "links": links}
+
+
+async def replay(entries: list[dict], base_url: str, speedup: float, max_in_flight: int) -> tuple:
+    """Sends each request at its offset divided by `speedup`; returns the results and the wall time."""
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    in_flight = asyncio.Semaphore(max_in_flight)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        async def scheduled(entry):
+            delay = start + entry["offset"] / speedup - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with in_flight:
+                return await one_request(client, base_url, entry)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(scheduled(entry) for entry in entries))
+        return results, time.perf_counter() - start
+
+
+def cache_counters(base_url: str) -> Counter:
+    try:
+        text = httpx.get(f"{base_url}/api/metrics", timeout=10).text
+    except httpx.HTTPError:
+        return Counter()
+    return Counter({(cache, result): float(value) for cache, result, value in METRIC_LINE.findall(text)})
+
+
+def fetch_profile(base_url: str, reset: bool = False):
+    """The app's folded stacks, or None if its profiler is disabled."""
+    try:
+        response = httpx.get(f"{base_url}/api/profile", params={"reset": str(reset).lower()}, timeout=30)
+    except httpx.HTTPError:
+        return None
+    return response.text if response.status_code == 200 else None
+
+
+def stage_totals(folded: str) -> dict:
+    totals = Counter()
+    for line in folded.splitlines():
+        stack, _, count = line.rpartition(" ")
+        totals[stack.split(";", 1)[0]] += int(count)
+    return dict(totals.most_common())
+
+
+def serve_stub(args) -> None:
+    """Serves the stub of Serper, the web and Groq in this process."""
+    rng = random.Random(args.seed)
+    stub = build_stub_app(
+        load_recordings(args.recordings),
+        Latency(args.search_latency, args.jitter, rng),
+        Latency(args.page_latency, args.jitter, rng),
+        Latency(args.ttft, args.jitter, rng),
+        args.token_delay,
+        args.tokens,
+    )
+    serve_in_thread(stub, STUB_PORT)
+
+
+def start_local_app() -> subprocess.Popen:
+    """Starts the app against the stub, with the profiler on, in a subprocess."""
+    env = {
+        **os.environ,
+        "SERPER_API_URL": f"http://127.0.0.1:{STUB_PORT}/search",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{STUB_PORT}",
+        "SERPER_API_KEY": os.getenv("SERPER_API_KEY", "replay"),
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "replay"),
+        "PROFILER_ENABLED": "1",
+        # Runs independent of each other, and every stub page is on one host
+        "PAGE_CACHE_BACKEND": os.getenv("PAGE_CACHE_BACKEND", "memory"),
+        "SCRAPE_PER_HOST_LIMIT": os.getenv("SCRAPE_PER_HOST_LIMIT", "1000"),
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(APP_PORT),
+         "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{APP_PORT}/api/up_test", timeout=1).status_code == 200:
+                return app
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    app.kill()
+    raise SystemExit("The app did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", nargs="?", default=LOG_PATH, help="JSONL request log")
+    parser.add_argument("--speedup", default="1", help="Comma-separated speed-up factors, e.g. 1,10,50")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between requests without timestamps")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N requests")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="Cap on concurrent requests")
+    parser.add_argument("--url", help="Replay against this running app instead of a local one")
+    parser.add_argument("--out", help="Directory for the report and flame graph stacks (default: a new temporary one)")
+    parser.add_argument("--search-cache-ttl", type=float, default=float(os.getenv("SEARCH_CACHE_TTL", "300")))
+    parser.add_argument("--recordings", default=RECORDINGS_PATH)
+    parser.add_argument("--search-latency", type=float, default=0.4)
+    parser.add_argument("--page-latency", type=float, default=0.6)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entries = load_log(args.log, args.interval, args.limit)
+    if not entries:
+        raise SystemExit(f"No requests found in {args.log}")
+    factors = [float(factor) for factor in args.speedup.split(",") if factor.strip()]
+    if args.out is None:
+        args.out = tempfile.mkdtemp(prefix="replay-log-")
+    os.makedirs(args.out, exist_ok=True)
+
+    repeats = query_repeats(entries, args.search_cache_ttl)
+    span = entries[-1]["offset"]
+    print(f"{repeats['requests']} requests over {span:.0f}s, {repeats['distinct_queries']} distinct queries, "
+          f"repeat rate {repeats['repeat_rate']:.1%}, search cache hit potential {repeats['search_cache_hit_potential']:.1%}")
+
+    if not args.url:
+        serve_stub(args)
+    base_url = (args.url or f"http://127.0.0.1:{APP_PORT}").rstrip("/")
+    report = {"log": args.log, "queries": repeats, "runs": []}
+    app = None
+    try:
+        for factor in factors:
+            if not args.url:
+                # A fresh app per factor, so that each run starts with empty caches
+                app = start_local_app()
+            fetch_profile(base_url, reset=True)
+            hits_before = cache_counters(base_url)
+            results, elapsed = asyncio.run(replay(entries, base_url, factor, args.max_in_flight))
+            hits = cache_counters(base_url) - hits_before
+            folded = fetch_profile(base_url, reset=True)
+
+            run = {"speedup": factor, "wall_s": round(elapsed, 2), "errors": sum(r["error"] for r in results),
+                   "throughput_rps": round(len(results) / elapsed, 2),
+                   "cache": {f"{cache}_{result}": int(count) for (cache, result), count in sorted(hits.items())}}
+            for metric in ("ttfb", "ttft", "total"):
+                values = sorted(r[metric] for r in results)
+                run[metric] = {"p50_ms": round(statistics.median(values) * 1000, 1),
+                               "p95_ms": round(percentile(values, 0.95) * 1000, 1)}
+            if folded:
+                path = os.path.join(args.out, f"profile-{factor:g}x.folded")
+                with open(path, "w") as stacks:
+                    stacks.write(folded)
+                run["profile"] = path
+                run["stage_samples"] = stage_totals(folded)
+            if not report["runs"]:
+                report["urls"] = url_stats(results)
+            report["runs"].append(run)
+
+            print(f"\nspeed-up {factor:g}x: wall={run['wall_s']}s throughput={run['throughput_rps']} req/s "
+                  f"errors={run['errors']}")
+            for metric in ("ttfb", "ttft", "total"):
+                print(f"  {metric:<6} p50={run[metric]['p50_ms']:.0f}ms p95={run[metric]['p95_ms']:.0f}ms")
+            if run["cache"]:
+                print("  cache " + " ".join(f"{name}={count}" for name, count in run["cache"].items()))
+            if folded:
+                samples = sum(run["stage_samples"].values()) or 1
+                print("  stages " + " ".join(f"{stage}={count / samples:.0%}" for stage, count in run["stage_samples"].items())
+                      + f" -> {run['profile']}")
+            else:
+                print("  no profile (start the app with PROFILER_ENABLED=1)")
+            if app is not None:
+                app.kill()
+                app.wait()
+                app = None
+    finally:
+        if app is not None:
+            app.kill()
+            app.wait()
+
+    urls = report.get("urls", {})
+    print(f"\n{urls.get('distinct_urls', 0)} distinct URLs in {urls.get('url_occurrences', 0)} results: "
+          f"page cache hit potential {urls.get('page_cache_hit_potential', 0):.1%}, "
+          f"returned for several queries {urls.get('cross_query_duplicate_rate', 0):.1%}")
+    with open(os.path.join(args.out, "report.json"), "wb") as output:
+        output.write(json.dumps(report, option=json.OPT_INDENT_2))
+    print(f"report written to {os.path.join(args.out, 'report.json')}")
+
+
+if __name__ == "__main__":
+    main()
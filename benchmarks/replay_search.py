@@ -0,0 +1,326 @@
+"""
+End-to-end benchmark of /api/search driven by a query corpus.
+
+Replays the queries of `benchmarks/fixtures/queries.jsonl` through the full pipeline
+(search, scraping, context building, answer and follow-up streaming) with N concurrent
+clients. Serper, the scraped websites and Groq are replaced by a local stub serving the
+responses recorded in `benchmarks/fixtures/recordings.json`, each after a configurable
+latency; queries without a recording get deterministic synthetic responses.
+
+    python benchmarks/replay_search.py --concurrency 20 --requests 300
+    python benchmarks/replay_search.py --concurrency 20 --ttft 0.4 --page-latency 1.5 --json results.json
+
+Reports p50/p95/p99 time to first byte, time to first answer token and total latency,
+and the throughput. Search and page caches stay enabled, so repeated queries in the
+corpus behave as in production; `--cold` disables them.
+
+Recordings are made once with real API keys (SERPER_API_KEY, GROQ_API_KEY):
+
+    python benchmarks/replay_search.py --record
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from urllib.parse import quote
+
+import httpx
+import orjson as json
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_search import APP_PORT, STUB_PORT, load_app, serve_in_thread  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CORPUS_PATH = os.path.join(FIXTURES, "queries.jsonl")
+RECORDINGS_PATH = os.path.join(FIXTURES, "recordings.json")
+# Bytes of each page kept in a recording; the scraper stops reading long before this
+RECORDED_PAGE_BYTES = 256 * 1024
+# Finds the query in the user message built by api.groq_llm
+QUERY_PATTERN = re.compile(r"User (?:Question|Query): (.*?)\n")
+
+
+def load_corpus(path: str) -> list[dict]:
+    with open(path, "rb") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+
+def load_recordings(path: str) -> dict:
+    recordings = {"search": {}, "pages": {}, "answers": {}, "follow_ups": {}}
+    if os.path.exists(path):
+        with open(path, "rb") as stored:
+            recordings.update(json.loads(stored.read()))
+    return recordings
+
+
+def answer_key(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+class Latency:
+    """Upstream delay with optional multiplicative jitter (uniform in ±jitter)."""
+
+    def __init__(self, seconds: float, jitter: float, rng: random.Random):
+        self.seconds = seconds
+        self.jitter = jitter
+        self.rng = rng
+
+    async def wait(self) -> None:
+        delay = self.seconds * (1 + self.rng.uniform(-self.jitter, self.jitter))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def synthetic_search(query: str, num: int) -> dict:
+    """Serper-shaped response for a query without a recording."""
+    seed = hashlib.sha1(query.encode()).hexdigest()[:8]
+    organic = [
+        {"title": f"{query.title()} - source {i}", "link": f"https://example-{seed}-{i % 4}.com/article/{i}",
+         "snippet": f"Result {i} explains {query}. It covers background, recent developments and details. " * 2,
+         "date": "Jan 10, 2026"}
+        for i in range(num)
+    ]
+    return {"organic": organic, "answerBox": {"snippet": f"A short answer about {query}."}}
+
+
+def synthetic_page(url: str) -> bytes:
+    paragraphs = "".join(
+        f"<p>Section {i} of {url}. " + "The article discusses the topic in depth with examples. " * 8 + "</p>"
+        for i in range(30)
+    )
+    return (f"<html><head><script>var x = 1;</script></head><body><nav>Home | About</nav>"
+            f"<article>{paragraphs}</article><footer>Footer</footer></body></html>").encode()
+
+
+def synthetic_answer(query: str, tokens: int) -> list[str]:
+    words = f"Here is what the sources say about {query}. ".split() + ["detail"] * tokens
+    return [word + " " for word in words[:tokens]]
+
+
+def build_stub_app(recordings: dict, search_latency: Latency, page_latency: Latency, ttft: Latency,
+                   token_delay: float, tokens: int) -> FastAPI:
+    """Stub of Serper, the web and Groq that serves `recordings` after the configured latencies."""
+    from api.sources_searcher import cache_key
+
+    stub = FastAPI()
+    page_base = f"http://127.0.0.1:{STUB_PORT}/page?url="
+
+    @stub.post("/search")
+    async def search(request: Request):
+        payload = await request.json()
+        await search_latency.wait()
+        data = recordings["search"].get(cache_key(payload)) or synthetic_search(payload["q"], payload.get("num", 10))
+        # Scrapes of the results are served by this stub too
+        organic = [{**item, "link": page_base + quote(item["link"], safe="")} for item in data.get("organic", [])]
+        return {**data, "organic": organic}
+
+    @stub.get("/page")
+    async def page(url: str):
+        await page_latency.wait()
+        html = recordings["pages"].get(url)
+        return HTMLResponse(html if html is not None else synthetic_page(url))
+
+    @stub.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        match = QUERY_PATTERN.search(body["messages"][-1]["content"])
+        key = answer_key(match.group(1)) if match else ""
+        base = {"id": "stub", "created": int(time.time()), "model": body["model"]}
+        await ttft.wait()
+
+        if not body.get("stream"):
+            content = recordings["follow_ups"].get(key) or json.dumps(
+                {"followUp": [f"What else about {key}?", f"Latest on {key}?", f"Why does {key} matter?"]}
+            ).decode()
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            }
+
+        deltas = recordings["answers"].get(key) or synthetic_answer(key, tokens)
+
+        async def stream():
+            for i, delta in enumerate(deltas):
+                if i:
+                    await asyncio.sleep(token_delay)
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                yield b"data: " + json.dumps(chunk) + b"\n\n"
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return stub
+
+
+def record(corpus: list[dict], path: str) -> None:
+    """
+    Calls the real Serper, websites and Groq for every distinct corpus query and stores the
+    raw responses, so later runs replay real payload sizes and answer lengths offline.
+    """
+    from api.build_context import build_context
+    from api.extract_content_from_website import html_to_text, truncate_content
+    from api.groq_llm import get_answer, get_relevant_questions
+    from api.http_client import USER_AGENT
+    from api.index import PRO_MODE_PAGES
+    from api.sources_searcher import API_URL, HEADERS, build_payload, cache_key, parse_results
+
+    if not os.getenv("SERPER_API_KEY") or not os.getenv("GROQ_API_KEY"):
+        raise SystemExit("Recording needs SERPER_API_KEY and GROQ_API_KEY")
+
+    recordings = load_recordings(path)
+    with httpx.Client(timeout=15, follow_redirects=True, headers={"User-Agent": USER_AGENT}) as client:
+        for entry in corpus:
+            payload = build_payload(entry["query"], entry["pro_mode"], entry["stored_location"])
+            key = cache_key(payload)
+            if key in recordings["search"]:
+                continue
+            print(f"recording {entry['query']!r}")
+            data = client.post(API_URL, headers=HEADERS, json=payload).json()
+            recordings["search"][key] = data
+
+            sources = parse_results(data)
+            if entry["pro_mode"]:
+                for item in sources["organic"][:PRO_MODE_PAGES]:
+                    try:
+                        response = client.get(item["link"])
+                        html = response.content[:RECORDED_PAGE_BYTES].decode(response.encoding or "utf-8", "replace")
+                    except httpx.HTTPError as e:
+                        print(f"  could not fetch {item['link']}: {e}")
+                        continue
+                    recordings["pages"][item["link"]] = html
+                    item["html"] = truncate_content(html_to_text(html))
+
+            contexts = build_context(sources, entry["query"], entry["pro_mode"], entry["date_context"])
+            recordings["answers"][answer_key(entry["query"])] = list(
+                get_answer(entry["query"], contexts, entry["date_context"])
+            )
+            recordings["follow_ups"][answer_key(entry["query"])] = get_relevant_questions(contexts, entry["query"])
+
+    with open(path, "wb") as stored:
+        stored.write(json.dumps(recordings, option=json.OPT_INDENT_2))
+    print(f"saved {len(recordings['search'])} searches and {len(recordings['pages'])} pages to {path}")
+
+
+async def one_request(client: httpx.AsyncClient, entry: dict) -> dict:
+    """Stream one search to completion and time it."""
+    params = {"query": entry["query"], "date_context": entry["date_context"],
+              "stored_location": entry["stored_location"], "pro_mode": str(entry["pro_mode"]).lower()}
+    start = time.perf_counter()
+    ttfb = ttft = None
+    error = False
+    async with client.stream("GET", f"http://127.0.0.1:{APP_PORT}/api/search", params=params) as response:
+        async for line in response.aiter_lines():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            if ttft is None and line.startswith('data:{"type":"llm"'):
+                ttft = time.perf_counter() - start
+            if line.startswith('data:{"type":"error"'):
+                error = True
+    total = time.perf_counter() - start
+    return {"ttfb": ttfb or total, "ttft": ttft or total, "total": total, "error": error or ttft is None}
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(math.ceil(len(values) * fraction) - 1, 0)] if values else 0.0
+
+
+async def run_replay(corpus: list[dict], concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        async def bounded(i):
+            async with semaphore:
+                return await one_request(client, corpus[i % len(corpus)])
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    report = {"requests": total, "concurrency": concurrency, "wall_s": round(elapsed, 3),
+              "throughput_rps": round(total / elapsed, 2), "errors": sum(r["error"] for r in results)}
+    for metric in ("ttfb", "ttft", "total"):
+        values = sorted(r[metric] for r in results)
+        report[metric] = {
+            "p50_ms": round(statistics.median(values) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"requests={report['requests']} concurrency={report['concurrency']} wall={report['wall_s']:.2f}s "
+          f"throughput={report['throughput_rps']:.1f} req/s errors={report['errors']}")
+    for metric in ("ttfb", "ttft", "total"):
+        values = report[metric]
+        print(f"{metric:<6} p50={values['p50_ms']:.0f}ms p95={values['p95_ms']:.0f}ms p99={values['p99_ms']:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="JSONL file of {query, pro_mode, stored_location, date_context}")
+    parser.add_argument("--recordings", default=RECORDINGS_PATH)
+    parser.add_argument("--record", action="store_true", help="Record real responses for the corpus and exit")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=None, help="Requests to send (default: one pass over the corpus)")
+    parser.add_argument("--search-latency", type=float, default=0.4, help="Serper latency in seconds")
+    parser.add_argument("--page-latency", type=float, default=0.6, help="Latency of each scraped page")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Groq time to first token")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Delay between streamed answer chunks")
+    parser.add_argument("--tokens", type=int, default=200, help="Chunks of a synthetic answer")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative jitter applied to every latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold", action="store_true", help="Disable the search and page caches")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if args.record:
+        record(corpus, args.recordings)
+        return
+
+    # Keep runs independent of each other: no page cache persisted on disk between runs
+    os.environ.setdefault("PAGE_CACHE_BACKEND", "memory")
+    # Every page is served from the stub's single host; lift the per-host limit meant for real sites
+    os.environ.setdefault("SCRAPE_PER_HOST_LIMIT", "1000")
+    if args.cold:
+        os.environ["SEARCH_CACHE_SIZE"] = "0"
+        os.environ["PAGE_CACHE_SIZE"] = "0"
+
+    rng = random.Random(args.seed)
+    recordings = load_recordings(args.recordings)
+    app = load_app("async")
+    stub = build_stub_app(
+        recordings,
+        Latency(args.search_latency, args.jitter, rng),
+        Latency(args.page_latency, args.jitter, rng),
+        Latency(args.ttft, args.jitter, rng),
+        args.token_delay,
+        args.tokens,
+    )
+    serve_in_thread(stub, STUB_PORT)
+    serve_in_thread(app, APP_PORT)
+
+    print(f"corpus={len(corpus)} queries recorded={len(recordings['search'])} cold={args.cold}")
+    report = asyncio.run(run_replay(corpus, args.concurrency, args.requests or len(corpus)))
+    print_report(report)
+    if args.json:
+        with open(args.json, "wb") as output:
+            output.write(json.dumps(report, option=json.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+SSE streaming overhead benchmark for /api/search.
+
+Measures what streaming an answer costs the app itself: SSE events per second and CPU
+time per stream, with answers coming from the in-process stub LLM backend (so model
+latency and upstream calls are out of the picture) and Serper served by the local stub
+of benchmarks/load_search.py. Each configuration runs the app in its own process, whose
+CPU time is read from /proc (Linux):
+
+- `per-delta`: every LLM delta is its own SSE event (SSE_FLUSH_WINDOW=0)
+- `batched`: deltas are coalesced within SSE_FLUSH_WINDOW / SSE_FLUSH_CHARS
+
+It also times the framing of one delta, the old way (dict, `json.dumps().decode()`
+and an f-string, encoded again by the server) against `api.sse.text_event`.
+
+    python benchmarks/sse_stream.py --concurrency 20 --requests 100 --tokens 600 --token-delay 0.002
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+import httpx
+import orjson as json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_search import APP_PORT, STUB_PORT, build_stub_app, load_app, serve_in_thread  # noqa: E402
+
+CONFIGS = {
+    "per-delta": {"SSE_FLUSH_WINDOW": "0"},
+    "batched": {},
+}
+
+
+def serve(args) -> None:
+    """Runs the stub and the app in this process until it is killed."""
+    os.environ["LLM_BACKENDS"] = "stub"
+    os.environ["STUB_LLM_TTFT"] = str(args.ttft)
+    os.environ["STUB_LLM_TOKEN_DELAY"] = str(args.token_delay)
+    os.environ["STUB_LLM_TOKENS"] = str(args.tokens)
+    serve_in_thread(build_stub_app(0.01, 0.0, 0), STUB_PORT)
+    serve_in_thread(load_app("async"), APP_PORT)
+    print("ready", flush=True)
+    while True:
+        time.sleep(3600)
+
+
+def cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of a process, from /proc/<pid>/stat."""
+    with open(f"/proc/{pid}/stat") as stat:
+        # The command name may contain spaces; the fields after it do not
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def one_stream(client: httpx.AsyncClient, i: int) -> dict:
+    start = time.perf_counter()
+    first_text = None
+    frames = text_frames = size = 0
+    params = {"query": f"sse benchmark {i}", "date_context": "2026-01-01", "stored_location": "us"}
+    async with client.stream("GET", f"http://127.0.0.1:{APP_PORT}/api/search", params=params) as response:
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            frames += chunk.count(b"\n\n")
+            llm = chunk.count(b'"type":"llm"')
+            if llm and first_text is None:
+                first_text = time.perf_counter() - start
+            text_frames += llm
+    return {"frames": frames, "text_frames": text_frames, "bytes": size,
+            "first_text": first_text or 0.0, "total": time.perf_counter() - start}
+
+
+async def drive(concurrency: int, total: int) -> tuple:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(i):
+            async with semaphore:
+                return await one_stream(client, i)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(total)))
+        return results, time.perf_counter() - started
+
+
+def run_config(name: str, args) -> dict:
+    env = {**os.environ, **CONFIGS[name]}
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--tokens", str(args.tokens),
+               "--token-delay", str(args.token_delay), "--ttft", str(args.ttft)]
+    server = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        if server.stdout.readline().strip() != "ready":
+            raise SystemExit(f"{name}: the app did not start")
+        # Warm up imports, tokenizers and connection pools outside the measurement
+        asyncio.run(drive(2, 2))
+        cpu_before = cpu_seconds(server.pid)
+        results, elapsed = asyncio.run(drive(args.concurrency, args.requests))
+        cpu = cpu_seconds(server.pid) - cpu_before
+    finally:
+        server.kill()
+        server.wait()
+
+    frames = sum(result["frames"] for result in results)
+    return {
+        "config": name,
+        "streams": len(results),
+        "events_per_stream": frames / len(results),
+        "text_events_per_stream": sum(result["text_frames"] for result in results) / len(results),
+        "events_per_second": frames / elapsed,
+        "cpu_ms_per_stream": cpu * 1000 / len(results),
+        "bytes_per_stream": sum(result["bytes"] for result in results) / len(results),
+        "first_text_p50_ms": statistics.median(result["first_text"] for result in results) * 1000,
+        "total_p50_ms": statistics.median(result["total"] for result in results) * 1000,
+    }
+
+
+def framing_micro(count: int = 200_000) -> dict:
+    """Microseconds to frame one delta, old f-string path versus bytes."""
+    from api.sse import text_event
+
+    delta = " token"
+    old = timeit.timeit(lambda: f"data:{json.dumps({'type': 'llm', 'text': delta}).decode()}\n\n".encode("utf-8"),
+                        number=count)
+    new = timeit.timeit(lambda: text_event("llm", delta), number=count)
+    return {"f-string": old / count * 1e6, "bytes": new / count * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--tokens", type=int, default=600, help="Deltas per answer")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="Delay between deltas")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Stub time to first token")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    micro = framing_micro()
+    print(f"framing one delta: f-string {micro['f-string']:.2f}us, bytes {micro['bytes']:.2f}us")
+    print(f"{'config':<10} {'events/stream':>13} {'text events':>11} {'events/s':>9} {'CPU ms/stream':>13} "
+          f"{'KB/stream':>9} {'first text p50':>14} {'total p50':>10}")
+    for name in CONFIGS:
+        report = run_config(name, args)
+        print(f"{report['config']:<10} {report['events_per_stream']:>13.0f} {report['text_events_per_stream']:>11.0f} "
+              f"{report['events_per_second']:>9.0f} {report['cpu_ms_per_stream']:>13.1f} "
+              f"{report['bytes_per_stream'] / 1024:>9.1f} {report['first_text_p50_ms']:>12.0f}ms "
+              f"{report['total_p50_ms']:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# The LLM modules check for API keys of the configured backends on import
+os.environ.setdefault("LLM_BACKENDS", "stub")
+os.environ.setdefault("PAGE_CACHE_BACKEND", "memory")
@@ -0,0 +1,57 @@
+import numpy as np
+
+from api.answer_cache import AnswerCache
+
+PARTITION = AnswerCache.partition_key("2026-10-17", "us", False)
+
+
+def vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    # Random directions in 64 dimensions are far from each other
+    vectors = rng.normal(size=(count, 64)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def fill(cache, vectors, partition=PARTITION, start=0):
+    for i, vector in enumerate(vectors, start):
+        cache.set(vector, f"question {i}", partition, {"answer": [f"answer {i}"]})
+
+
+def cached(cache, vectors, partition=PARTITION, start=0):
+    # Question numbers are part of the match, so each vector is looked up with its own question
+    return [i for i, vector in enumerate(vectors, start) if cache.get(vector, f"question {i}", partition) is not None]
+
+
+def test_full_cache_keeps_most_of_a_single_partition():
+    cache = AnswerCache(maxsize=100)
+    queries = vectors(150)
+    fill(cache, queries[:100])
+    fill(cache, queries[100:], start=100)
+    # Overflowing by 50 evicts the oldest entries in batches, never the whole partition
+    kept = cached(cache, queries)
+    assert 90 <= len(kept) <= 100
+    assert kept[-50:] == list(range(100, 150))
+    assert cache.stats()["size"] == len(kept)
+
+
+def test_recently_used_entries_survive_eviction():
+    cache = AnswerCache(maxsize=10)
+    queries = vectors(11)
+    fill(cache, queries[:10])
+    # Question 0 is the oldest entry but was just used
+    assert cached(cache, queries[:1]) == [0]
+    fill(cache, queries[10:], start=10)
+    assert cached(cache, queries) == [0] + list(range(2, 11))
+
+
+def test_eviction_spans_partitions_and_drops_empty_ones():
+    cache = AnswerCache(maxsize=10)
+    old_day = AnswerCache.partition_key("2026-10-16", "us", False)
+    queries = vectors(12)
+    fill(cache, queries[:2], old_day)
+    fill(cache, queries[2:10], start=2)
+    fill(cache, queries[10:], start=10)
+    # The two entries of the older partition were the least recently used
+    assert cached(cache, queries[:2], old_day) == []
+    assert old_day not in cache._partitions
+    assert cached(cache, queries[2:], start=2) == list(range(2, 12))
@@ -0,0 +1,109 @@
+import asyncio
+
+import orjson as json
+import pytest
+
+from api import index
+from api.index import BatchSearchRequest
+
+
+def batch(queries, concurrency=None):
+    return BatchSearchRequest(queries=queries, date_context="2026-10-17", stored_location="us", concurrency=concurrency)
+
+
+async def lines(response, limit=None):
+    """Result lines of an NDJSON response; closes it (like a client going away) after `limit`."""
+    results = []
+    async for line in response.body_iterator:
+        results.append(json.loads(line))
+        if len(results) == limit:
+            await response.body_iterator.aclose()
+            break
+    return results
+
+
+@pytest.fixture
+def fake_queries(monkeypatch):
+    """batch_search stand-in: query "<seconds>" takes that long; records concurrency and cancellations."""
+    state = {"running": 0, "most": 0, "started": [], "cancelled": []}
+
+    async def batch_search(position, query, date_context, stored_location, pro_mode):
+        state["started"].append(position)
+        state["running"] += 1
+        state["most"] = max(state["most"], state["running"])
+        try:
+            await asyncio.sleep(float(query))
+            return {"index": position, "query": query}
+        except asyncio.CancelledError:
+            state["cancelled"].append(position)
+            raise
+        finally:
+            state["running"] -= 1
+
+    monkeypatch.setattr(index, "batch_search", batch_search)
+    return state
+
+
+def test_results_stream_in_completion_order(fake_queries):
+    async def scenario():
+        return await lines(await index.ask_batch(batch(["0.3", "0.1", "0.2"])))
+
+    assert [result["index"] for result in asyncio.run(scenario())] == [1, 2, 0]
+
+
+@pytest.mark.parametrize("requested, limit, expected", [(50, 3, 3), (2, 3, 2), (-1, 3, 1), (None, 3, 3)])
+def test_concurrency_is_clamped(monkeypatch, fake_queries, requested, limit, expected):
+    monkeypatch.setattr(index, "BATCH_CONCURRENCY", limit)
+
+    async def scenario():
+        return await lines(await index.ask_batch(batch(["0.02"] * 8, concurrency=requested)))
+
+    assert len(asyncio.run(scenario())) == 8
+    assert fake_queries["most"] == expected
+
+
+def test_disconnect_cancels_remaining_queries(fake_queries):
+    async def scenario():
+        results = await lines(await index.ask_batch(batch(["0.01", "5", "5", "5"], concurrency=2)), limit=1)
+        # A cancelled query frees its slot; the queued one must not take it
+        await asyncio.sleep(0.05)
+        return results
+
+    assert [result["index"] for result in asyncio.run(scenario())] == [0]
+    assert sorted(fake_queries["cancelled"]) == [1, 2]
+    assert sorted(fake_queries["started"]) == [0, 1, 2] and fake_queries["running"] == 0
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Stub search, context, answer and follow-ups; the query "fail" makes the search raise."""
+    async def aget_sources(query, pro_mode, stored_location):
+        if query == "fail":
+            raise RuntimeError("Serper is down")
+        return {"organic": [{"title": "A page", "link": "https://example.test/", "snippet": "text"}]}
+
+    async def aget_answer(query, contexts, date_context):
+        for chunk in ("Answer ", "to ", query):
+            yield chunk
+
+    async def aget_relevant_questions(contexts, query):
+        return '{"followUp": ["more?"]}'
+
+    monkeypatch.setattr(index, "aget_sources", aget_sources)
+    monkeypatch.setattr(index, "build_context", lambda *args: ("context", {"tokens_used": 10}))
+    monkeypatch.setattr(index, "aget_answer", aget_answer)
+    monkeypatch.setattr(index, "aget_relevant_questions", aget_relevant_questions)
+    monkeypatch.setattr(index, "count_tokens", lambda pieces, model=None: [len(pieces)])
+
+
+def test_failed_and_empty_queries_get_error_lines(pipeline):
+    async def scenario():
+        return await lines(await index.ask_batch(batch(["solar", "fail", "  "])))
+
+    results = {result["index"]: result for result in asyncio.run(scenario())}
+    assert results[0]["answer"] == "Answer to solar" and results[0]["error"] is None
+    assert results[0]["relevant"] == {"followUp": ["more?"]}
+    assert results[0]["sources"] == [{"title": "A page", "link": "https://example.test/"}]
+    assert results[1]["answer"] == "" and results[1]["error"]
+    assert results[2] == {"index": 2, "query": "  ", "answer": "", "sources": [], "relevant": [], "timings": {},
+                          "error": "Query cannot be empty"}
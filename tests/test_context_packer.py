@@ -0,0 +1,63 @@
+import pytest
+
+from api import context_packer
+from api.context_packer import bundle_encoding, load_bundled_encoding, pack_context
+
+
+class WordEncoding:
+    """One token per word."""
+
+    def encode_ordinary_batch(self, pieces):
+        return [piece.split() for piece in pieces]
+
+
+@pytest.fixture
+def words(monkeypatch):
+    monkeypatch.setattr(context_packer, "get_encoding", lambda model: WordEncoding())
+
+
+def test_pieces_are_packed_in_tier_order_within_the_budget(words):
+    tiers = [["answer box text"], ["one two", "three four five"], ["six"]]
+    context, stats = pack_context(tiers, token_budget=10)
+    assert context == "answer box text\n\none two\n\nthree four five"
+    # 3 + 1 + 2 + 1 + 3 tokens, separators included
+    assert stats["tokens_used"] == 10 and stats["pieces_used"] == 3
+    assert stats["pieces_dropped"] == 1 and not stats["estimated"]
+
+
+def test_smaller_pieces_after_one_that_does_not_fit_are_packed(words):
+    tiers = [["a b c", "d e f g h i", "j"]]
+    context, stats = pack_context(tiers, token_budget=6)
+    assert context == "a b c\n\nj"
+    assert stats["tokens_used"] == 5 and stats["tokens_dropped"] == 6
+
+
+def test_empty_pieces_are_skipped(words):
+    context, stats = pack_context([["", "a"], [None, "b"]], token_budget=10)
+    assert context == "a\n\nb" and stats["pieces_used"] == 2 and stats["pieces_dropped"] == 0
+
+
+def test_counts_are_estimated_without_a_tokenizer(monkeypatch):
+    monkeypatch.setattr(context_packer, "get_encoding", lambda model: None)
+    pieces = ["x" * 40, "y" * 40, "z" * 40]
+    context, stats = pack_context([pieces], token_budget=25)
+    # 11 estimated tokens each, plus a separator
+    assert context == "\n\n".join(pieces[:2])
+    assert stats["estimated"] and stats["tokens_used"] == 23
+
+
+def test_bundled_encoding_round_trip(monkeypatch, tmp_path):
+    tiktoken_ext = pytest.importorskip("tiktoken_ext.openai_public")
+    ranks = {bytes([byte]): byte for byte in range(256)}
+    ranks[b"ab"] = 256
+    monkeypatch.setitem(tiktoken_ext.ENCODING_CONSTRUCTORS, "test_base", lambda: {
+        "name": "test_base", "pat_str": r"\S+|\s+", "mergeable_ranks": ranks, "special_tokens": {"<|end|>": 257},
+    })
+    bundle_encoding("test_base", str(tmp_path))
+    encoding = load_bundled_encoding("test_base", str(tmp_path))
+    assert encoding.encode_ordinary("ab a") == [256, ord(" "), ord("a")]
+    assert encoding.encode("<|end|>", allowed_special="all") == [257]
+
+
+def test_missing_bundle_is_not_loaded(tmp_path):
+    assert load_bundled_encoding("cl100k_base", str(tmp_path)) is None
@@ -0,0 +1,60 @@
+import random
+
+from api.deduplication import deduplicate_tiers
+
+VOCABULARY = [f"word{i}" for i in range(5000)]
+
+
+def random_text(rng, words):
+    return [rng.choice(VOCABULARY) for _ in range(words)]
+
+
+def edited(rng, words, changes):
+    words = list(words)
+    for position in rng.sample(range(len(words)), changes):
+        words[position] = rng.choice(VOCABULARY)
+    return words
+
+
+def detected(words, changes, pairs=100, seed=0):
+    rng = random.Random(seed)
+    dropped = 0
+    for _ in range(pairs):
+        original = random_text(rng, words)
+        _, stats = deduplicate_tiers([[" ".join(original)], [" ".join(edited(rng, original, changes))]])
+        dropped += stats["duplicates_dropped"]
+    return dropped / pairs
+
+
+def test_lightly_edited_copies_are_dropped():
+    # Syndicated copies of a chunk or snippet with a word or two changed
+    assert detected(80, 1) >= 0.98
+    assert detected(80, 2) >= 0.98
+    assert detected(30, 1) >= 0.95
+    # Four of 80 words changed is around the similarity threshold
+    assert detected(80, 4) >= 0.7
+
+
+def test_distinct_pieces_are_kept():
+    rng = random.Random(1)
+    pieces = [" ".join(random_text(rng, 80)) for _ in range(200)]
+    tiers, stats = deduplicate_tiers([pieces])
+    assert tiers == [pieces]
+    assert stats["duplicates_dropped"] == 0
+    # Heavily rewritten copies are different pieces
+    assert detected(80, 16) == 0
+
+
+def test_first_occurrence_wins_across_tiers():
+    rng = random.Random(2)
+    original = random_text(rng, 60)
+    copy = " ".join(edited(rng, original, 1))
+    tiers, stats = deduplicate_tiers([["Answer box"], [" ".join(original)], [copy, "Short snippet"]])
+    assert tiers == [["Answer box"], [" ".join(original)], ["Short snippet"]]
+    assert stats == {"duplicates_dropped": 1, "dedup_chars_saved": len(copy)}
+
+
+def test_short_pieces_are_matched_exactly():
+    tiers, stats = deduplicate_tiers([["Paris", "paris ", "Lyon"]])
+    assert tiers == [["Paris", "Lyon"]]
+    assert stats["duplicates_dropped"] == 1
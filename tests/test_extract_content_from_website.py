@@ -0,0 +1,38 @@
+from api.extract_content_from_website import html_to_text
+
+
+def test_boilerplate_is_dropped():
+    html = """<html><head><title>Page</title><style>p { color: red }</style><script>var x = 1;</script></head>
+    <body><nav>Home | About</nav><p>First paragraph.</p><p>Second&nbsp;one &amp; more.</p>
+    <footer>Copyright</footer></body></html>"""
+    assert html_to_text(html) == "Page First paragraph. Second one & more."
+
+
+def test_whitespace_is_collapsed_and_blocks_separate_words():
+    html = "<div>one\n\n  two</div><div>three</div><span>fo</span><span>ur</span><br>five"
+    assert html_to_text(html) == "one two three four five"
+
+
+def test_content_inside_a_form_is_kept():
+    # ASP.NET WebForms pages wrap the whole body in a form
+    html = '<body><form id="aspnetForm" method="post"><h1>Title</h1><p>Body text.</p></form></body>'
+    assert html_to_text(html) == "Title Body text."
+
+
+def test_page_header_is_dropped_but_article_header_is_kept():
+    html = """<body><header><a href="/">Site name</a> Sign in</header>
+    <main><article><header><h1>Headline</h1><p>By someone</p></header><p>Story.</p></article></main>
+    <section><header>Section title</header>More.</section></body>"""
+    assert html_to_text(html) == "Headline By someone Story. Section title More."
+
+
+def test_nested_page_header_is_dropped():
+    html = "<header><div><header>Inner</header>Banner</div></header><p>Text</p>"
+    assert html_to_text(html) == "Text"
+
+
+def test_limit_stops_collecting_text():
+    html = "<p>" + "word " * 1000 + "</p>"
+    text = html_to_text(html, limit=50)
+    assert len(text) == 50
+    assert text.startswith("word word")
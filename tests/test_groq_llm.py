@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from api import groq_llm
+from api.groq_llm import FOLLOW_UP_SCHEMA, fallback_follow_ups, follow_up_response_format, parse_follow_ups
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_groq_llm(**env):
+    """Imports api.groq_llm in a fresh interpreter, since the key check runs on import."""
+    env = {**{k: v for k, v in os.environ.items() if k not in ("LLM_BACKENDS", "FOLLOW_UP_BACKENDS")},
+           "GROQ_API_KEY": "", **env}
+    return subprocess.run([sys.executable, "-c", "import api.groq_llm"], cwd=REPO_ROOT, env=env,
+                          capture_output=True, text=True)
+
+
+@pytest.mark.parametrize("env", [
+    {"LLM_BACKENDS": "groq"},
+    {"LLM_BACKENDS": "stub", "FOLLOW_UP_BACKENDS": "groq"},
+    {"LLM_BACKENDS": "stub, groq", "FOLLOW_UP_BACKENDS": "stub"},
+])
+def test_key_required_when_groq_answers_or_follows_up(env):
+    result = import_groq_llm(**env)
+    assert result.returncode != 0
+    assert "GROQ_API_KEY is not set" in result.stderr
+
+
+def test_key_not_required_without_groq():
+    assert import_groq_llm(LLM_BACKENDS="stub").returncode == 0
+    assert import_groq_llm(LLM_BACKENDS="stub", FOLLOW_UP_BACKENDS="stub").returncode == 0
+
+
+def test_valid_follow_ups_are_cleaned_and_capped():
+    text = json.dumps({"followUp": [" What is A? ", "", "What is B?", 3, "What is C?", "What is D?"]})
+    assert json.loads(parse_follow_ups(text, "q")) == {"followUp": ["What is A?", "What is B?", "What is C?"]}
+
+
+@pytest.mark.parametrize("text", [
+    '{"questions": ["What is A?"]}',  # wrong key
+    '{"followUp": "What is A?"}',  # not a list
+    '{"followUp": ["", 1]}',  # no usable question
+    '["What is A?"]',  # not an object
+    '{"followUp": ["What is A?"',  # truncated
+    "Here are some questions: What is A?",  # not JSON at all
+])
+def test_unusable_responses_fall_back(text):
+    assert parse_follow_ups(text, "solar panels") == fallback_follow_ups("solar panels")
+    assert len(json.loads(fallback_follow_ups("solar panels"))["followUp"]) == 3
+
+
+def test_response_format_is_json_mode_by_default(monkeypatch):
+    monkeypatch.setattr(groq_llm, "FOLLOW_UP_RESPONSE_FORMAT", "json_object")
+    assert follow_up_response_format() == {"type": "json_object"}
+
+
+def test_response_format_with_json_schema(monkeypatch):
+    monkeypatch.setattr(groq_llm, "FOLLOW_UP_RESPONSE_FORMAT", "json_schema")
+    response_format = follow_up_response_format()
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"] == {"name": "follow_ups", "schema": FOLLOW_UP_SCHEMA, "strict": True}
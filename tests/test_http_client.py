@@ -0,0 +1,107 @@
+import asyncio
+import socket
+
+import httpcore
+import pytest
+
+from api import http_client
+
+
+class FakeBackend:
+    """Connects to addresses in `reachable` and refuses the others."""
+
+    def __init__(self, reachable):
+        self.reachable = reachable
+        self.attempts = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.attempts.append(host)
+        if host not in self.reachable:
+            raise httpcore.ConnectError(f"{host} unreachable")
+        return f"stream to {host}"
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    monkeypatch.setattr(http_client, "_dns_cache", http_client._DNSCache(ttl=60, maxsize=2))
+    lookups = []
+
+    async def getaddrinfo(host, port, type=0):
+        lookups.append(host)
+        # An IPv6 address listed first, then IPv4; duplicates are collapsed
+        return [(socket.AF_INET6, type, 6, "", ("2001:db8::1", port, 0, 0)),
+                (socket.AF_INET, type, 6, "", ("192.0.2.1", port)),
+                (socket.AF_INET, type, 6, "", ("192.0.2.1", port))]
+
+    return lookups, getaddrinfo
+
+
+def test_falls_back_to_the_next_address_and_prefers_it(monkeypatch, resolver):
+    lookups, getaddrinfo = resolver
+    backend = http_client._CachingAsyncBackend()
+    backend._backend = FakeBackend({"192.0.2.1"})
+
+    async def scenario():
+        monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", getaddrinfo)
+        return [await backend.connect_tcp("example.test", 443) for _ in range(2)]
+
+    assert asyncio.run(scenario()) == ["stream to 192.0.2.1"] * 2
+    # One lookup; the unreachable address is only tried by the first connection
+    assert lookups == ["example.test"]
+    assert backend._backend.attempts == ["2001:db8::1", "192.0.2.1", "192.0.2.1"]
+
+
+def test_resolves_again_when_no_address_works(monkeypatch, resolver):
+    lookups, getaddrinfo = resolver
+    backend = http_client._CachingAsyncBackend()
+    backend._backend = FakeBackend(set())
+
+    async def scenario():
+        monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", getaddrinfo)
+        for _ in range(2):
+            with pytest.raises(httpcore.ConnectError):
+                await backend.connect_tcp("example.test", 443)
+
+    asyncio.run(scenario())
+    assert lookups == ["example.test", "example.test"]
+
+
+def test_cache_is_bounded():
+    cache = http_client._DNSCache(ttl=60, maxsize=2)
+    for host in ("a.test", "b.test", "c.test"):
+        cache.set(host, 443, [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", 443))])
+    assert cache.get("a.test", 443) is None
+    assert cache.get("c.test", 443) == ["192.0.2.1"]
+
+
+def test_clients_use_the_caching_backend():
+    client = http_client.get_sync_client()
+    assert isinstance(client._transport._pool._network_backend, http_client._CachingSyncBackend)
+
+
+
+@pytest.fixture
+def fresh_sync_client(monkeypatch):
+    """A new shared sync client, created without proxy settings unless the test sets some."""
+    for name in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "http_proxy", "https_proxy", "all_proxy"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(http_client, "_sync_client", None)
+    yield http_client.get_sync_client
+    if http_client._sync_client is not None:
+        http_client._sync_client.close()
+    monkeypatch.setattr(http_client, "_sync_client", None)
+
+
+@pytest.mark.parametrize("variable", ["HTTPS_PROXY", "http_proxy", "ALL_PROXY"])
+def test_proxy_settings_keep_httpx_transports(monkeypatch, fresh_sync_client, variable):
+    monkeypatch.setenv(variable, "http://proxy.test:3128")
+    client = fresh_sync_client()
+    # The proxy from the environment is mounted instead of the DNS-caching transport
+    assert any(transport is not None for transport in client._mounts.values())
+    assert not isinstance(client._transport._pool._network_backend, http_client._CachingSyncBackend)
+
+
+def test_dns_caching_transport_without_a_proxy(fresh_sync_client):
+    client = fresh_sync_client()
+    assert not client._mounts
+    assert isinstance(client._transport._pool._network_backend, http_client._CachingSyncBackend)
@@ -0,0 +1,74 @@
+import asyncio
+
+import orjson as json
+import pytest
+
+from api import index
+from api.metrics import ABANDONED_SEARCHES, TOKENS_SAVED
+
+
+@pytest.fixture
+def recent(monkeypatch):
+    """Two completed answers: 1000 and 2000 context tokens, 300 and 500 answer tokens."""
+    monkeypatch.setattr(index, "_recent_tokens", {"in": [1000, 2000], "out": [300, 500]})
+    monkeypatch.setattr(index, "count_tokens", lambda pieces, model=None: [len("".join(pieces).split())])
+
+
+def counted(counter, **labels):
+    return counter._values.get(tuple(sorted(labels.items())), 0)
+
+
+def progress(stage, context_tokens=0, answer=None):
+    return {"stage": stage, "context_tokens": context_tokens, "answer": answer}
+
+
+def test_abandoned_before_the_answer_saves_the_expected_answer(recent):
+    before = counted(ABANDONED_SEARCHES, stage="scrape")
+    assert index.record_abandoned(progress("scrape")) == {"tokens_saved_in": 1500, "tokens_saved_out": 400}
+    # Once the context is built, its actual size is what the answer request would have sent
+    assert index.record_abandoned(progress("context", context_tokens=1200)) == {"tokens_saved_in": 1200,
+                                                                                "tokens_saved_out": 400}
+    assert counted(ABANDONED_SEARCHES, stage="scrape") == before + 1
+
+
+def test_abandoned_during_the_answer_saves_the_rest(recent):
+    saved_out = counted(TOKENS_SAVED, direction="out")
+    answer = ["word " * 100, "word " * 50]
+    assert index.record_abandoned(progress("answer", answer=answer)) == {"tokens_saved_in": 0, "tokens_saved_out": 250}
+    assert counted(TOKENS_SAVED, direction="out") == saved_out + 250
+    # A long answer never saves a negative amount
+    assert index.record_abandoned(progress("answer", answer=["word " * 900])) == {"tokens_saved_in": 0,
+                                                                                   "tokens_saved_out": 0}
+
+
+def test_nothing_is_estimated_without_completed_answers(monkeypatch):
+    monkeypatch.setattr(index, "_recent_tokens", {"in": [], "out": []})
+    assert index.record_abandoned(progress("search")) == {"tokens_saved_in": 0, "tokens_saved_out": 0}
+    assert index.record_abandoned(progress("follow_ups")) == {"tokens_saved_in": 0, "tokens_saved_out": 0}
+
+
+def read_events(response):
+    async def body():
+        return [frame async for frame in response.body_iterator]
+
+    frames = b"".join(asyncio.run(body())).decode().split("\n\n")
+    return [json.loads(line[len("data:"):]) for frame in frames for line in frame.split("\n")
+            if line.startswith("data:") and line != "data: null"]
+
+
+def test_cached_answer_is_replayed_in_chunks(monkeypatch):
+    from api.answer_cache import answer_cache
+
+    chunks = [f"token{i} " for i in range(400)]
+    cached = {"sources": {"organic": []}, "answer": chunks, "relevant": {"followUp": ["next?"]}}
+    monkeypatch.setattr(index, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(answer_cache, "embed", lambda query: [1.0])
+    monkeypatch.setattr(answer_cache, "get", lambda vector, query, partition: cached)
+
+    events = read_events(index.ask("cached question", "2026-10-17", "us", last_event_id=None))
+    answer = [payload["text"] for payload in events if payload["type"] == "llm"]
+    assert "".join(answer) == "".join(chunks)
+    # The first chunk on its own, then batches of about SSE_FLUSH_CHARS
+    assert answer[0] == chunks[0] and 2 < len(answer) < len(chunks)
+    assert [payload["type"] for payload in events if payload["type"] != "llm"] == [
+        "sources", "relevant", "timings", "finished"]
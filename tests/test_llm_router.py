@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+
+from api import llm_router
+from api.llm_backends import LLMBackend
+from api.llm_router import LLMRouter
+
+
+class FakeBackend(LLMBackend):
+    """Answers with its name after `ttft` seconds, or fails after it."""
+
+    def __init__(self, name, ttft, fails=False):
+        super().__init__(model=name)
+        self.name = name
+        self.ttft = ttft
+        self.fails = fails
+        self.calls = 0
+
+    async def complete(self, messages, max_tokens, temperature, response_format=None):
+        self.calls += 1
+        await asyncio.sleep(self.ttft)
+        if self.fails:
+            raise RuntimeError(f"{self.name} is down")
+        return self.name
+
+    async def stream(self, messages, max_tokens, temperature):
+        yield await self.complete(messages, max_tokens, temperature)
+
+
+@pytest.fixture(autouse=True)
+def fast_ranking(monkeypatch):
+    # Rank by measured TTFT from the first sample, and hedge after 0.1s
+    monkeypatch.setattr(llm_router, "LLM_TTFT_MIN_SAMPLES", 1)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DELAY", 0.1)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY", 0.1)
+
+
+def complete(router):
+    return router.complete([{"role": "user", "content": "q"}], max_tokens=10, temperature=0)
+
+
+def test_cancelled_hedge_does_not_record_a_fast_ttft(monkeypatch):
+    first, second = FakeBackend("first", 0.2), FakeBackend("second", 0.2)
+    router = LLMRouter([first, second])
+    # Hedge every call after 0.1s: the hedge is cancelled 0.1s after it started
+    monkeypatch.setattr(router, "hedge_delay", lambda backend: 0.1)
+
+    async def scenario():
+        return [(router.ranked()[0].name, await complete(router)) for _ in range(4)]
+
+    # Identical backends keep their order instead of flipping after every hedge
+    assert asyncio.run(scenario()) == [("first", "first")] * 4
+    assert second.calls == 4
+    for name in ("first", "second"):
+        assert min(router._ttft[name]) >= 0.19
+
+
+def test_hedge_answers_from_the_faster_backend():
+    slow, fast = FakeBackend("slow", 1.0), FakeBackend("fast", 0.05)
+    router = LLMRouter([slow, fast])
+
+    async def scenario():
+        started = time.perf_counter()
+        return await complete(router), time.perf_counter() - started
+
+    answer, elapsed = asyncio.run(scenario())
+    assert answer == "fast"
+    # Hedged after 0.1s, answered 0.05s later
+    assert 0.14 <= elapsed < 0.5
+    # The slow backend had not answered after the winner's 0.15s
+    assert list(router._ttft["slow"]) == [pytest.approx(0.15, abs=0.05)]
+    assert router.ranked() == [fast, slow]
+
+
+def test_failing_backend_is_demoted_without_a_ttft_sample():
+    broken, healthy = FakeBackend("broken", 0.01, fails=True), FakeBackend("healthy", 0.05)
+    router = LLMRouter([broken, healthy])
+
+    assert asyncio.run(complete(router)) == "healthy"
+    assert list(router._ttft["broken"]) == []
+    assert router.ranked() == [healthy, broken]
+    # The next call goes straight to the healthy backend
+    assert asyncio.run(complete(router)) == "healthy"
+    assert broken.calls == 1
+
+
+def test_all_backends_failing_raises():
+    router = LLMRouter([FakeBackend("a", 0.01, fails=True), FakeBackend("b", 0.01, fails=True)])
+    with pytest.raises(RuntimeError, match="All LLM backends failed"):
+        asyncio.run(complete(router))
+    assert list(router._ttft["a"]) == list(router._ttft["b"]) == []
+
+
+def test_caller_cancellation_records_nothing():
+    first, second = FakeBackend("first", 1.0), FakeBackend("second", 1.0)
+    router = LLMRouter([first, second])
+
+    async def scenario():
+        task = asyncio.create_task(complete(router))
+        # Cancelled after the hedge was sent
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert second.calls == 1
+    assert list(router._ttft["first"]) == list(router._ttft["second"]) == []
+
+
+def test_backends_must_implement_stream_and_complete():
+    class CompleteOnly(LLMBackend):
+        async def complete(self, messages, max_tokens, temperature, response_format=None):
+            return ""
+
+    with pytest.raises(TypeError):
+        CompleteOnly(model="m")
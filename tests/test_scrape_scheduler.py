@@ -0,0 +1,41 @@
+import pytest
+
+from api import scrape_scheduler
+from api.scrape_scheduler import plan_scrape, record_scrape
+
+
+@pytest.fixture(autouse=True)
+def fresh_history(monkeypatch):
+    monkeypatch.setattr(scrape_scheduler, "_domain_stats", type(scrape_scheduler._domain_stats)())
+
+
+def results(*domains):
+    return {"organic": [{"link": f"https://{domain}/page", "title": "solar panels",
+                         "snippet": "how solar panels work"} for domain in domains]}
+
+
+def test_timing_out_domain_is_skipped():
+    for _ in range(2):
+        # Censored at the page timeout
+        record_scrape("https://slow.test/a", False, 4.0)
+    assert plan_scrape("solar panels", results("slow.test", "fast.test"), 4) == [1]
+
+
+def test_slow_but_successful_domain_is_skipped():
+    for _ in range(3):
+        record_scrape("https://slow.test/a", True, 3.0)
+    assert plan_scrape("solar panels", results("slow.test", "fast.test"), 4) == [1]
+
+
+def test_faster_domain_is_preferred():
+    for _ in range(5):
+        record_scrape("https://slower.test/a", True, 1.5)
+        record_scrape("https://faster.test/a", True, 0.3)
+    assert plan_scrape("solar panels", results("slower.test", "faster.test"), 1) == [1]
+
+
+def test_skipped_domain_is_retried_eventually():
+    for _ in range(2):
+        record_scrape("https://slow.test/a", False, 4.0)
+    plans = [plan_scrape("solar panels", results("slow.test"), 4) for _ in range(10)]
+    assert plans[0] == [] and plans[-1] == [0]
@@ -0,0 +1,49 @@
+import pytest
+
+from api.semantic_chunking import DEFAULT_SEPARATORS, _split_span, get_chunking, split_text
+
+PARAGRAPHS = ("The quick brown fox jumps over the lazy dog. It was not amused.\n\n"
+              "A second paragraph follows here, short.\nWith a line break.")
+SENTENCES = " ".join(f"Sentence number {i} talks about item {i * 7 % 13}." for i in range(60)).replace(
+    "number 20 ", "number 20\n\n")
+
+# Expected chunks are the output of LangChain's RecursiveCharacterTextSplitter(chunk_size,
+# chunk_overlap) for the same input, which the native splitter reproduces
+CASES = [
+    (PARAGRAPHS, 40, 10, ["The quick brown fox jumps over the lazy", "the lazy dog. It was not amused.",
+                          "A second paragraph follows here, short.", "With a line break."]),
+    # No separator fits: split between characters
+    ("Supercalifragilisticexpialidocious-and-then-some-more-letters here", 20, 5,
+     ["Supercalifragilistic", "isticexpialidocious-", "ious-and-then-some-m", "ome-more-letters", "here"]),
+    # A separator at the start produces no empty piece
+    ("\n\nLeading breaks then words that wrap around the limit a few times over", 25, 8,
+     ["Leading breaks then", "then words that wrap", "wrap around the limit a", "limit a few times over"]),
+    ("one two three four five six seven eight nine ten eleven twelve", 15, 0,
+     ["one two three", "four five six", "seven eight", "nine ten", "eleven twelve"]),
+]
+
+
+@pytest.mark.parametrize("text, chunk_size, chunk_overlap, expected", CASES)
+def test_matches_recursive_character_text_splitter(text, chunk_size, chunk_overlap, expected):
+    assert split_text(text, chunk_size, chunk_overlap, sentence_aware=False) == expected
+
+
+def test_spans_over_the_input():
+    spans = []
+    _split_span(PARAGRAPHS, 0, len(PARAGRAPHS), DEFAULT_SEPARATORS, 40, 10, spans)
+    # The third span is the paragraph break alone, which strips to nothing and is dropped
+    assert spans == [(0, 39), (30, 63), (63, 64), (64, 104), (104, 123)]
+
+
+def test_default_chunk_size_and_overlap():
+    spans = []
+    _split_span(SENTENCES, 0, len(SENTENCES), DEFAULT_SEPARATORS, 500, 50, spans)
+    assert spans == [(0, 499), (451, 791), (791, 792), (792, 1292), (1244, 1740), (1692, 2186), (2139, 2343)]
+    chunks = get_chunking(SENTENCES)
+    assert [len(chunk) for chunk in chunks] == [499, 339, 499, 495, 493, 203]
+    assert chunks[1].startswith("item 12. Sentence number 12") and chunks[1].endswith("Sentence number 20")
+
+
+def test_short_and_empty_text_are_not_split():
+    assert get_chunking("Short text.") == ["Short text."]
+    assert get_chunking("") == []
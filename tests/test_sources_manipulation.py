@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from api import extract_content_from_website, sources_manipulation
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sources_manipulation, "record_scrape",
+                        lambda url, success, latency: calls.append((url, success, round(latency, 1))))
+    return calls
+
+
+def fake_pages(monkeypatch, delays, cached=()):
+    downloads = []
+
+    async def extract(link):
+        if link in cached:
+            return "text of " + link, False
+        downloads.append(link)
+        await asyncio.sleep(delays[link])
+        return "text of " + link, True
+
+    monkeypatch.setattr(extract_content_from_website, "_aextract_website_content", extract)
+    return downloads
+
+
+def test_caller_cancellation_is_not_a_failure(monkeypatch, recorded):
+    fake_pages(monkeypatch, {"http://fast.test/": 0.05, "http://slow.test/": 5})
+
+    async def scenario():
+        sources = [{"link": "http://fast.test/"}, {"link": "http://slow.test/"}]
+        task = asyncio.create_task(sources_manipulation.apopulate_sources(sources, 2))
+        # e.g. every client disconnected
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert recorded == [("http://fast.test/", True, 0.1)]
+
+
+@pytest.mark.parametrize("page_timeout, total_timeout, latency", [(0.2, 1.0, 0.2), (1.0, 0.3, 0.3)])
+def test_deadlines_are_failures(monkeypatch, recorded, page_timeout, total_timeout, latency):
+    monkeypatch.setattr(sources_manipulation, "SCRAPE_PAGE_TIMEOUT", page_timeout)
+    monkeypatch.setattr(sources_manipulation, "SCRAPE_TOTAL_TIMEOUT", total_timeout)
+    fake_pages(monkeypatch, {"http://slow.test/": 5, "http://fast.test/": 0.05})
+
+    async def scenario():
+        return await sources_manipulation.apopulate_sources([{"link": "http://slow.test/"},
+                                                             {"link": "http://fast.test/"}], 2)
+
+    sources = asyncio.run(scenario())
+    assert "html" not in sources[0] and sources[1]["html"] == "text of http://fast.test/"
+    assert recorded == [("http://fast.test/", True, 0.1), ("http://slow.test/", False, latency)]
+
+
+def test_waiting_for_a_host_slot_is_not_latency(monkeypatch, recorded):
+    monkeypatch.setattr(sources_manipulation, "SCRAPE_PER_HOST_LIMIT", 1)
+    links = [f"http://one.test/{i}" for i in range(3)]
+    fake_pages(monkeypatch, {link: 0.1 for link in links})
+
+    async def scenario():
+        return await sources_manipulation.apopulate_sources([{"link": link} for link in links], 3)
+
+    sources = asyncio.run(scenario())
+    assert [source["html"] for source in sources] == ["text of " + link for link in links]
+    # Fetched one after the other, each taking 0.1s
+    assert [latency for _, _, latency in recorded] == [0.1, 0.1, 0.1]
+
+
+def test_page_cache_hits_are_not_recorded(monkeypatch, recorded):
+    fake_pages(monkeypatch, {"http://fetched.test/": 0.05}, cached={"http://cached.test/"})
+
+    async def scenario():
+        return await sources_manipulation.apopulate_sources([{"link": "http://cached.test/"},
+                                                             {"link": "http://fetched.test/"}], 2)
+
+    sources = asyncio.run(scenario())
+    assert sources[0]["html"] == "text of http://cached.test/"
+    assert recorded == [("http://fetched.test/", True, 0.1)]
+
+
+@pytest.mark.parametrize("page_timeout", [1.0, 0.05])
+def test_joined_downloads_are_recorded_once(monkeypatch, recorded, page_timeout):
+    monkeypatch.setattr(sources_manipulation, "SCRAPE_PAGE_TIMEOUT", page_timeout)
+    downloads = fake_pages(monkeypatch, {"http://shared.test/": 0.1})
+
+    async def scenario():
+        # Two searches with the same result
+        return await asyncio.gather(*(sources_manipulation.apopulate_sources([{"link": "http://shared.test/"}], 1)
+                                      for _ in range(2)))
+
+    asyncio.run(scenario())
+    assert downloads == ["http://shared.test/"]
+    assert recorded == [("http://shared.test/", page_timeout > 0.1, round(min(page_timeout, 0.1), 1))]
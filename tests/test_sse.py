@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import orjson as json
+import pytest
+
+from api.sse import batch_deltas, event, text_event
+
+
+async def deltas(items, delay=0.0, error=None):
+    """Yields `items` `delay` seconds apart, then raises `error` if given."""
+    for i, item in enumerate(items):
+        if i and delay:
+            await asyncio.sleep(delay)
+        yield item
+    if error is not None:
+        raise error
+
+
+async def collect(chunks):
+    """(seconds since start, chunk) of every chunk."""
+    started = time.perf_counter()
+    return [(time.perf_counter() - started, chunk) async for chunk in chunks]
+
+
+def test_framing():
+    assert event({"type": "sources", "data": [1]}) == b'data:{"type":"sources","data":[1]}\n\n'
+    frame = text_event("llm", 'say "hi"\n')
+    assert frame.startswith(b"data:") and frame.endswith(b"\n\n")
+    assert json.loads(frame[5:]) == {"type": "llm", "text": 'say "hi"\n'}
+
+
+def test_first_delta_is_sent_at_once_and_the_rest_within_the_window():
+    chunks = asyncio.run(collect(batch_deltas(deltas(["a", "b", "c", "d"], delay=0.01), window=0.2)))
+    assert [chunk for _, chunk in chunks] == ["a", "bcd"]
+    assert chunks[0][0] < 0.05
+    # Flushed when the stream ended, not after the whole window
+    assert chunks[1][0] < 0.15
+
+
+def test_time_window_flushes():
+    # A delta every 0.03s, flushed every 0.1s
+    chunks = asyncio.run(collect(batch_deltas(deltas([str(i) for i in range(12)], delay=0.03), window=0.1)))
+    texts = [chunk for _, chunk in chunks]
+    assert "".join(texts) == "".join(str(i) for i in range(12))
+    assert texts[0] == "0"
+    assert 3 <= len(texts) <= 7
+    assert all(len(text) <= 5 * 2 for text in texts)
+
+
+def test_size_limit_flushes_before_the_window():
+    chunks = asyncio.run(collect(batch_deltas(deltas(["x" * 10] * 9, delay=0.01), window=5, max_chars=30)))
+    texts = [chunk for _, chunk in chunks]
+    # The last 20 characters are sent when the stream ends, long before the window
+    assert texts == ["x" * 10, "x" * 30, "x" * 30, "x" * 20]
+    assert chunks[-1][0] < 1
+
+
+def test_end_of_stream_flushes_what_is_buffered():
+    chunks = asyncio.run(collect(batch_deltas(deltas(["a", "b", "c"]), window=5)))
+    # Deltas already received when the first is sent go out with it
+    assert "".join(chunk for _, chunk in chunks) == "abc"
+    assert chunks[-1][0] < 1
+
+
+def test_producer_errors_are_raised_after_the_buffered_text():
+    received = []
+
+    async def scenario():
+        async for chunk in batch_deltas(deltas(["a", "b", "c"], delay=0.01, error=ValueError("model failed")),
+                                        window=0.2):
+            received.append(chunk)
+
+    with pytest.raises(ValueError, match="model failed"):
+        asyncio.run(scenario())
+    assert "".join(received) == "abc"
+
+
+def test_zero_window_passes_deltas_through():
+    texts = [chunk for _, chunk in asyncio.run(collect(batch_deltas(deltas(["a", "b", "c"]), window=0)))]
+    assert texts == ["a", "b", "c"]
+
+
+def test_closing_early_stops_reading_the_model():
+    state = {"closed": False}
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "x"
+        finally:
+            state["closed"] = True
+
+    async def scenario():
+        stream = batch_deltas(endless(), window=0.05)
+        assert await stream.__anext__() == "x"
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert state["closed"]
@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from api import stream_coalescer
+from api.stream_coalescer import coalesce
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(stream_coalescer, "_in_flight", {})
+    monkeypatch.setattr(stream_coalescer, "_resumable", stream_coalescer.OrderedDict())
+
+
+class Pipeline:
+    """A producer of `count` events, one every `interval` seconds, that records its runs and cancellation."""
+
+    def __init__(self, count=5, interval=0.01):
+        self.count = count
+        self.interval = interval
+        self.runs = 0
+        self.cancelled = False
+
+    async def generate(self):
+        self.runs += 1
+        try:
+            for i in range(self.count):
+                await asyncio.sleep(self.interval)
+                yield b"data:%d\n\n" % i
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def parse(frame):
+    """(event id, data) of a frame sent by `coalesce`."""
+    id_line, data_line = frame.decode().split("\n")[:2]
+    return id_line[len("id: "):], data_line[len("data:"):]
+
+
+async def read(stream, limit=None):
+    frames = []
+    async for frame in stream:
+        frames.append(parse(frame))
+        if limit is not None and len(frames) == limit:
+            await stream.aclose()
+            break
+    return frames
+
+
+def test_resume_mid_stream_sends_only_missed_events():
+    pipeline = Pipeline(count=6)
+
+    async def scenario():
+        first = await read(coalesce("k", pipeline.generate), limit=2)
+        resumed = await read(coalesce("k", pipeline.generate, last_event_id=first[-1][0]))
+        return first, resumed
+
+    first, resumed = asyncio.run(scenario())
+    assert [data for _, data in first + resumed] == [str(i) for i in range(6)]
+    token = first[0][0].split(":")[0]
+    assert [event_id for event_id, _ in first + resumed] == [f"{token}:{i}" for i in range(6)]
+    assert pipeline.runs == 1
+
+
+def test_resume_after_the_stream_finished():
+    pipeline = Pipeline(count=3)
+
+    async def scenario():
+        events = await read(coalesce("k", pipeline.generate))
+        return events, await read(coalesce("k", pipeline.generate, last_event_id=events[0][0]))
+
+    events, resumed = asyncio.run(scenario())
+    assert resumed == events[1:]
+    assert pipeline.runs == 1
+
+
+@pytest.mark.parametrize("last_event_id", ["unknown:1", "{token}:x", "{token}", " "])
+def test_unknown_or_malformed_ids_start_over(last_event_id):
+    pipeline = Pipeline(count=3)
+
+    async def scenario():
+        events = await read(coalesce("k", pipeline.generate))
+        token = events[0][0].split(":")[0]
+        return events, await read(coalesce("k", pipeline.generate, last_event_id=last_event_id.format(token=token)))
+
+    events, again = asyncio.run(scenario())
+    assert [data for _, data in again] == ["0", "1", "2"]
+    assert again[0][0].split(":")[0] != events[0][0].split(":")[0]
+    assert pipeline.runs == 2
+
+
+def test_ids_of_another_search_start_over():
+    pipeline = Pipeline(count=2)
+
+    async def scenario():
+        events = await read(coalesce("k", pipeline.generate))
+        return await read(coalesce("other", pipeline.generate, last_event_id=events[0][0]))
+
+    assert [data for _, data in asyncio.run(scenario())] == ["0", "1"]
+    assert pipeline.runs == 2
+
+
+def test_expired_streams_start_over(monkeypatch):
+    monkeypatch.setattr(stream_coalescer, "SSE_RESUME_GRACE", 0.05)
+    pipeline = Pipeline(count=2)
+
+    async def scenario():
+        events = await read(coalesce("k", pipeline.generate))
+        await asyncio.sleep(0.1)
+        return await read(coalesce("k", pipeline.generate, last_event_id=events[0][0]))
+
+    assert [data for _, data in asyncio.run(scenario())] == ["0", "1"]
+    assert pipeline.runs == 2
+    assert len(stream_coalescer._resumable) == 1
+
+
+def test_producer_is_cancelled_only_after_the_last_subscriber_and_the_grace(monkeypatch):
+    monkeypatch.setattr(stream_coalescer, "SSE_DISCONNECT_GRACE", 0.2)
+    pipeline = Pipeline(count=200, interval=0.01)
+
+    async def scenario():
+        first = coalesce("k", pipeline.generate)
+        second = coalesce("k", pipeline.generate)
+        await first.__anext__()
+        await second.__anext__()
+        stream = stream_coalescer._in_flight["k"]
+        await first.aclose()
+        # The other subscriber keeps the pipeline alive past the grace period
+        await asyncio.sleep(0.3)
+        assert not pipeline.cancelled and stream.subscribers == 1
+        await second.aclose()
+        # Nobody left: the pipeline runs on for the grace period, then is cancelled
+        await asyncio.sleep(0.1)
+        assert not pipeline.cancelled and stream.subscribers == 0
+        await asyncio.sleep(0.2)
+        assert pipeline.cancelled and stream.cancelled
+        assert "k" not in stream_coalescer._in_flight
+        # A cancelled run is neither joined nor resumed
+        events = await read(coalesce("k", pipeline.generate, last_event_id=f"{stream.token}:0"), limit=1)
+        assert events[0][1] == "0"
+
+    asyncio.run(scenario())
+    assert pipeline.runs == 2
+
+
+def test_reconnecting_within_the_grace_keeps_the_producer(monkeypatch):
+    monkeypatch.setattr(stream_coalescer, "SSE_DISCONNECT_GRACE", 0.1)
+    pipeline = Pipeline(count=30, interval=0.01)
+
+    async def scenario():
+        first = await read(coalesce("k", pipeline.generate), limit=2)
+        await asyncio.sleep(0.05)
+        rest = await read(coalesce("k", pipeline.generate, last_event_id=first[-1][0]))
+        return first + rest
+
+    events = asyncio.run(scenario())
+    assert [data for _, data in events] == [str(i) for i in range(30)]
+    assert not pipeline.cancelled and pipeline.runs == 1
+
+
+def test_finished_streams_are_not_cancelled(monkeypatch):
+    monkeypatch.setattr(stream_coalescer, "SSE_DISCONNECT_GRACE", 0.01)
+    pipeline = Pipeline(count=2)
+
+    async def scenario():
+        await read(coalesce("k", pipeline.generate))
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert not pipeline.cancelled